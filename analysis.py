@@ -0,0 +1,2765 @@
+"""Ανάλυση σεναρίων κατανομής μαθητών — χωρίς Streamlit.
+
+Χρησιμοποιείται από το `app.py` (UI) και το `batch.py` (headless/CLI): κανονικοποίηση στηλών,
+σπασμένες αμοιβαίες φιλίες, συγκρούσεις στην ίδια τάξη, στατιστικά ανά τμήμα και αναφορές Excel.
+"""
+import numpy as np
+import pandas as pd
+from io import BytesIO
+from dataclasses import dataclass, field
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from functools import cached_property, lru_cache, partial, wraps
+from itertools import chain
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing as mp
+import os, re, ast, random, secrets, shutil, sys, threading, unicodedata, hashlib, importlib.util, tempfile, weakref, zipfile
+from datetime import date, datetime
+import xlsxwriter
+import contextvars, json, time, tracemalloc
+from collections import deque
+from contextlib import closing, contextmanager, nullcontext
+
+# ---------------------------
+# Profiling (opt-in: SIMPLE100_PROFILE=1 ή toggle στο sidebar)
+# ---------------------------
+
+DEFAULT_PROFILE = os.environ.get("SIMPLE100_PROFILE", "0") == "1"
+_PROFILER = contextvars.ContextVar("simple100_profiler", default=None)
+
+# Το tracemalloc είναι ένα για όλη τη διεργασία (όλες τις συνεδρίες): ξεκινά με τον πρώτο κάτοχο και σταματά
+# όταν φύγει ο τελευταίος· το peak μετριέται ακριβώς μόνο όταν δεν τρέχει στάδιο σε άλλο thread.
+_TRACING_LOCK = threading.RLock()
+_TRACING = {"owners": {}, "started": False, "threads": Counter(), "epoch": 0}
+
+
+class TracingOwner:
+    """Κάτοχος του tracemalloc για `use_profiler` (π.χ. ένας ανά συνεδρία)· όταν χαθεί, αποδεσμεύεται."""
+    __slots__ = ("__weakref__",)
+
+
+def _acquire_tracing(owner) -> None:
+    with _TRACING_LOCK:
+        owners = _TRACING["owners"]
+        if id(owner) in owners:
+            return
+        if not owners and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACING["started"] = True
+        owners[id(owner)] = weakref.finalize(owner, _release_tracing_key, id(owner))
+
+
+def _release_tracing_key(key: int) -> None:
+    with _TRACING_LOCK:
+        if _TRACING["owners"].pop(key, None) is None:
+            return
+        if not _TRACING["owners"] and _TRACING["started"]:
+            tracemalloc.stop()
+            _TRACING["started"] = False
+
+
+def _release_tracing(owner) -> None:
+    finalizer = _TRACING["owners"].get(id(owner))
+    if finalizer is not None:
+        finalizer()  # → _release_tracing_key (μία φορά)
+
+
+def _enter_peak_scope() -> tuple:
+    """(μόνο αυτό το thread μετρά;, epoch). Το `reset_peak` είναι κοινό: γίνεται μόνο όταν δεν μετρά άλλο thread."""
+    me = threading.get_ident()
+    with _TRACING_LOCK:
+        threads = _TRACING["threads"]
+        alone = all(t == me for t in threads)
+        if not alone:
+            _TRACING["epoch"] += 1  # όσοι μετρούν ήδη χάνουν το ακριβές peak
+        threads[me] += 1
+        return alone, _TRACING["epoch"]
+
+
+def _exit_peak_scope(epoch: int) -> bool:
+    """True όταν κανένα άλλο thread δεν μπήκε σε στάδιο στο μεταξύ (το peak ισχύει)."""
+    me = threading.get_ident()
+    with _TRACING_LOCK:
+        threads = _TRACING["threads"]
+        threads[me] -= 1
+        if threads[me] <= 0:
+            del threads[me]
+        return _TRACING["epoch"] == epoch
+
+
+class Profiler:
+    """Χρόνος και μνήμη ανά στάδιο (και sheet): ένα record ανά εκτέλεση σταδίου.
+
+    `seconds` = συνολικός χρόνος (μαζί με τα εμφωλευμένα στάδια), `self_seconds` = χωρίς αυτά,
+    `alloc_mb` = καθαρή μεταβολή δεσμευμένης μνήμης, `peak_mb` = μέγιστο πάνω από την αρχή του σταδίου
+    (tracemalloc — μόνο όταν είναι ενεργό· όταν τρέχουν ταυτόχρονα στάδια σε άλλα threads/συνεδρίες, μόνο η
+    μεταβολή αρχή→τέλος). Ενεργοποιείται ανά thread/session με `use_profiler`.
+    """
+
+    def __init__(self, max_records: int = 5000):
+        self.records = deque(maxlen=max_records)
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str, sheet=None):
+        frames = self._local.__dict__.setdefault("frames", [])
+        tracing = tracemalloc.is_tracing()
+        alone, epoch = _enter_peak_scope()
+        cur0, peak0 = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        if frames:
+            frames[-1]["peak"] = max(frames[-1]["peak"], peak0 if alone else cur0)
+        if tracing and alone:
+            tracemalloc.reset_peak()
+        frame = {"peak": cur0, "children": 0.0}
+        frames.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            frames.pop()
+            exact = _exit_peak_scope(epoch) and alone
+            cur1, peak1 = tracemalloc.get_traced_memory() if tracing else (0, 0)
+            if not exact:
+                peak1 = cur1
+            peak = max(frame["peak"], peak1)
+            if frames:
+                frames[-1]["children"] += seconds
+                frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+            self.records.append({
+                "stage": name, "sheet": None if sheet is None else str(sheet),
+                "seconds": round(seconds, 6), "self_seconds": round(seconds - frame["children"], 6),
+                "alloc_mb": round((cur1 - cur0) / 2**20, 3), "peak_mb": round(max(0, peak - cur0) / 2**20, 3),
+            })
+
+    def table(self) -> pd.DataFrame:
+        return pd.DataFrame(list(self.records), columns=["stage", "sheet", "seconds", "self_seconds", "alloc_mb", "peak_mb"])
+
+    def summary(self) -> pd.DataFrame:
+        """Ανά στάδιο: κλήσεις, χρόνος (συνολικός/ίδιος), μέγιστη μνήμη — τα πιο «ακριβά» πρώτα."""
+        t = self.table()
+        return (t.groupby("stage").agg(calls=("stage", "size"), seconds=("seconds", "sum"),
+                                       self_seconds=("self_seconds", "sum"), peak_mb=("peak_mb", "max"))
+                .sort_values("self_seconds", ascending=False))
+
+    def by_sheet(self) -> pd.DataFrame:
+        """Πίνακας sheet × στάδιο με τον ίδιο χρόνο (self_seconds) — ποιο sheet/στάδιο κοστίζει."""
+        t = self.table().dropna(subset=["sheet"])
+        if t.empty:
+            return pd.DataFrame()
+        pivot = t.pivot_table(index="sheet", columns="stage", values="self_seconds", aggfunc="sum", fill_value=0.0)
+        pivot["ΣΥΝΟΛΟ"] = pivot.sum(axis=1)
+        return pivot.sort_values("ΣΥΝΟΛΟ", ascending=False)
+
+    def to_json(self) -> str:
+        return json.dumps({"records": list(self.records)}, ensure_ascii=False, indent=1)
+
+
+def use_profiler(profiler, owner=None) -> None:
+    """Ενεργός profiler για το τρέχον thread/context (None → απενεργοποίηση). Το tracemalloc κρατιέται για τον
+    `owner` (default: το τρέχον thread· η εφαρμογή δίνει έναν `TracingOwner` ανά συνεδρία) και σταματά μόνο όταν
+    δεν το χρειάζεται κανένας κάτοχος."""
+    owner = threading.current_thread() if owner is None else owner
+    _PROFILER.set(profiler)
+    if profiler is not None:
+        _acquire_tracing(owner)
+    else:
+        _release_tracing(owner)
+
+
+@contextmanager
+def profiling(profiler):
+    """`use_profiler` μόνο για το block (επαναφέρει τον προηγούμενο)."""
+    token = _PROFILER.set(profiler)
+    owner = TracingOwner()
+    if profiler is not None:
+        _acquire_tracing(owner)
+    try:
+        yield profiler
+    finally:
+        _release_tracing(owner)
+        _PROFILER.reset(token)
+
+
+def _stage(name: str, sheet=None):
+    profiler = _PROFILER.get()
+    return nullcontext() if profiler is None else profiler.stage(name, sheet)
+
+
+def _profiled(name: str, sheet_of=None):
+    """Decorator: η κλήση καταγράφεται ως στάδιο `name`· το sheet από `sheet_of(*args)` ή από `args[0].sheet`."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _PROFILER.get() is None:
+                return fn(*args, **kwargs)
+            sheet = sheet_of(*args, **kwargs) if sheet_of else getattr(args[0], "sheet", None) if args else None
+            with _stage(name, sheet):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ---------------------------
+# Canonicalization / Renaming
+# ---------------------------
+def _canon(s: str) -> str:
+    return "".join((s or "").replace("_"," ").split()).upper()
+
+CANON_TARGETS = {
+    "ΟΝΟΜΑ": {"ΟΝΟΜΑ"},
+    "ΦΥΛΟ": {"ΦΥΛΟ"},
+    "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": {"ΠΑΙΔΙΕΚΠΑΙΔΕΥΤΙΚΟΥ", "ΠΑΙΔΙ-ΕΚΠΑΙΔΕΥΤΙΚΟΥ"},
+    "ΖΩΗΡΟΣ": {"ΖΩΗΡΟΣ"},
+    "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": {"ΙΔΙΑΙΤΕΡΟΤΗΤΑ"},
+    "ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ": {"ΚΑΛΗΓΝΩΣΗΕΛΛΗΝΙΚΩΝ", "ΓΝΩΣΗΕΛΛΗΝΙΚΩΝ"},
+    "ΦΙΛΟΙ": {"ΦΙΛΟΙ", "ΦΙΛΙΑ", "ΦΙΛΟΣ"},
+    "ΣΥΓΚΡΟΥΣΗ": {"ΣΥΓΚΡΟΥΣΗ", "ΣΥΓΚΡΟΥΣΕΙΣ"},
+    "ΤΜΗΜΑ": {"ΤΜΗΜΑ"},
+}
+REQUIRED_COLS = ["ΟΝΟΜΑ","ΦΥΛΟ","ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ","ΖΩΗΡΟΣ","ΙΔΙΑΙΤΕΡΟΤΗΤΑ","ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ","ΦΙΛΟΙ","ΣΥΓΚΡΟΥΣΗ","ΤΜΗΜΑ"]
+
+_FRIEND_COLS = ("ΦΙΛΟΙ", "ΦΙΛΙΑ", "ΦΙΛΟΣ")
+_EMPTY_CELLS = ("-", "NA", "NAN")
+HEADER_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _header_plan(columns: tuple) -> tuple:
+    """(mapping, στήλες για συνένωση σε ΦΙΛΟΙ) για μια επικεφαλίδα — εξαρτάται μόνο από τους τίτλους, οπότε
+    sheets με ίδια επικεφαλίδα (σενάρια, reruns) το παίρνουν έτοιμο."""
+    mapping, seen = {}, set()
+    for col in columns:
+        c = _canon(col)
+        for target, keys in CANON_TARGETS.items():
+            if c in keys and target not in seen:
+                mapping[col] = target
+                seen.add(target)
+                break
+    candidates = ()
+    if not any(mapping.get(col, col) in _FRIEND_COLS for col in columns):
+        candidates = tuple(col for col in columns if "ΦΙΛ" in _canon(col) or "FRIEND" in _canon(col))
+    return mapping, candidates
+
+
+def _join_cells(df: pd.DataFrame) -> list:
+    """Τα μη κενά κελιά κάθε γραμμής (όχι «-»/NA) ενωμένα με ", " — μία πράξη ανά στήλη, όχι ανά γραμμή."""
+    combined = np.full(len(df), "", dtype=object)
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i].astype(str).str.strip()
+        keep = ((s != "") & ~s.str.upper().isin(_EMPTY_CELLS)).to_numpy()
+        joined = combined + np.where(combined != "", ", ", "").astype(object) + s.to_numpy(dtype=object)
+        combined = np.where(keep, joined, combined)
+    return combined.tolist()
+
+
+def _looks_like_class(s: pd.Series) -> bool:
+    """Μη κενές τιμές ως κείμενο: διάμεσο μήκος ≤ 4 και ≤ 10 διαφορετικές. Για κείμενο/αριθμούς ο έλεγχος
+    γίνεται στις μοναδικές τιμές (factorize) — ίδιο αποτέλεσμα με `dropna().astype(str).str.strip()`."""
+    if not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)
+            or (s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) == "string")):
+        s = s.dropna().astype(str).str.strip()
+        return bool(len(s)) and s.str.len().median() <= 4 and s.nunique() <= 10
+    codes, uniques = pd.factorize(s)
+    codes = codes[codes >= 0]
+    if not len(codes):
+        return False
+    text = pd.Series(uniques).astype(str).str.strip()
+    if text.nunique() > 10:
+        return False
+    return np.median(text.str.len().to_numpy()[codes]) <= 4
+
+
+def _class_column_fallback(df: pd.DataFrame):
+    """Η πρώτη από δεξιά στήλη που μοιάζει με τμήμα (None αν καμία)."""
+    return next((df.columns[i] for i in range(df.shape[1] - 1, -1, -1) if _looks_like_class(df.iloc[:, i])), None)
+
+
+def auto_rename_columns(df: pd.DataFrame):
+    """Map κοινές ελληνικές στήλες σε κανονική μορφή. Αν δεν βρεθούν, δημιουργούνται/συνενώνονται όπου χρειάζεται."""
+    mapping, friend_candidates = _header_plan(tuple(df.columns))
+    renamed = df.rename(columns=mapping)
+
+    # ΦΙΛΟΙ fallback
+    if friend_candidates:
+        renamed["ΦΙΛΟΙ"] = _join_cells(df[list(friend_candidates)])
+
+    # ΤΜΗΜΑ fallback: η πρώτη από δεξιά στήλη που μοιάζει με τμήμα
+    if "ΤΜΗΜΑ" not in renamed.columns:
+        best = _class_column_fallback(df)
+        if best:
+            renamed = renamed.rename(columns={best:"ΤΜΗΜΑ"})
+
+    # ΣΥΓΚΡΟΥΣΗ fallback
+    if "ΣΥΓΚΡΟΥΣΗ" not in renamed.columns:
+        if "ΣΥΓΚΡΟΥΣΕΙΣ" in renamed.columns:
+            renamed = renamed.rename(columns={"ΣΥΓΚΡΟΥΣΕΙΣ": "ΣΥΓΚΡΟΥΣΗ"})
+        else:
+            renamed["ΣΥΓΚΡΟΥΣΗ"] = ""
+    return renamed, dict(mapping)
+
+# ---------------------------
+# Name canonicalization helpers
+# ---------------------------
+
+def _strip_diacritics(s: str) -> str:
+    nfkd = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in nfkd if not unicodedata.combining(ch))
+
+_WS_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1 << 16)
+def _canon_name_str(s: str) -> str:
+    s = s.strip()
+    s = s.strip("[]'\" ")
+    s = _WS_RE.sub(" ", s)
+    s = _strip_diacritics(s).upper()
+    return s
+
+
+def _canon_name(s: str) -> str:
+    """Κανονική μορφή ονόματος (χωρίς τόνους, κεφαλαία, ενιαία κενά) — memoized ανά κείμενο."""
+    return _canon_name_str(str(s) if s is not None else "")
+
+_SPLIT_RE = re.compile(r"\s*(?:,|;|/|\||\band\b|\bκαι\b|\+|\n)\s*", flags=re.IGNORECASE)
+
+# ---------------------------
+# Friends / conflicts parsing
+# ---------------------------
+
+def _parse_names(cell):
+    """Ένα κελί ΦΙΛΟΙ/ΣΥΓΚΡΟΥΣΗ → λίστα κανονικών ονομάτων (αργός δρόμος του `parse_name_column`)."""
+    raw = str(cell) if cell is not None else ""
+    raw = raw.strip()
+    if not raw:
+        return []
+    if raw.startswith("[") and raw.endswith("]"):
+        try:
+            val = ast.literal_eval(raw)
+            if isinstance(val, (list, tuple)):
+                return [_canon_name(x) for x in val if str(x).strip()]
+        except Exception:
+            pass
+        raw2 = raw.strip("[]")
+        parts = [_canon_name(p) for p in re.split(r"[;,]", raw2)]
+        return [p for p in parts if p]
+    parts = [_canon_name(p) for p in _SPLIT_RE.split(raw) if p]
+    return [p for p in parts if p]
+
+
+# Λίστα μόνο από απλά quoted strings (π.χ. "['Α', \"Β\"]") — ό,τι θα έδινε το `ast.literal_eval`, χωρίς eval.
+_QUOTED_ITEM = r"'[^'\\\n]*'|" + r'"[^"\\\n]*"'
+_QUOTED_LIST_RE = re.compile(rf"\[\s*(?:(?:{_QUOTED_ITEM})\s*(?:,\s*(?:{_QUOTED_ITEM})\s*)*,?\s*)?\]")
+# Λίστα χωρίς εισαγωγικά που το `ast.literal_eval` σίγουρα απορρίπτει (όχι αριθμοί, True/False/None, ..., φωλιές).
+_BARE_LIST_RE = re.compile(r"\[[^'\"\d\[\](){}]*\]")
+_LITERAL_WORD_RE = re.compile(r"\b(?:True|False|None)\b|\.\.\.")
+
+# Τα κελιά κάθε είδους συνενώνονται με `_ROW_SEP` και κόβονται με ένα regex pass· η ομάδα 1 σημαδεύει αλλαγή γραμμής.
+# Το lookahead δεν αλλάζει τα matches του `_SPLIT_RE` (κάθε match αρχίζει με κενό ή διαχωριστικό) — απλώς
+# απορρίπτει γρήγορα τις υπόλοιπες θέσεις.
+_ROW_SEP = "\x00"
+_FREE_TOKEN_RE = re.compile(rf"(?=[{_ROW_SEP}\s,;/|+\naκ])(?:({_ROW_SEP})|{_SPLIT_RE.pattern})", flags=re.IGNORECASE)
+_BARE_TOKEN_RE = re.compile(rf"({_ROW_SEP})|[;,]")
+_QUOTED_TOKEN_RE = re.compile(rf"({_ROW_SEP})|'([^'\\\n]*)'|" + r'"([^"\\\n]*)"')
+
+
+def _split_joined(rows: list, texts: list, token_re) -> tuple:
+    """(γραμμές, κομμάτια) για όλα τα `texts` μαζί, με ένα `token_re.split` πάνω στο συνενωμένο κείμενο."""
+    tokens = np.array(token_re.split(_ROW_SEP.join(texts)), dtype=object)
+    parts, seps = tokens[0::2], pd.notna(tokens[1::2])  # ομάδα 1: None εκτός από αλλαγή γραμμής
+    part_rows = np.asarray(rows, dtype=np.intp)[np.concatenate(([0], np.cumsum(seps)))]
+    keep = parts.astype(bool)
+    return part_rows[keep], parts[keep]
+
+
+def _quoted_items(rows: list, texts: list) -> tuple:
+    """(γραμμές, στοιχεία) από λίστες που ταιριάζουν στο `_QUOTED_LIST_RE` — ό,τι θα έδινε το `ast.literal_eval`."""
+    found = _QUOTED_TOKEN_RE.findall(_ROW_SEP.join(texts))
+    seps = np.fromiter((bool(sep) for sep, _, _ in found), bool, len(found))
+    item_rows = np.asarray(rows, dtype=np.intp)[np.cumsum(seps)]
+    items = np.array([single or double for _, single, double in found], dtype=object)
+    keep = ~seps & np.fromiter((bool(x.strip()) for x in items), bool, len(items))
+    return item_rows[keep], items[keep]
+
+
+def parse_name_column(values) -> pd.DataFrame:
+    """Ολόκληρη στήλη ΦΙΛΟΙ/ΣΥΓΚΡΟΥΣΗ → long πίνακας (row, name): θέση γραμμής + κανονικό όνομα, με τη σειρά δήλωσης.
+
+    Ίδιο αποτέλεσμα με `_parse_names` ανά κελί. Τα κελιά χωρίζονται σε είδη — ελεύθερο κείμενο, λίστες με
+    απλά quoted strings, λίστες χωρίς εισαγωγικά — και κάθε είδος κόβεται με ένα regex pass για όλη τη
+    στήλη (χωρίς `ast.literal_eval`)· μόνο ό,τι δεν ταιριάζει σε αυτά περνά από το `_parse_names`.
+    Η κανονικοποίηση γίνεται μία φορά ανά μοναδικό κομμάτι.
+    """
+    texts = ["" if c is None else str(c).strip() for c in values]
+    kinds = {"free": [], "quoted": [], "bare": [], "other": []}
+    for i, t in enumerate(texts):
+        if _ROW_SEP in t:  # δεν εμφανίζεται σε πραγματικά κελιά
+            kind = "other"
+        elif not (t.startswith("[") and t.endswith("]")):
+            kind = "free"
+        elif _QUOTED_LIST_RE.fullmatch(t):
+            kind = "quoted"
+        elif _BARE_LIST_RE.fullmatch(t) and not _LITERAL_WORD_RE.search(t):
+            kind = "bare"
+        else:
+            kind = "other"
+        kinds[kind].append(i)
+
+    pieces = []  # (γραμμές, κομμάτια, κράτα και κενά μετά την κανονικοποίηση)
+    if kinds["free"]:
+        pieces.append((*_split_joined(kinds["free"], [texts[i] for i in kinds["free"]], _FREE_TOKEN_RE), False))
+    if kinds["quoted"]:
+        pieces.append((*_quoted_items(kinds["quoted"], [texts[i] for i in kinds["quoted"]]), True))
+    if kinds["bare"]:
+        pieces.append((*_split_joined(kinds["bare"], [texts[i].strip("[]") for i in kinds["bare"]], _BARE_TOKEN_RE), False))
+    if kinds["other"]:
+        parsed = [(i, name) for i in kinds["other"] for name in _parse_names(texts[i])]
+        pieces.append((np.array([i for i, _ in parsed], dtype=np.intp), np.array([n for _, n in parsed], dtype=object), True))
+    if not pieces:
+        return pd.DataFrame({"row": np.empty(0, dtype=np.intp), "name": np.empty(0, dtype=object)})
+
+    rows = np.concatenate([r for r, _, _ in pieces])
+    parts = np.concatenate([p for _, p, _ in pieces])
+    canon = {p: _canon_name(p) for p in set(parts)}
+    names = np.array([canon[p] for p in parts], dtype=object)
+    keep = names.astype(bool) | np.concatenate([np.full(len(p), k) for _, p, k in pieces])
+    rows, names = rows[keep], names[keep]
+    order = np.argsort(rows, kind="stable")  # τα ονόματα κάθε γραμμής μένουν με τη σειρά δήλωσης
+    return pd.DataFrame({"row": rows[order], "name": names[order]})
+
+
+# ---------------------------
+# Name resolution index (ανά roster)
+# ---------------------------
+
+_MISSING = object()
+
+# Ανοχή ορθογραφικών λαθών (απόσταση Levenshtein ανά λέξη του ονόματος)· 0 → μόνο ακριβή/μοναδικά tokens.
+FUZZY_MAX_DISTANCE = int(os.environ.get("SIMPLE100_FUZZY_DISTANCE", "1") or 0)
+FUZZY_CHARS_PER_EDIT = 4  # λέξη μήκους L δέχεται έως min(FUZZY_MAX_DISTANCE, L // 4) διορθώσεις
+
+# Κατάσταση αντιστοίχισης μιας δήλωσης (βλ. `NameIndex.explain`).
+RESOLVED_EXACT, RESOLVED_TOKENS, RESOLVED_FUZZY = "exact", "tokens", "fuzzy"
+AMBIGUOUS, UNRESOLVED = "ambiguous", "unresolved"
+_EMPTY_MARKERS = frozenset({"", "-", "NA", "NAN", "NONE"})  # κενά κελιά όπως φτάνουν στις δηλώσεις
+RESOLUTION_LABELS = {
+    RESOLVED_FUZZY: "Διόρθωση (κοντινό όνομα)",
+    AMBIGUOUS: "Ασαφές (πολλοί υποψήφιοι)",
+    UNRESOLVED: "Χωρίς αντιστοίχιση",
+}
+
+
+def _bigrams(word: str) -> set:
+    """Διακριτά διγράμματα της λέξης με όρια (^…$)."""
+    padded = f"^{word}$"
+    return {padded[i:i+2] for i in range(len(padded) - 1)}
+
+
+def _levenshtein(a: str, b: str, limit: int) -> int:
+    """Απόσταση Levenshtein, ή `limit + 1` μόλις φανεί ότι την ξεπερνά."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        cur = [i]
+        for j, cb in enumerate(b, start=1):
+            cur.append(min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class NameIndex:
+    """Ευρετήριο ονομάτων ενός roster, χτισμένο μία φορά: σύνολο κανονικών ονομάτων + token postings.
+
+    Καλείται ως resolver: ελεύθερο κείμενο → κανονικό όνομα μαθητή (ακριβές ή μοναδικό match σε tokens)
+    ή None. Αν δεν βρεθεί και `max_distance > 0`, οι άγνωστες λέξεις διορθώνονται στην πλησιέστερη λέξη
+    του roster (μοναδική, σε απόσταση Levenshtein ≤ όριο) και η αντιστοίχιση ξαναγίνεται· οι υποψήφιες
+    λέξεις βγαίνουν από postings διγραμμάτων, όχι από σάρωση όλου του roster. Κάθε κείμενο λύνεται μία
+    φορά και μετά απαντάται από memo. Sheets με το ίδιο roster παίρνουν το ίδιο index μέσω `name_index_for`.
+    """
+
+    def __init__(self, canon_names, max_distance: int = FUZZY_MAX_DISTANCE):
+        self.known = frozenset(canon_names)
+        self.max_distance = int(max_distance or 0)
+        postings = {}
+        for full in self.known:
+            for t in full.split():
+                postings.setdefault(t, set()).add(full)
+        self.postings = {t: frozenset(names) for t, names in postings.items()}
+        self._memo = {}
+
+    def __call__(self, s: str):
+        return self.explain(s)[0]
+
+    def explain(self, s: str) -> tuple:
+        """(κανονικό όνομα ή None, κατάσταση, υποψήφιοι) — κατάσταση: `RESOLVED_EXACT`, `RESOLVED_TOKENS`,
+        `RESOLVED_FUZZY`, `AMBIGUOUS` ή `UNRESOLVED`."""
+        hit = self._memo.get(s, _MISSING)
+        if hit is _MISSING:
+            hit = self._memo[s] = self._resolve(s)
+        return hit
+
+    def __reduce__(self):
+        # Μετά από pickle (π.χ. από process worker) ξαναμοιράζεται το index του ίδιου roster.
+        return name_index_for, (self.known, self.max_distance)
+
+    def _match_tokens(self, toks: list) -> tuple:
+        """(όνομα ή None, υποψήφιοι) από τα token postings: μοναδική τομή, αλλιώς μοναδική ένωση."""
+        if len(toks) >= 2:
+            sets = [self.postings.get(t, frozenset()) for t in toks]
+            inter = frozenset.intersection(*sets)
+            if len(inter) == 1:
+                return next(iter(inter)), inter
+            union = frozenset().union(*sets)
+            if len(union) == 1:
+                return next(iter(union)), union
+            return None, inter or union
+        group = self.postings.get(toks[0], frozenset())
+        return (next(iter(group)) if len(group) == 1 else None), group
+
+    def _resolve(self, s: str) -> tuple:
+        s = _canon_name(s)
+        if not s:
+            return None, UNRESOLVED, ()
+        if s in self.known:
+            return s, RESOLVED_EXACT, (s,)
+        toks = s.split()
+        if not toks:
+            return None, UNRESOLVED, ()
+        match, candidates = self._match_tokens(toks)
+        if match is not None:
+            return match, RESOLVED_TOKENS, (match,)
+        if self.max_distance:
+            fixed, tied = [], set()
+            for t in toks:
+                near = self._nearest_tokens(t) if t not in self.postings else [t]
+                if len(near) > 1:
+                    tied.update(*(self.postings[n] for n in near))
+                fixed.append(near[0] if len(near) == 1 else t)
+            if fixed != toks:
+                match, fuzzy_candidates = self._match_tokens(fixed)
+                if match is not None:
+                    return match, RESOLVED_FUZZY, (match,)
+                candidates = fuzzy_candidates or candidates
+            candidates = candidates or tied
+        status = AMBIGUOUS if len(candidates) > 1 else UNRESOLVED
+        return None, status, tuple(sorted(candidates))
+
+    @cached_property
+    def _gram_postings(self) -> dict:
+        """(δίγραμμα, μήκος λέξης) → λέξεις του roster — χτίζεται στο πρώτο fuzzy ερώτημα."""
+        postings = {}
+        for t in sorted(self.postings):
+            for g in _bigrams(t):
+                postings.setdefault((g, len(t)), []).append(t)
+        return postings
+
+    def _nearest_tokens(self, word: str) -> list:
+        """Οι λέξεις του roster στη μικρότερη απόσταση από το `word` (εντός ορίου) — κενή αν δεν υπάρχει καμία.
+
+        Φίλτρο πριν από το Levenshtein: μόνο λέξεις με μήκος ±k και, αφού κάθε διόρθωση χαλά το πολύ δύο
+        διγράμματα, με τουλάχιστον (διγράμματα του `word`) − 2k κοινά.
+        """
+        k = min(self.max_distance, len(word) // FUZZY_CHARS_PER_EDIT)
+        if k <= 0:
+            return []
+        grams, postings = _bigrams(word), self._gram_postings
+        common = Counter(chain.from_iterable(postings.get((g, n), ()) for g in grams
+                                             for n in range(len(word) - k, len(word) + k + 1)))
+        best, nearest = k + 1, []
+        for t, shared in common.items():
+            if shared < len(grams) - 2 * k:
+                continue
+            d = _levenshtein(word, t, min(best, k))
+            if d > k:
+                continue
+            if d < best:
+                best, nearest = d, [t]
+            elif d == best:
+                nearest.append(t)
+        return sorted(nearest)
+
+
+_NAME_INDEXES = OrderedDict()
+_NAME_INDEXES_LOCK = threading.Lock()
+NAME_INDEX_CACHE_SIZE = 64
+
+
+def name_index_for(canon_names, max_distance: int = FUZZY_MAX_DISTANCE) -> NameIndex:
+    """`NameIndex` για το συγκεκριμένο σύνολο ονομάτων — κοινό για όλα τα sheets με το ίδιο roster (LRU)."""
+    key = (frozenset(canon_names), int(max_distance or 0))
+    with _NAME_INDEXES_LOCK:
+        index = _NAME_INDEXES.get(key)
+        if index is not None:
+            _NAME_INDEXES.move_to_end(key)
+            return index
+    index = NameIndex(*key)
+    with _NAME_INDEXES_LOCK:
+        index = _NAME_INDEXES.setdefault(key, index)
+        while len(_NAME_INDEXES) > NAME_INDEX_CACHE_SIZE:
+            _NAME_INDEXES.popitem(last=False)
+    return index
+
+
+def clear_caches():
+    """Αδειάζει τις caches του process (επικεφαλίδες, κανονικά ονόματα, name indexes, κοινά rosters) — π.χ. σε
+    επανεκκίνηση ή benchmark."""
+    _canon_name_str.cache_clear()
+    _header_plan.cache_clear()
+    with _NAME_INDEXES_LOCK:
+        _NAME_INDEXES.clear()
+    with _RELATIONS_LOCK:
+        _RELATIONS.clear()
+
+# ---------------------------
+# Compact roster model (ακέραια ids)
+# ---------------------------
+
+class _RosterMap(Mapping):
+    """Read-only προβολή κανονικό όνομα → τιμή ανά μαθητή πάνω στους πίνακες του `Roster` (χωρίς δικό της dict)."""
+    __slots__ = ("_ids", "_values")
+
+    def __init__(self, ids: dict, values):
+        self._ids, self._values = ids, values
+
+    def __getitem__(self, name):
+        return self._values[self._ids[name]]
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def roster_fingerprint(df: pd.DataFrame, fcol: str = None, fuzzy: int = FUZZY_MAX_DISTANCE) -> str:
+    """Αποτύπωμα του roster ενός sheet: ΟΝΟΜΑ + δηλώσεις φίλων/συγκρούσεων (τιμές κελιών, με τη σειρά των
+    γραμμών) + ανοχή λαθών. Ίδιο αποτύπωμα ⇒ ίδια ids και ίδιες ακμές· ΤΜΗΜΑ και σημαίες δεν μετρούν."""
+    h = hashlib.sha256(repr((int(fuzzy or 0), len(df))).encode("utf-8"))
+    for col in ("ΟΝΟΜΑ", fcol, "ΣΥΓΚΡΟΥΣΗ"):
+        present = col is not None and col in df.columns
+        h.update(b"\1" if present else b"\0")
+        if present:
+            h.update("\x1f".join(map(repr, df[col].tolist())).encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+class RosterRelations:
+    """Ό,τι εξαρτάται μόνο από τα ονόματα και τις δηλώσεις ενός sheet — όχι από το ΤΜΗΜΑ: ids μαθητών
+    (σειρά πρώτης εμφάνισης), τελευταία γραμμή και αρχικό όνομα ανά μαθητή, και μέσω του `shared` οι ακμές
+    φιλίας/σύγκρουσης και οι αμοιβαίες δυάδες.
+
+    Sheets-σενάρια με το ίδιο `roster_fingerprint` παίρνουν το ίδιο αντικείμενο από το `relations_for`: ο
+    γράφος χτίζεται (parse + αντιστοίχιση ονομάτων) μία φορά και κάθε σενάριο αξιολογείται μόνο ως νέο
+    διάνυσμα τμημάτων. Οι πίνακες είναι κοινοί, άρα μόνο για ανάγνωση.
+    """
+
+    def __init__(self, names: pd.Series, key: str = None):
+        student, canon = pd.factorize(names.map(_canon_name))
+        self.key = key
+        self.names = np.asarray(canon, dtype=object)
+        self.ids = dict(zip(self.names, range(len(self.names))))
+        self.student = student.astype(np.int32)
+        self.last_row = np.zeros(len(self.names), dtype=np.int32)
+        np.maximum.at(self.last_row, self.student, np.arange(len(names), dtype=np.int32))
+        self.original = names.astype(str).to_numpy(dtype=object)[self.last_row]
+        self._shared = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @cached_property
+    def rank(self) -> np.ndarray:
+        """id → θέση στα ταξινομημένα κανονικά ονόματα."""
+        rank = np.empty(len(self.names), dtype=np.int32)
+        rank[np.argsort(self.names, kind="stable")] = np.arange(len(self.names), dtype=np.int32)
+        return rank
+
+    def shared(self, name: str, build):
+        """Τιμή κοινή για όλα τα sheets αυτού του roster: τη χτίζει (`build()`) το πρώτο που τη ζητήσει."""
+        value = self._shared.get(name, _MISSING)
+        if value is _MISSING:
+            value = self._shared.setdefault(name, build())
+        return value
+
+    def __reduce__(self):
+        # Μετά από pickle (π.χ. από process worker) τα sheets του ίδιου roster ξαναμοιράζονται ένα αντικείμενο.
+        return _relations_from_state, (self.key, self.__dict__)
+
+
+_RELATIONS = OrderedDict()
+_RELATIONS_LOCK = threading.Lock()
+RELATIONS_CACHE_SIZE = 64
+
+
+def _register_relations(relations: RosterRelations) -> RosterRelations:
+    if relations.key is None:
+        return relations
+    with _RELATIONS_LOCK:
+        relations = _RELATIONS.setdefault(relations.key, relations)
+        _RELATIONS.move_to_end(relations.key)
+        while len(_RELATIONS) > RELATIONS_CACHE_SIZE:
+            _RELATIONS.popitem(last=False)
+    return relations
+
+
+def _relations_from_state(key: str, state: dict) -> RosterRelations:
+    with _RELATIONS_LOCK:
+        relations = _RELATIONS.get(key) if key is not None else None
+    if relations is None:
+        relations = RosterRelations.__new__(RosterRelations)
+        relations.__dict__.update(state)
+    return _register_relations(relations)
+
+
+def relations_for(df: pd.DataFrame, fcol: str = None, fuzzy: int = FUZZY_MAX_DISTANCE) -> RosterRelations:
+    """`RosterRelations` του sheet — κοινό για όλα τα sheets με το ίδιο `roster_fingerprint` (LRU)."""
+    key = roster_fingerprint(df, fcol, fuzzy)
+    with _RELATIONS_LOCK:
+        relations = _RELATIONS.get(key)
+        if relations is not None:
+            _RELATIONS.move_to_end(key)
+            return relations
+    return _register_relations(RosterRelations(df["ΟΝΟΜΑ"], key))
+
+
+class Roster:
+    """Συμπαγές μοντέλο ενός sheet με ΟΝΟΜΑ/ΤΜΗΜΑ: κάθε μαθητής ένα ακέραιο id (σειρά πρώτης εμφάνισης)
+    με ένα μόνο lookup κανονικό όνομα → id — τα ονόματα/ids έρχονται από το (κοινό) `RosterRelations`.
+
+    Ανά γραμμή: id μαθητή (`student`), ΤΜΗΜΑ ως categorical (`classes`) και οι σημαίες των στατιστικών
+    (φύλο, Ν/Ο, ΣΥΝΟΛΟ) ως uint8 πίνακας στη σειρά του `STATS_COLUMNS`. Ανά μαθητή: τελευταία γραμμή,
+    αρχικό όνομα και τμήμα της — για διπλότυπα ονόματα ισχύει η τελευταία γραμμή, όπως παντού.
+    Οι σημαίες υπολογίζονται την πρώτη φορά που ζητηθούν (στατιστικά, what-if).
+    """
+
+    def __init__(self, df: pd.DataFrame, relations: RosterRelations = None):
+        self.relations = RosterRelations(df["ΟΝΟΜΑ"]) if relations is None else relations
+        self.names, self.ids, self.student = self.relations.names, self.relations.ids, self.relations.student
+        self.last_row, self.original = self.relations.last_row, self.relations.original
+
+        tmima = df["ΤΜΗΜΑ"]
+        self.classes = pd.Categorical(tmima.astype(str).str.strip())
+        self.class_missing = tmima.isna().to_numpy()
+        self.class_code = self.classes.codes[self.last_row]
+        labels = self.classes.categories.to_numpy(dtype=object)
+        self.student_class = labels[self.class_code]
+        self.has_class = (labels != "")[self.class_code]
+        self._df = df  # μόνο μέχρι να χρειαστούν οι σημαίες
+
+    @cached_property
+    def flags(self) -> np.ndarray:
+        """Σημαίες ανά γραμμή (n_rows × `STATS_COLUMNS`, uint8) — υπολογίζονται την πρώτη φορά που ζητηθούν."""
+        df, self._df = self._df, None
+        return _stat_flags(df).reindex(columns=STATS_COLUMNS, fill_value=False).to_numpy(dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def rank(self) -> np.ndarray:
+        return self.relations.rank
+
+    def per_class(self, values: np.ndarray) -> pd.DataFrame:
+        """Άθροισμα των γραμμών του `values` (n_rows × k) ανά ΤΜΗΜΑ — χωρίς τις γραμμές με κενό (NaN) ΤΜΗΜΑ."""
+        codes = self.classes.codes[~self.class_missing]
+        sums = np.zeros((len(self.classes.categories), values.shape[1]), dtype=np.int64)
+        np.add.at(sums, codes, values[~self.class_missing])
+        seen = np.bincount(codes, minlength=len(sums)) > 0
+        return pd.DataFrame(sums[seen], index=pd.Index(self.classes.categories[seen], name="ΤΜΗΜΑ"))
+
+
+# ---------------------------
+# Per-sheet analysis (single pass)
+# ---------------------------
+
+class SheetAnalysis:
+    """Ανάλυση ενός sheet: κανονικά ονόματα, resolver, γράφος φιλιών, αμοιβαίες/σπασμένες δυάδες
+    και συγκρούσεις στην ίδια τάξη.
+
+    Κάθε κομμάτι υπολογίζεται το πολύ μία φορά (lazy) και όλες οι προβολές — ανά μαθητή, ανά τμήμα,
+    αναφορές — προκύπτουν από εδώ. Δουλεύει πάνω στο `roster` (ακέραια ids) και σε ακμές ως πίνακες
+    int32· το `df` δεν αντιγράφεται ούτε τροποποιείται. Ακμές και αμοιβαίες δυάδες κρατιούνται στο
+    `relations`, κοινό για τα σενάρια του ίδιου roster· ανά sheet υπολογίζονται μόνο όσα εξαρτώνται από το ΤΜΗΜΑ.
+    """
+
+    @_profiled("name_resolution", sheet_of=lambda self, df, sheet=None, *a, **k: sheet)
+    def __init__(self, df: pd.DataFrame, sheet=None, fuzzy: int = FUZZY_MAX_DISTANCE):
+        self.df = df
+        self.sheet = sheet
+        self.fcol = next((c for c in ("ΦΙΛΟΙ","ΦΙΛΙΑ","ΦΙΛΟΣ") if c in df.columns), None)
+        self.has_roster = {"ΟΝΟΜΑ", "ΤΜΗΜΑ"}.issubset(df.columns)
+        self.relations = relations_for(df, self.fcol, fuzzy) if self.has_roster else None
+        self.roster = Roster(df, self.relations) if self.has_roster else None
+        self.resolve = name_index_for(self.roster.names if self.has_roster else (), fuzzy)
+
+    def compute(self, engine: str = "python") -> "SheetAnalysis":
+        """Υπολογίζει τώρα ό,τι χρειάζεται το `engine` (π.χ. μέσα σε worker πριν επιστραφεί το αποτέλεσμα).
+
+        `"python"` → όλα τα αποτελέσματα· `"sparse"` → μόνο ο γράφος, τα αποτελέσματα τα γεμίζει
+        το `evaluate_sparse` για όλα τα sheets μαζί.
+        """
+        if engine == "sparse":
+            self.graph
+        else:
+            self.broken_pairs
+            self._conflict_hits
+        return self
+
+    @cached_property
+    @_profiled("sparse_graph")
+    def graph(self) -> "RosterGraph":
+        if not self.has_roster:
+            return build_roster_graph(self)
+        return self.relations.shared("graph", partial(build_roster_graph, self))
+
+    # --- προβολές ανά κανονικό όνομα (πάνω στο roster) ---
+
+    @property
+    def canon(self) -> list:
+        """Κανονικό όνομα ανά γραμμή."""
+        return self.roster.names[self.roster.student].tolist() if self.has_roster else []
+
+    @cached_property
+    def name_to_original(self) -> Mapping:
+        return _RosterMap(self.roster.ids, self.roster.original) if self.has_roster else {}
+
+    @cached_property
+    def class_by_name(self) -> Mapping:
+        return _RosterMap(self.roster.ids, self.roster.student_class) if self.has_roster else {}
+
+    @cached_property
+    def row_of(self) -> Mapping:
+        """Κανονικό όνομα → θέση (τελευταίας) γραμμής του στο `df`."""
+        return _RosterMap(self.roster.ids, self.roster.last_row.tolist()) if self.has_roster else {}
+
+    def _resolved_edges(self, col: str) -> tuple:
+        """(src, dst) ids από τη στήλη `col` με τη σειρά δήλωσης: resolved, χωρίς self-edges.
+
+        Για διπλότυπα ονόματα μετρά μόνο η τελευταία γραμμή.
+        """
+        roster = self.roster
+        edges = parse_name_column(self.df[col])
+        rows, names = edges["row"].to_numpy(), edges["name"].to_numpy()
+        resolved = {name: roster.ids.get(self.resolve(name), -1) for name in set(names)}
+        dst = np.fromiter((resolved[name] for name in names), np.int32, len(names))
+        src = roster.student[rows]
+        keep = (roster.last_row[src] == rows) & (dst >= 0) & (dst != src)
+        return src[keep], dst[keep]
+
+    # --- friendships ---
+
+    @cached_property
+    @_profiled("name_resolution")
+    def friend_edges(self) -> tuple:
+        """Μοναδικές ακμές φιλίας (src, dst) ως int32 ids, ταξινομημένες."""
+        if self.fcol is None or not self.has_roster:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        return self.relations.shared("friend_edges", self._unique_friend_edges)
+
+    def _unique_friend_edges(self) -> tuple:
+        src, dst = self._resolved_edges(self.fcol)
+        src, dst = np.divmod(np.unique(src.astype(np.int64) * len(self.roster) + dst), len(self.roster))
+        return src.astype(np.int32), dst.astype(np.int32)
+
+    @property
+    def friends_by_name(self) -> dict:
+        """Κανονικό όνομα → σύνολο (resolved) φίλων — προβολή των `friend_edges`."""
+        if self.fcol is None or not self.has_roster:
+            return {}
+        names = self.roster.names
+        friends_by_name = {me: set() for me in names}
+        for a, b in zip(*self.friend_edges):
+            friends_by_name[names[a]].add(names[b])
+        return friends_by_name
+
+    @cached_property
+    def _mutual_ids(self) -> tuple:
+        """(a, b) ids των πλήρως αμοιβαίων δυάδων, με όνομα a < όνομα b, ταξινομημένες κατά όνομα."""
+        src, dst = self.friend_edges
+        if not len(src):
+            return src, dst
+        return self.relations.shared("mutual_ids", partial(self._sorted_mutual, src, dst))
+
+    def _sorted_mutual(self, src: np.ndarray, dst: np.ndarray) -> tuple:
+        n, rank = len(self.roster), self.roster.rank
+        both = np.isin(src.astype(np.int64) * n + dst, dst.astype(np.int64) * n + src)
+        a, b = src[both], dst[both]
+        a, b = a[rank[a] < rank[b]], b[rank[a] < rank[b]]
+        order = np.lexsort((rank[b], rank[a]))
+        return a[order], b[order]
+
+    @cached_property
+    @_profiled("broken_pairs")
+    def mutual_pairs(self) -> list:
+        """Πλήρως αμοιβαίες δυάδες (a, b) με a < b, ταξινομημένες κατά όνομα."""
+        if not self.has_roster:
+            return []
+        names = self.roster.names
+        return self.relations.shared("mutual_pairs", lambda: [(names[i], names[j]) for i, j in zip(*self._mutual_ids)])
+
+    @cached_property
+    @_profiled("broken_pairs")
+    def broken_pairs(self) -> pd.DataFrame:
+        if self.fcol is None or not self.has_roster:
+            return pd.DataFrame(columns=["A","A_ΤΜΗΜΑ","B","B_ΤΜΗΜΑ"])
+        roster = self.roster
+        a, b = self._mutual_ids
+        broken = roster.has_class[a] & roster.has_class[b] & (roster.class_code[a] != roster.class_code[b])
+        if not broken.any():
+            return pd.DataFrame([])
+        a, b = a[broken], b[broken]
+        return pd.DataFrame({"A": roster.original[a], "A_ΤΜΗΜΑ": roster.student_class[a],
+                             "B": roster.original[b], "B_ΤΜΗΜΑ": roster.student_class[b]})
+
+    def broken_per_student(self):
+        """(counts, names) σπασμένων πλήρως αμοιβαίων δυάδων ανά μαθητή."""
+        df = self.df
+        if not self.has_roster:
+            return pd.Series([0]*len(df), index=df.index), pd.Series([""]*len(df), index=df.index)
+        broken_map = {}
+        for a, b in self.mutual_pairs:
+            ta = self.class_by_name.get(a, "")
+            tb = self.class_by_name.get(b, "")
+            if ta and tb and ta != tb:
+                broken_map.setdefault(a, []).append(self.name_to_original.get(b, b))
+                broken_map.setdefault(b, []).append(self.name_to_original.get(a, a))
+        lists = [broken_map.get(cn, []) for cn in self.canon]
+        return (pd.Series([len(l) for l in lists], index=df.index),
+                pd.Series([", ".join(l) for l in lists], index=df.index))
+
+    def broken_by_class(self) -> pd.Series:
+        """Σπασμένες δυάδες ανά τμήμα (κάθε δυάδα μετρά και στα δύο τμήματα)."""
+        pairs = self.broken_pairs
+        if pairs.empty:
+            return pd.Series({tmima: 0 for tmima in self.df["ΤΜΗΜΑ"].dropna().astype(str).str.strip().unique()})
+        ends = pd.concat([pairs["A_ΤΜΗΜΑ"], pairs["B_ΤΜΗΜΑ"]], ignore_index=True)
+        return ends.astype(str).str.strip().value_counts(sort=False).rename_axis(None).astype(int)
+
+    # --- conflicts ---
+
+    @cached_property
+    @_profiled("name_resolution")
+    def conflict_edges(self) -> tuple:
+        """Δηλωμένες συγκρούσεις (src, dst) ως int32 ids: ανά μαθητή με τη σειρά δήλωσης (και πολλαπλότητα)."""
+        if not self.has_roster or "ΣΥΓΚΡΟΥΣΗ" not in self.df.columns:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        return self.relations.shared("conflict_edges", self._ordered_conflict_edges)
+
+    def _ordered_conflict_edges(self) -> tuple:
+        src, dst = self._resolved_edges("ΣΥΓΚΡΟΥΣΗ")
+        order = np.argsort(src, kind="stable")
+        return src[order], dst[order]
+
+    @property
+    def conflict_targets(self) -> dict:
+        """Κανονικό όνομα → λίστα δηλωμένων (resolved) συγκρούσεων, με τη σειρά δήλωσης — προβολή των `conflict_edges`.
+
+        Για διπλότυπα ονόματα ισχύει η τελευταία γραμμή (όπως και στα αποτελέσματα ανά μαθητή).
+        """
+        if not self.has_roster or "ΣΥΓΚΡΟΥΣΗ" not in self.df.columns:
+            return {}
+        names = self.roster.names
+        targets = {me: [] for me in names}
+        for a, b in zip(*self.conflict_edges):
+            targets[names[a]].append(names[b])
+        return targets
+
+    @cached_property
+    @_profiled("conflict_counts")
+    def _conflict_hits(self):
+        counts = [0]*len(self.df)
+        names = [""]*len(self.df)
+        src, dst = self.conflict_edges
+        if len(src):
+            roster = self.roster
+            same = (roster.class_code[src] == roster.class_code[dst]) & roster.has_class[src]
+            hits = {}
+            for u, v in zip(src[same].tolist(), dst[same].tolist()):
+                hits.setdefault(u, []).append(roster.original[v])
+            for u, same_class_names in hits.items():
+                counts[roster.last_row[u]] = len(same_class_names)
+                names[roster.last_row[u]] = ", ".join(same_class_names)
+        return counts, names
+
+    def conflict_counts_and_names(self):
+        """(counts, names) δηλωμένων συγκρούσεων που βρίσκονται στην ίδια τάξη, ανά μαθητή."""
+        counts, names = self._conflict_hits
+        return pd.Series(counts, index=self.df.index), pd.Series(names, index=self.df.index)
+
+    def conflict_by_class(self) -> pd.Series:
+        if "ΤΜΗΜΑ" not in self.df:
+            return pd.Series(dtype=int)
+        counts, _ = self._conflict_hits
+        if self.has_roster:
+            classes = self.roster.classes
+            sums = np.bincount(classes.codes, weights=counts, minlength=len(classes.categories)).astype(int)
+            seen = np.bincount(classes.codes, minlength=len(classes.categories)) > 0
+            return pd.Series(sums[seen], index=pd.Index(classes.categories[seen], name="ΤΜΗΜΑ"))
+        conf_counts, _ = self.conflict_counts_and_names()
+        return conf_counts.groupby(self.df["ΤΜΗΜΑ"].astype(str).str.strip()).sum().astype(int)
+
+    # --- διάγνωση αντιστοίχισης ονομάτων ---
+
+    def resolution_report(self, max_candidates: int = 5) -> pd.DataFrame:
+        """Δηλώσεις στις στήλες φίλων/συγκρούσεων που δεν αντιστοιχίστηκαν ακριβώς: διορθώσεις σε κοντινό
+        όνομα, ασαφείς (πολλοί υποψήφιοι) και χωρίς αντιστοίχιση — μία γραμμή ανά δήλωση."""
+        columns = ["ΜΑΘΗΤΗΣ", "ΣΤΗΛΗ", "ΔΗΛΩΣΗ", "ΚΑΤΑΣΤΑΣΗ", "ΑΝΤΙΣΤΟΙΧΙΣΗ", "ΥΠΟΨΗΦΙΟΙ"]
+        if not self.has_roster:
+            return pd.DataFrame(columns=columns)
+        roster, rows = self.roster, []
+        for col in (self.fcol, "ΣΥΓΚΡΟΥΣΗ"):
+            if col is None or col not in self.df.columns:
+                continue
+            edges = parse_name_column(self.df[col])
+            for row, text in zip(edges["row"].tolist(), edges["name"].tolist()):
+                if text in _EMPTY_MARKERS:
+                    continue
+                match, status, candidates = self.resolve.explain(text)
+                if status not in RESOLUTION_LABELS:
+                    continue
+                original = roster.original[roster.ids[match]] if match is not None else ""
+                shown = [roster.original[roster.ids[c]] for c in candidates[:max_candidates]]
+                rows.append([roster.original[roster.student[row]], col, text, RESOLUTION_LABELS[status], original,
+                             ", ".join(shown) + (" …" if len(candidates) > max_candidates else "")])
+        return pd.DataFrame(rows, columns=columns)
+
+
+def analyze_sheet(df: pd.DataFrame, sheet=None, fuzzy: int = FUZZY_MAX_DISTANCE) -> SheetAnalysis:
+    return SheetAnalysis(df, sheet, fuzzy)
+
+# ---------------------------
+# Friends: broken pairs
+# ---------------------------
+
+def list_broken_mutual_pairs(df: pd.DataFrame, analysis: SheetAnalysis = None) -> pd.DataFrame:
+    """Επιστρέφει DataFrame με κάθε **σπασμένη πλήρως αμοιβαία δυάδα** (A/B + τμήματα)."""
+    return (analysis or analyze_sheet(df)).broken_pairs
+
+# ---------------------------
+# Broken friendships per student (counts + names)
+# ---------------------------
+
+def compute_broken_friend_names_per_student(df: pd.DataFrame, analysis: SheetAnalysis = None):
+    """Return (counts_series, names_series) per student for σπασμένες πλήρως αμοιβαίες δυάδες."""
+    return (analysis or analyze_sheet(df)).broken_per_student()
+
+# ---------------------------
+# Conflicts per student (NO pairs)
+# ---------------------------
+
+def _build_name_resolution(df: pd.DataFrame):
+    analysis = analyze_sheet(df)
+    return analysis.name_to_original, analysis.class_by_name, analysis.resolve
+
+
+def compute_conflict_counts_and_names(df: pd.DataFrame, analysis: SheetAnalysis = None):
+    """
+    Return (counts_series, names_series) per student.
+    - counts_series: πόσοι από τους δηλωμένους βρίσκονται στην **ίδια τάξη** (μονόπλευρη δήλωση αρκεί).
+    - names_series: ονόματα αυτών των μαθητών (comma-separated).
+    """
+    required = {"ΟΝΟΜΑ", "ΤΜΗΜΑ", "ΣΥΓΚΡΟΥΣΗ"}
+    if not required.issubset(set(df.columns)):
+        return pd.Series([0]*len(df), index=df.index), pd.Series([""]*len(df), index=df.index)
+    return (analysis or analyze_sheet(df)).conflict_counts_and_names()
+
+# ---------------------------
+# Sparse graph engine (integer ids + COO edges)
+# ---------------------------
+
+ENGINES = ("python", "sparse")
+DEFAULT_ENGINE = os.environ.get("SIMPLE100_ENGINE", "python")
+
+
+@dataclass
+class RosterGraph:
+    """Roster ως γράφος: κάθε μαθητής → ακέραιο id (θέση στα ταξινομημένα κανονικά ονόματα), φιλίες και
+    συγκρούσεις ως αραιοί πίνακες n×n σε μορφή COO (src, dst).
+
+    Οι φιλίες είναι μοναδικές ακμές χωρίς self-loops. Οι συγκρούσεις κρατούν σειρά δήλωσης και
+    πολλαπλότητα, ώστε μετρητές/ονόματα να βγαίνουν ίδια με το `SheetAnalysis`.
+    """
+    names: list
+    friend_src: np.ndarray
+    friend_dst: np.ndarray
+    conflict_src: np.ndarray
+    conflict_dst: np.ndarray
+
+    @cached_property
+    def key(self) -> tuple:
+        """Ίδιο key ⇔ ίδιος γράφος (ονόματα + ακμές) — τέτοια sheets αξιολογούνται μαζί."""
+        return (tuple(self.names), self.friend_src.tobytes(), self.friend_dst.tobytes(),
+                self.conflict_src.tobytes(), self.conflict_dst.tobytes())
+
+    @cached_property
+    def mutual(self):
+        """Αμοιβαίες δυάδες (a<b), ταξινομημένες: F ∧ Fᵀ, ως τομή των κωδικών ακμών a·n+b και b·n+a."""
+        n = max(len(self.names), 1)
+        codes = self.friend_src.astype(np.int64) * n + self.friend_dst
+        transposed = self.friend_dst.astype(np.int64) * n + self.friend_src
+        both = np.intersect1d(codes, transposed)
+        a, b = np.divmod(both, n)
+        keep = a < b
+        return a[keep], b[keep]
+
+
+def _edges(pairs) -> tuple:
+    src, dst = zip(*pairs) if pairs else ((), ())
+    return np.asarray(src, dtype=np.int32), np.asarray(dst, dtype=np.int32)
+
+
+def build_roster_graph(analysis: SheetAnalysis) -> RosterGraph:
+    """Ids του roster → θέσεις στα ταξινομημένα ονόματα (`Roster.rank`), ώστε ίδιο roster ⇒ ίδιο key."""
+    if not analysis.has_roster:
+        return RosterGraph([], *_edges([]), *_edges([]))
+    roster = analysis.roster
+    rank = roster.rank
+    names = roster.names[np.argsort(rank)].tolist()
+    fs, fd = (rank[e] for e in analysis.friend_edges)
+    order = np.lexsort((fd, fs))
+    cs, cd = (rank[e] for e in analysis.conflict_edges)
+    return RosterGraph(names, fs[order], fd[order], cs, cd)
+
+
+def _class_codes(analyses, names) -> np.ndarray:
+    """Πίνακας S×n με κωδικό τμήματος ανά sheet/μαθητή (κοινή κωδικοποίηση· κενό τμήμα → -1)."""
+    labels = np.concatenate([an.roster.student_class[[an.roster.ids[nm] for nm in names]] for an in analyses])
+    codes, _ = pd.factorize(labels)
+    codes[labels == ""] = -1
+    return codes.reshape(len(analyses), len(names))
+
+
+@_profiled("sparse_eval", sheet_of=lambda analyses: None)
+def evaluate_sparse(analyses) -> None:
+    """Sparse engine: υπολογίζει αμοιβαίες/σπασμένες δυάδες και συγκρούσεις στην ίδια τάξη για πολλά sheets.
+
+    Sheets με τον ίδιο γράφο αξιολογούνται μαζί: ένας πίνακας τμημάτων K (S×n) και μάσκες
+    K[:, a] ≠ K[:, b] (σπασμένες) / K[:, u] = K[:, v] (συγκρούσεις) πάνω σε όλες τις ακμές. Τα
+    αποτελέσματα γράφονται στα ίδια πεδία του `SheetAnalysis` και είναι ίδια με της python μηχανής.
+    """
+    groups = {}
+    for an in analyses:
+        if an.has_roster:
+            groups.setdefault(an.graph.key, []).append(an)
+    for members in groups.values():
+        g = members[0].graph
+        K = _class_codes(members, g.names)
+        a, b = g.mutual
+        mutual_pairs = [(g.names[i], g.names[j]) for i, j in zip(a.tolist(), b.tolist())]
+        broken = (K[:, a] != K[:, b]) & (K[:, a] >= 0) & (K[:, b] >= 0)
+        cs, cd = g.conflict_src, g.conflict_dst
+        same = (K[:, cs] == K[:, cd]) & (K[:, cs] >= 0)
+        for s, an in enumerate(members):
+            an.__dict__["mutual_pairs"] = mutual_pairs
+            if an.fcol is not None:
+                rows = [{"A": an.name_to_original[g.names[i]], "A_ΤΜΗΜΑ": an.class_by_name[g.names[i]],
+                         "B": an.name_to_original[g.names[j]], "B_ΤΜΗΜΑ": an.class_by_name[g.names[j]]}
+                        for i, j in zip(a[broken[s]].tolist(), b[broken[s]].tolist())]
+                an.__dict__["broken_pairs"] = pd.DataFrame(rows)
+            counts = [0]*len(an.df)
+            hits = {}
+            for u, v in zip(cs[same[s]].tolist(), cd[same[s]].tolist()):
+                hits.setdefault(u, []).append(an.name_to_original[g.names[v]])
+            names = [""]*len(an.df)
+            for u, lst in hits.items():
+                counts[an.row_of[g.names[u]]] = len(lst)
+                names[an.row_of[g.names[u]]] = ", ".join(lst)
+            an.__dict__["_conflict_hits"] = (counts, names)
+
+# ---------------------------
+# Stats generator
+# ---------------------------
+
+_YES_VALUES = ["Ν", "ΝΑΙ", "NAI", "YES", "Y"]
+_FLAG_STATS = {
+    "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ",
+    "ΖΩΗΡΟΣ": "ΖΩΗΡΟΙ",
+    "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": "ΙΔΙΑΙΤΕΡΟΤΗΤΑ",
+    "ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ": "ΓΝΩΣΗ ΕΛΛΗΝΙΚΩΝ",
+}
+STATS_COLUMNS = ["ΑΓΟΡΙΑ","ΚΟΡΙΤΣΙΑ","ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ","ΖΩΗΡΟΙ","ΙΔΙΑΙΤΕΡΟΤΗΤΑ","ΓΝΩΣΗ ΕΛΛΗΝΙΚΩΝ","ΣΥΓΚΡΟΥΣΗ","ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ","ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ"]
+
+
+def _normalized_in(s: pd.Series, values) -> pd.Series:
+    """`s` (str, strip, upper· NaN → "") ∈ `values`, υπολογισμένο μία φορά ανά μοναδική τιμή της στήλης."""
+    codes, uniques = pd.factorize(s)
+    hit = pd.Index(uniques, dtype=object).astype(str).str.strip().str.upper().isin(values)
+    return pd.Series(np.append(hit, "" in values)[codes], index=s.index)
+
+
+def _flag_yes(s: pd.Series) -> pd.Series:
+    """Ν/Ο σημαία → bool (ΝΑΙ/YES/Y → Ν· οτιδήποτε άλλο → Ο). Μη-κειμενικές στήλες δεν είναι ποτέ «Ν»."""
+    if s.dtype != object:
+        return pd.Series(False, index=s.index)
+    return _normalized_in(s, _YES_VALUES)
+
+
+def _stat_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """Bool στήλες ανά μαθητή (ΑΓΟΡΙΑ, ΚΟΡΙΤΣΙΑ, σημαίες Ν/Ο, ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ) — η βάση των στατιστικών."""
+    flags = pd.DataFrame(index=df.index)
+    if "ΦΥΛΟ" in df:
+        flags["ΑΓΟΡΙΑ"] = _normalized_in(df["ΦΥΛΟ"], ["Α"])
+        flags["ΚΟΡΙΤΣΙΑ"] = _normalized_in(df["ΦΥΛΟ"], ["Κ"])
+    for col, out in _FLAG_STATS.items():
+        if col in df:
+            flags[out] = _flag_yes(df[col])
+    flags["ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ"] = True
+    return flags
+
+
+def _order_stats(stats: pd.DataFrame) -> pd.DataFrame:
+    """Αφαιρεί το τμήμα «nan» και ταξινομεί αριθμητικά (Α1, Α2, …, Α10)."""
+    if hasattr(stats.index, "str"):
+        stats = stats.loc[stats.index.str.lower() != "nan"]
+    try:
+        stats = stats.sort_index(key=lambda x: x.str.extract(r"(\d+)")[0].astype(float))
+    except Exception:
+        stats = stats.sort_index()
+    return stats
+
+
+@_profiled("generate_stats", sheet_of=lambda df, analysis=None: getattr(analysis, "sheet", None))
+def generate_stats(df: pd.DataFrame, analysis: SheetAnalysis = None) -> pd.DataFrame:
+    """Στατιστικά ανά τμήμα σε ένα grouped πέρασμα: όλες οι σημαίες κανονικοποιούνται μία φορά σε bool
+    στήλες και αθροίζονται μαζί ανά ΤΜΗΜΑ."""
+    analysis = analysis or analyze_sheet(df)
+    if analysis.has_roster:
+        # σημαίες ήδη ως uint8 στο roster, αθροισμένες ανά κωδικό τμήματος
+        per_class = analysis.roster.per_class(analysis.roster.flags)
+        per_class.columns = STATS_COLUMNS
+    elif "ΤΜΗΜΑ" in df:
+        # ίδιο κλειδί με τις σπασμένες/συγκρούσεις (str, strip) ώστε αριθμητικά τμήματα να μην διπλασιάζονται
+        cls = df["ΤΜΗΜΑ"].astype(str).str.strip().where(df["ΤΜΗΜΑ"].notna())
+        per_class = _stat_flags(df).groupby(cls.rename("ΤΜΗΜΑ")).sum()
+    else:
+        per_class = _stat_flags(df).iloc[0:0]
+
+    # Broken friendships per class / conflicts per class (sum of per-student counts, no pairs)
+    try:
+        broken = analysis.broken_by_class()
+    except Exception:
+        broken = pd.Series(dtype=int)
+    try:
+        conflict_by_class = analysis.conflict_by_class()
+    except Exception:
+        conflict_by_class = pd.Series(dtype=int)
+
+    stats = pd.DataFrame({
+        **{c: per_class[c] for c in per_class.columns},
+        "ΣΥΓΚΡΟΥΣΗ": conflict_by_class,
+        "ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ": broken,
+    }).reindex(columns=STATS_COLUMNS).fillna(0).astype(int)
+    return _order_stats(stats)
+
+# ---------------------------
+# What-if: μετακίνηση μαθητών (incremental)
+# ---------------------------
+
+_CONFLICT_IDX = STATS_COLUMNS.index("ΣΥΓΚΡΟΥΣΗ")
+_BROKEN_IDX = STATS_COLUMNS.index("ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ")
+
+
+class WhatIf:
+    """Σενάριο «τι θα γίνει αν» πάνω σε ένα `SheetAnalysis`: μετακινήσεις μαθητών σε άλλο ΤΜΗΜΑ χωρίς νέα ανάλυση.
+
+    Κρατά μετρητές ανά τμήμα (στήλες `STATS_COLUMNS`), το σύνολο των σπασμένων δυάδων και τις συγκρούσεις
+    στην ίδια τάξη ανά μαθητή. Κάθε `move` αγγίζει μόνο τις ακμές του μαθητή (αμοιβαίοι φίλοι, δικές του
+    συγκρούσεις και όσοι τον δηλώνουν) και τα δύο τμήματα — κόστος ανάλογο του βαθμού του. Τα αποτελέσματα
+    είναι ίδια με `generate_stats` / `list_broken_mutual_pairs` / `compute_conflict_counts_and_names` πάνω
+    στο αρχείο με τα νέα τμήματα. Το `analysis` δεν τροποποιείται.
+
+    Γραμμές με κενό (NaN) ΤΜΗΜΑ έχουν `row_classes[i] = None`: όπως στο `generate_stats` δεν μετρούν στις
+    σημαίες/ΣΥΝΟΛΟ, ενώ για σπασμένες/συγκρούσεις κρατούν την ετικέτα της ανάλυσης (`labels`). Μετρούν κανονικά
+    μόλις μετακινηθούν σε τμήμα.
+    """
+
+    def __init__(self, analysis: SheetAnalysis):
+        if not analysis.has_roster:
+            raise ValueError("Χρειάζονται στήλες ΟΝΟΜΑ και ΤΜΗΜΑ")
+        self.analysis = analysis
+        roster = analysis.roster
+        self.class_by_name = dict(analysis.class_by_name)
+        self.labels = np.asarray(roster.classes, dtype=object).tolist()
+        self.row_classes = [None if missing else cls for cls, missing in zip(self.labels, roster.class_missing)]
+        self.sizes = Counter(self.labels)  # γραμμές ανά ετικέτα — τμήματα που άδειασαν δεν εμφανίζονται
+        self.rows_of = {}
+        for i, cn in enumerate(analysis.canon):
+            self.rows_of.setdefault(cn, []).append(i)
+        self.flags = roster.flags.astype(np.int64)
+        self.totals = {}
+        for cls, row in zip(self.row_classes, self.flags):
+            if cls is not None:
+                self._bucket(cls)[:] += row
+
+        self.partners = {}
+        for a, b in analysis.mutual_pairs:
+            self.partners.setdefault(a, []).append(b)
+            self.partners.setdefault(b, []).append(a)
+        self.broken = set()
+        if analysis.fcol is not None:
+            for pair in analysis.mutual_pairs:
+                self._set_broken(pair, +1)
+
+        self.targets = analysis.conflict_targets
+        self.declared_by = {}
+        for me, ts in self.targets.items():
+            for t in ts:
+                self.declared_by.setdefault(t, set()).add(me)
+        self.conflicts = {}
+        for me in self.targets:
+            self._set_conflicts(me, +1)
+        self.moves = []
+
+    def _bucket(self, cls: str) -> np.ndarray:
+        if cls not in self.totals:
+            self.totals[cls] = np.zeros(len(STATS_COLUMNS), dtype=np.int64)
+        return self.totals[cls]
+
+    def _set_broken(self, pair, sign: int):
+        """sign=+1: προσθέτει τη δυάδα αν είναι σπασμένη με τα τρέχοντα τμήματα· sign=-1: την αφαιρεί αν υπάρχει."""
+        if sign < 0:
+            if pair not in self.broken:
+                return
+            self.broken.discard(pair)
+        else:
+            ta, tb = self.class_by_name.get(pair[0], ""), self.class_by_name.get(pair[1], "")
+            if not (ta and tb and ta != tb):
+                return
+            self.broken.add(pair)
+        for nm in pair:
+            self._bucket(self.class_by_name[nm])[_BROKEN_IDX] += sign
+
+    def _set_conflicts(self, me: str, sign: int):
+        """sign=+1: υπολογίζει τις συγκρούσεις του `me` στην ίδια τάξη· sign=-1: τις αφαιρεί από τα σύνολα."""
+        if sign < 0:
+            hits = self.conflicts.pop(me, [])
+        else:
+            my_class = self.class_by_name.get(me, "")
+            hits = [r for r in self.targets.get(me, ()) if my_class and self.class_by_name.get(r, None) == my_class]
+            self.conflicts[me] = hits
+        if hits:
+            self._bucket(self.class_by_name[me])[_CONFLICT_IDX] += sign * len(hits)
+
+    def move(self, name: str, new_class: str):
+        """Μετακινεί τον μαθητή `name` (κανονικό όνομα) στο `new_class` — όλες τις γραμμές του με το ίδιο όνομα."""
+        new_class = str(new_class).strip()
+        if name not in self.rows_of:
+            raise KeyError(name)
+        if not new_class:
+            raise ValueError("Κενό ΤΜΗΜΑ")
+        previous = [self.row_classes[i] for i in self.rows_of[name]]
+        if all(c == new_class for c in previous):
+            return
+        old_class = self.class_by_name[name]
+        self._relocate(name, [new_class]*len(previous))
+        self.moves.append((name, old_class, new_class, previous))
+
+    def undo(self):
+        """Αναιρεί την τελευταία μετακίνηση (κάθε γραμμή επιστρέφει στο δικό της προηγούμενο τμήμα)."""
+        if self.moves:
+            name, _, _, previous = self.moves.pop()
+            self._relocate(name, previous)
+
+    def _relocate(self, name: str, row_classes: list):
+        pairs = [tuple(sorted((name, p))) for p in self.partners.get(name, ())]
+        affected = self.declared_by.get(name, set()) | {name}
+        for pair in pairs:
+            self._set_broken(pair, -1)
+        for me in affected:
+            self._set_conflicts(me, -1)
+        for i, cls in zip(self.rows_of[name], row_classes):
+            if self.row_classes[i] is not None:
+                self.totals[self.row_classes[i]] -= self.flags[i]
+            if cls is not None:
+                self._bucket(cls)[:] += self.flags[i]
+            self.sizes[self.label(i)] -= 1
+            self.row_classes[i] = cls
+            self.sizes[self.label(i)] += 1
+        self.class_by_name[name] = self.label(self.rows_of[name][-1])
+        if self.analysis.fcol is not None:
+            for pair in pairs:
+                self._set_broken(pair, +1)
+        for me in affected:
+            self._set_conflicts(me, +1)
+
+    def label(self, i: int) -> str:
+        """Η ετικέτα τμήματος της γραμμής `i` όπως στην ανάλυση (και για κενό ΤΜΗΜΑ)."""
+        cls = self.row_classes[i]
+        return self.labels[i] if cls is None else cls
+
+    def class_options(self) -> list:
+        """Τα τμήματα με μαθητές, χωρίς κενό ΤΜΗΜΑ — οι επιτρεπτοί προορισμοί μετακίνησης."""
+        return sorted({cls for cls in self.row_classes if cls is not None and cls.strip()})
+
+    def stats(self) -> pd.DataFrame:
+        """Στατιστικά ανά τμήμα όπως το `generate_stats` (τμήματα που άδειασαν παραλείπονται)."""
+        empty = np.zeros(len(STATS_COLUMNS), dtype=np.int64)
+        live = {cls: self.totals.get(cls, empty) for cls, n in sorted(self.sizes.items()) if n > 0}
+        stats = pd.DataFrame.from_dict(live, orient="index", columns=STATS_COLUMNS).astype(int)
+        return _order_stats(stats)
+
+    def broken_pairs(self) -> pd.DataFrame:
+        """Σπασμένες δυάδες όπως το `list_broken_mutual_pairs`."""
+        if self.analysis.fcol is None:
+            return pd.DataFrame(columns=["A","A_ΤΜΗΜΑ","B","B_ΤΜΗΜΑ"])
+        orig = self.analysis.name_to_original
+        return pd.DataFrame([{"A": orig.get(a, a), "A_ΤΜΗΜΑ": self.class_by_name[a],
+                              "B": orig.get(b, b), "B_ΤΜΗΜΑ": self.class_by_name[b]}
+                             for a, b in sorted(self.broken)])
+
+    def conflict_counts_and_names(self):
+        """(counts, names) όπως το `compute_conflict_counts_and_names` (στη γραμμή του μαθητή)."""
+        df, an = self.analysis.df, self.analysis
+        counts, names = [0]*len(df), [""]*len(df)
+        for me, hits in self.conflicts.items():
+            counts[an.row_of[me]] = len(hits)
+            names[an.row_of[me]] = ", ".join(an.name_to_original.get(r, r) for r in hits)
+        return pd.Series(counts, index=df.index), pd.Series(names, index=df.index)
+
+    def moves_table(self) -> pd.DataFrame:
+        """Λίστα μετακινήσεων (με σειρά) — για προβολή/εξαγωγή."""
+        orig = self.analysis.name_to_original
+        return pd.DataFrame([{"#": i, "ΟΝΟΜΑ": orig.get(nm, nm), "ΑΠΟ": a, "ΠΡΟΣ": b}
+                             for i, (nm, a, b, _) in enumerate(self.moves, start=1)],
+                            columns=["#", "ΟΝΟΜΑ", "ΑΠΟ", "ΠΡΟΣ"])
+
+    def moved_df(self) -> pd.DataFrame:
+        """Αντίγραφο του sheet με τα νέα τμήματα (μόνο για εξαγωγή)."""
+        out = self.analysis.df.copy()
+        rows = sorted({i for nm, _, _, _ in self.moves for i in self.rows_of[nm]})
+        if rows:
+            out["ΤΜΗΜΑ"] = out["ΤΜΗΜΑ"].astype(object)
+            out.iloc[rows, out.columns.get_loc("ΤΜΗΜΑ")] = [self.row_classes[i] for i in rows]
+        return out
+
+# ---------------------------
+# Per-student tables
+# ---------------------------
+
+def students_with_conflicts(df_norm: pd.DataFrame, analysis: SheetAnalysis = None) -> pd.DataFrame:
+    """Πίνακας μαθητών με ΣΥΓΚΡΟΥΣΗ (μετρητής) & ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ και ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ (μετρητής) & ονόματα."""
+    analysis = analysis or analyze_sheet(df_norm)
+    try:
+        conflict_counts, conflict_names = compute_conflict_counts_and_names(df_norm, analysis)
+        df_with = df_norm.copy()
+        df_with["ΣΥΓΚΡΟΥΣΗ"] = conflict_counts.astype(int)
+        df_with["ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ"] = conflict_names
+        # 🧩 Σπασμένες αμοιβαίες ανά μαθητή (μετρητής + ονόματα)
+        try:
+            broken_counts_ps, broken_names_ps = compute_broken_friend_names_per_student(df_norm, analysis)
+            df_with["ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ"] = broken_counts_ps.astype(int)
+            df_with["ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ_ΟΝΟΜΑ"] = broken_names_ps
+        except Exception:
+            pass
+    except Exception:
+        df_with = df_norm
+    return df_with
+
+
+def conflicts_in_same_class(df_norm: pd.DataFrame, analysis: SheetAnalysis = None) -> pd.DataFrame:
+    """Μόνο οι μαθητές με ≥1 δηλωμένη σύγκρουση στην ίδια τάξη (ΟΝΟΜΑ, ΤΜΗΜΑ, ΣΥΓΚΡΟΥΣΗ, ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ)."""
+    conf_counts, conf_names = compute_conflict_counts_and_names(df_norm, analysis)
+    df_conf = pd.DataFrame({
+        "ΟΝΟΜΑ": df_norm.get("ΟΝΟΜΑ", pd.Series(dtype=str)),
+        "ΤΜΗΜΑ": df_norm.get("ΤΜΗΜΑ", pd.Series(dtype=str)),
+        "ΣΥΓΚΡΟΥΣΗ": conf_counts.astype(int),
+        "ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ": conf_names,
+    })
+    return df_conf[df_conf["ΣΥΓΚΡΟΥΣΗ"] > 0].sort_values(["ΤΜΗΜΑ","ΟΝΟΜΑ"])
+
+# ---------------------------
+# Export helpers
+# ---------------------------
+
+REPORT_SPOOL_BYTES = 4 << 20  # μέχρι εδώ στη μνήμη, μετά σε προσωρινό αρχείο
+
+# Ίδια εμφάνιση με το `DataFrame.to_excel` του pandas (header/index με έντονα + περίγραμμα).
+_PANDAS_HEADER = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+_STATS_HEADER = {"bold": True, "valign": "vcenter", "text_wrap": True, "border": 1}
+
+
+class ReportWriter:
+    """Αναφορά Excel πολλών sheets σε streaming: xlsxwriter σε `constant_memory` mode — κάθε γραμμή γράφεται
+    και φεύγει από τη μνήμη — πάνω σε `SpooledTemporaryFile` (ή στο `out`: μονοπάτι/αρχείο).
+
+    Τα sheets γράφονται γραμμή-γραμμή, οπότε ένα sheet πρέπει να γραφτεί ολόκληρο με μία κλήση· η σειρά των
+    sheets στο αρχείο είναι η σειρά του `sheet()`, άρα μπορούν να δημιουργηθούν πρώτα και να γεμίσουν μετά.
+    Οι τιμές μετατρέπονται όπως στο `to_excel` (κενά για NaN, ημερομηνίες με μορφή, numpy → python).
+    """
+
+    def __init__(self, out=None):
+        self.out = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES) if out is None else out
+        self.book = xlsxwriter.Workbook(self.out, {"constant_memory": True})
+        self.formats = {
+            "header": self.book.add_format(_PANDAS_HEADER),
+            "stats_header": self.book.add_format(_STATS_HEADER),
+            "datetime": self.book.add_format({"num_format": "YYYY-MM-DD HH:MM:SS"}),
+            "date": self.book.add_format({"num_format": "YYYY-MM-DD"}),
+        }
+        self._names = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None:
+            self.book.close()
+
+    def sheet(self, name: str):
+        """Νέο worksheet· διπλότυπο όνομα (π.χ. μετά το κόψιμο στους 31 χαρακτήρες) παίρνει αριθμό."""
+        name = sanitize_sheet_name(name)
+        base, n = name, 1
+        while name.lower() in self._names:
+            n += 1
+            name = f"{base[:31 - len(str(n)) - 1]}~{n}"
+        self._names.add(name.lower())
+        return self.book.add_worksheet(name)
+
+    def _write_value(self, ws, r: int, c: int, v, fmt=None):
+        if isinstance(v, np.generic):
+            v = v.item()
+        if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v)):
+            if fmt is not None:
+                ws.write_blank(r, c, None, fmt)
+            return
+        if isinstance(v, float) and np.isinf(v):
+            v = "inf" if v > 0 else "-inf"
+        elif isinstance(v, pd.Timestamp):
+            v, fmt = v.to_pydatetime(), fmt or self.formats["datetime"]
+        elif isinstance(v, datetime):
+            fmt = fmt or self.formats["datetime"]
+        elif isinstance(v, date):
+            fmt = fmt or self.formats["date"]
+        elif not isinstance(v, (str, int, float, bool)):
+            v = str(v)
+        ws.write(r, c, v, fmt)
+
+    def write_frame(self, ws, df: pd.DataFrame, index: bool = False, index_label=None, header_fmt: str = "header"):
+        """Γράφει το `df` γραμμή-γραμμή (header πρώτα) — μία γραμμή στη μνήμη κάθε φορά."""
+        hfmt = self.formats[header_fmt]
+        header = ([index_label] if index else []) + list(df.columns)
+        for c, v in enumerate(header):
+            self._write_value(ws, 0, c, v, hfmt)
+        off = 1 if index else 0
+        for r, (idx, row) in enumerate(zip(df.index, df.itertuples(index=False, name=None)), start=1):
+            if index:
+                self._write_value(ws, r, 0, idx, self.formats["header"])
+            for c, v in enumerate(row, start=off):
+                self._write_value(ws, r, c, v)
+
+    def frame(self, name: str, df: pd.DataFrame, **kwargs):
+        self.write_frame(self.sheet(name), df, **kwargs)
+
+    def stats(self, name: str, stats_df: pd.DataFrame, ws=None):
+        """Πίνακας στατιστικών ανά τμήμα (ΤΜΗΜΑ ως index, φαρδιές στήλες, header με αναδίπλωση)."""
+        ws = self.sheet(name) if ws is None else ws
+        ws.set_column(0, len(stats_df.columns), 18)
+        self.write_frame(ws, stats_df, index=True, index_label="ΤΜΗΜΑ", header_fmt="stats_header")
+
+    def close(self):
+        """Κλείνει το workbook· επιστρέφει το αρχείο (στην αρχή) ή το `out` που δόθηκε."""
+        self.book.close()
+        if hasattr(self.out, "seek"):
+            self.out.seek(0)
+        return self.out
+
+
+@_profiled("report:frames", sheet_of=lambda *a, **k: None)
+def export_frames_to_excel(frames: dict, out=None):
+    """{όνομα sheet: DataFrame} → αρχείο Excel (χωρίς index), με τον `ReportWriter`."""
+    with ReportWriter(out) as rw:
+        for name, df in frames.items():
+            rw.frame(name, df)
+        return rw.close()
+
+
+@_profiled("report:stats_sheet", sheet_of=lambda *a, **k: None)
+def export_stats_to_excel(stats_df: pd.DataFrame, out=None):
+    with ReportWriter(out) as rw:
+        rw.stats("Στατιστικά", stats_df)
+        return rw.close()
+
+
+@_profiled("report:whatif", sheet_of=lambda whatif, out=None: whatif.analysis.sheet)
+def export_whatif_to_excel(whatif: "WhatIf", out=None):
+    """Μετακινήσεις + στατιστικά μετά τις μετακινήσεις + sheet με τα νέα τμήματα."""
+    return export_whatif_tables(whatif.moves_table(), whatif.stats(), whatif.moved_df(), out)
+
+
+def export_whatif_tables(moves: pd.DataFrame, stats_df: pd.DataFrame, moved_df: pd.DataFrame, out=None):
+    """Όπως το `export_whatif_to_excel`, από έτοιμους πίνακες (στιγμιότυπο του `WhatIf` — για χτίσιμο σε άλλο
+    thread ενώ ο χρήστης συνεχίζει τις μετακινήσεις)."""
+    with ReportWriter(out) as rw:
+        rw.frame("Μετακινήσεις", moves)
+        rw.stats("Στατιστικά", stats_df)
+        rw.frame("Νέα κατανομή", moved_df)
+        return rw.close()
+
+
+def sanitize_sheet_name(s: str) -> str:
+    s = str(s or "")
+    s = re.sub(r'[:\\/?*\\[\\]]', ' ', s)
+    return s[:31] if s else "SHEET"
+
+# ---------------------------
+# Excel ingestion (μόνο οι στήλες που χρειάζονται)
+# ---------------------------
+
+EXCEL_READERS = ("auto", "pandas")
+DEFAULT_EXCEL_READER = os.environ.get("SIMPLE100_EXCEL_READER", "auto")
+PRUNE_COLUMNS = os.environ.get("SIMPLE100_PRUNE_COLUMNS", "1") != "0"
+
+
+@lru_cache(maxsize=1)
+def _has_calamine() -> bool:
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+@_profiled("excel_open", sheet_of=lambda *a, **k: None)
+def open_excel(data: bytes, reader: str = DEFAULT_EXCEL_READER) -> pd.ExcelFile:
+    """`pd.ExcelFile` με τον ταχύτερο διαθέσιμο reader: calamine (αν είναι εγκατεστημένο το `python-calamine`)
+    και fallback στα engines του pandas (openpyxl για .xlsx, xlrd για .xls)."""
+    if reader == "auto" and _has_calamine():
+        try:
+            return pd.ExcelFile(BytesIO(data), engine="calamine")
+        except Exception:
+            pass
+    return pd.ExcelFile(BytesIO(data))
+
+
+@_profiled("parse", sheet_of=lambda xl, data, sheet, **kwargs: sheet)
+def _parse(xl: pd.ExcelFile, data: bytes, sheet, **kwargs) -> pd.DataFrame:
+    try:
+        return xl.parse(sheet_name=sheet, **kwargs)
+    except Exception:
+        if xl.engine != "calamine":
+            raise
+        return pd.ExcelFile(BytesIO(data)).parse(sheet_name=sheet, **kwargs)
+
+
+_NEEDED_KEYS = frozenset().union(*CANON_TARGETS.values())
+
+
+def _is_needed_column(col) -> bool:
+    """Στήλη που χρησιμοποιεί το `auto_rename_columns`: τίτλος του CANON_TARGETS ή στήλη φίλων (ΦΙΛ/FRIEND)."""
+    c = _canon(col) if isinstance(col, str) else ""
+    return c in _NEEDED_KEYS or "ΦΙΛ" in c or "FRIEND" in c
+
+
+def read_sheet(xl: pd.ExcelFile, sheet, data: bytes = None, prune: bool = PRUNE_COLUMNS):
+    """(df, pruned): μόνο οι στήλες του `_is_needed_column`, σε ένα πέρασμα (`usecols` πάνω στους τίτλους) — οι
+    βοηθητικές στήλες δεν μετατρέπονται καν. `pruned=False` → το df είναι όλο το sheet.
+
+    Αν δεν υπάρχει τίτλος ΤΜΗΜΑ, το sheet διαβάζεται ολόκληρο: το fallback του `auto_rename_columns` κοιτάει
+    τα δεδομένα κάθε στήλης.
+    """
+    if prune:
+        df = _parse(xl, data, sheet, usecols=_is_needed_column)
+        if CANON_TARGETS["ΤΜΗΜΑ"] & {_canon(c) for c in df.columns if isinstance(c, str)}:
+            return df, True
+    return _parse(xl, data, sheet), False
+
+# ---------------------------
+# Parallel per-sheet processing
+# ---------------------------
+
+PARALLEL_MODES = ("process", "thread")
+DEFAULT_WORKERS = max(1, int(os.environ.get("SIMPLE100_WORKERS", "1") or 1))
+DEFAULT_PARALLEL_MODE = os.environ.get("SIMPLE100_PARALLEL_MODE", "process")
+
+_WORKER_DATA = None
+_worker_state = threading.local()
+
+
+def _init_sheet_worker(data: bytes):
+    global _WORKER_DATA
+    _WORKER_DATA = data
+
+
+def _worker_excel(data: bytes, reader: str = DEFAULT_EXCEL_READER) -> pd.ExcelFile:
+    """Το `ExcelFile` του τρέχοντος worker (thread ή process) — ανοίγει μία φορά ανά αρχείο (και reader)."""
+    if getattr(_worker_state, "data", None) is not data or _worker_state.reader != reader:
+        _worker_state.xl = open_excel(data, reader)
+        _worker_state.data, _worker_state.reader = data, reader
+    return _worker_state.xl
+
+
+def _process_sheet(sheet, data: bytes = None, engine: str = "python", fuzzy: int = FUZZY_MAX_DISTANCE,
+                   reader: str = DEFAULT_EXCEL_READER, prune: bool = PRUNE_COLUMNS):
+    """Ένα sheet από την αρχή ως το τέλος: parse (βλ. `read_sheet`) → `auto_rename_columns` → πλήρης `SheetAnalysis`.
+
+    `df_raw` είναι None όταν διαβάστηκαν μόνο οι αναγκαίες στήλες (το πλήρες sheet φορτώνεται όταν ζητηθεί).
+    """
+    data = _WORKER_DATA if data is None else data
+    df, pruned = read_sheet(_worker_excel(data, reader), sheet, data, prune)
+    with _stage("auto_rename_columns", sheet):
+        df_norm, ren_map = auto_rename_columns(df)
+    return (None if pruned else df), df_norm, ren_map, analyze_sheet(df_norm, sheet, fuzzy).compute(engine)
+
+
+def iter_process_sheets(data: bytes, sheet_names, workers: int = 1, mode: str = "process", engine: str = "python",
+                        fuzzy: int = FUZZY_MAX_DISTANCE, reader: str = DEFAULT_EXCEL_READER,
+                        prune: bool = PRUNE_COLUMNS):
+    """`_process_sheet` για κάθε sheet: (sheet, αποτέλεσμα) με τη σειρά που τελειώνουν.
+
+    `workers<=1` → σειριακά. `mode="process"` → process pool (fork όπου υπάρχει — αλλιώς spawn, αφού οι
+    workers κάνουν import από αυτό το module), `mode="thread"` → thread pool. Σε σφάλμα του pool τα sheets
+    που απομένουν γίνονται σειριακά. Αν ο καλών σταματήσει νωρίς (`close()`), όσα δεν ξεκίνησαν ακυρώνονται.
+    """
+    sheet_names = list(sheet_names)
+    workers = min(int(workers or 1), len(sheet_names))
+    done = set()
+    if workers > 1:
+        try:
+            if mode == "process":
+                ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+                pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_sheet_worker, initargs=(data,))
+                job = partial(_process_sheet, engine=engine, fuzzy=fuzzy, reader=reader, prune=prune)
+            else:
+                pool = ThreadPoolExecutor(workers, thread_name_prefix="sheet")
+                job = partial(_process_sheet, data=data, engine=engine, fuzzy=fuzzy, reader=reader, prune=prune)
+            try:
+                futures = {pool.submit(job, sheet): sheet for sheet in sheet_names}
+                for future in as_completed(futures):
+                    sheet = futures[future]
+                    result = future.result()
+                    done.add(sheet)
+                    yield sheet, result
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+    for sheet in sheet_names:
+        if sheet not in done:
+            yield sheet, _process_sheet(sheet, data, engine, fuzzy, reader, prune)
+
+
+def process_sheets(data: bytes, sheet_names, workers: int = 1, mode: str = "process", engine: str = "python",
+                   fuzzy: int = FUZZY_MAX_DISTANCE, reader: str = DEFAULT_EXCEL_READER,
+                   prune: bool = PRUNE_COLUMNS) -> list:
+    """`_process_sheet` για κάθε sheet (βλ. `iter_process_sheets`), με αποτελέσματα στη σειρά των sheets."""
+    sheet_names = list(sheet_names)
+    results = dict(iter_process_sheets(data, sheet_names, workers, mode, engine, fuzzy, reader, prune))
+    return [results[sheet] for sheet in sheet_names]
+
+# ---------------------------
+# Μόνιμη cache στο δίσκο (parquet, ανά sheet)
+# ---------------------------
+
+ANALYSIS_VERSION = "2"  # αλλάζει όταν αλλάζει η ανάγνωση/ανάλυση → οι παλιές εγγραφές δεν ταιριάζουν πια
+DEFAULT_DISK_CACHE = os.environ.get("SIMPLE100_DISK_CACHE", "0") == "1"  # εκτός αν ζητηθεί (GDPR)
+DEFAULT_DISK_CACHE_DIR = os.environ.get("SIMPLE100_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "simple100"))
+DISK_CACHE_MAX_MB = float(os.environ.get("SIMPLE100_DISK_CACHE_MB", "256") or 256)
+_CACHE_ENTRY = re.compile(r"[0-9a-f]{64}")  # όνομα φακέλου εγγραφής: sha256 του κλειδιού (βλ. `DiskCache._entry`)
+_EDGE_KINDS = ("friend_edges", "conflict_edges")
+
+
+def _has_parquet() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+DISK_CACHE_AVAILABLE = _has_parquet()
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    """DataFrame από parquet· τα κενά των κειμενικών στηλών γυρίζουν σε NaN (όπως τα δίνει το `read_excel`)."""
+    df = pd.read_parquet(path)
+    for col in df.columns[df.dtypes == object]:
+        if df[col].hasnans:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+class DiskCache:
+    """Αποτελέσματα ανά sheet στο δίσκο (`path`), ώστε το ίδιο αρχείο να μην ξαναδιαβάζεται μετά από
+    επανεκκίνηση: κανονικοποιημένο (και, αν διαβάστηκε ολόκληρο, το αρχικό) DataFrame σε parquet, οι ακμές
+    φιλίας/σύγκρουσης ως πίνακας ids (.npy) και οι μετονομασίες.
+
+    Κλειδί: hash περιεχομένου του αρχείου + όνομα sheet + `ANALYSIS_VERSION` + fuzzy + ο reader και το pruning με
+    τα οποία διαβάστηκε το sheet. Το κλειδί είναι του αρχείου και όχι του περιεχομένου κάθε sheet: στο xlsx ένα
+    sheet εξαρτάται και από κοινά μέρη (sharedStrings, styles), οπότε ένα hash ανά sheet θα χρειαζόταν parse —
+    ό,τι ακριβώς γλιτώνει η cache. Αλλαγή σε ένα sheet ακυρώνει έτσι όλα τα sheets του αρχείου. Κάθε εγγραφή
+    είναι ένας φάκελος που γράφεται ατομικά· όταν το σύνολο ξεπεράσει τα `max_mb` σβήνονται οι εγγραφές που
+    χρησιμοποιήθηκαν λιγότερο πρόσφατα. Sheets που δεν γράφονται σε parquet (π.χ. στήλη με ανάμεικτους
+    τύπους) απλώς δεν μπαίνουν στην cache.
+    """
+
+    def __init__(self, path: str = DEFAULT_DISK_CACHE_DIR, max_mb: float = DISK_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 2**20)
+        os.makedirs(path, exist_ok=True)
+
+    def _entry(self, *parts) -> str:
+        h = hashlib.sha256()
+        for part in (ANALYSIS_VERSION, *parts):
+            h.update(repr(part).encode("utf-8") + b"\0")
+        return os.path.join(self.path, h.hexdigest())
+
+    def _meta(self, entry: str):
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(meta_path)  # LRU: χρόνος τελευταίας χρήσης
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def _write(self, entry: str, meta: dict, frames: dict, arrays: dict = None) -> bool:
+        if os.path.isdir(entry):
+            return True
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        try:
+            for name, df in frames.items():
+                df.to_parquet(os.path.join(tmp, f"{name}.parquet"))
+            for name, arr in (arrays or {}).items():
+                np.save(os.path.join(tmp, f"{name}.npy"), arr)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp, entry)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        self.evict()
+        return True
+
+    def sheet_names(self, digest: str):
+        meta = self._meta(self._entry("sheets", digest))
+        return None if meta is None else meta["sheets"]
+
+    def put_sheet_names(self, digest: str, sheet_names) -> bool:
+        return self._write(self._entry("sheets", digest), {"sheets": list(sheet_names)}, {})
+
+    @staticmethod
+    def _read_options(reader: str, prune: bool) -> tuple:
+        """Ο reader όπως θα χρησιμοποιηθεί («auto» → calamine μόνο αν είναι εγκατεστημένο) + pruning."""
+        return ("calamine" if reader == "auto" and _has_calamine() else "pandas"), bool(prune)
+
+    def get(self, digest: str, sheet, fuzzy: int = FUZZY_MAX_DISTANCE, reader: str = DEFAULT_EXCEL_READER,
+            prune: bool = PRUNE_COLUMNS):
+        """(df_raw, df_norm, ren_map, analysis) όπως το `_process_sheet` με τα ίδια `reader`/`prune`, ή None αν δεν
+        υπάρχει/δεν διαβάζεται."""
+        entry = self._entry("sheet", digest, sheet, fuzzy, *self._read_options(reader, prune))
+        with _stage("disk_cache", sheet):
+            meta = self._meta(entry)
+            if meta is None:
+                return None
+            try:
+                df_norm = _read_frame(os.path.join(entry, "norm.parquet"))
+                df_raw = _read_frame(os.path.join(entry, "raw.parquet")) if meta["raw"] else None
+                edges = np.load(os.path.join(entry, "edges.npy"))
+            except Exception:
+                return None
+        analysis = analyze_sheet(df_norm, sheet, fuzzy)
+        for code, name in enumerate(_EDGE_KINDS):
+            # ίδιο df → ίδιο roster → ίδια ids· οι ακμές μπαίνουν στη θέση των cached_property
+            part = edges[1:, edges[0] == code]
+            vars(analysis)[name] = (part[0].copy(), part[1].copy())
+        return df_raw, df_norm, {k: v for k, v in meta["ren_map"]}, analysis
+
+    def put(self, digest: str, sheet, df_raw, df_norm, ren_map, analysis, fuzzy: int = FUZZY_MAX_DISTANCE,
+            reader: str = DEFAULT_EXCEL_READER, prune: bool = PRUNE_COLUMNS) -> bool:
+        """Αποθηκεύει ένα αποτέλεσμα του `_process_sheet` (διαβασμένο με `reader`/`prune`)· False αν δεν γράφτηκε."""
+        with _stage("disk_cache", sheet):
+            # ακμές ως ένας int32 πίνακας 3 × n: είδος (`_EDGE_KINDS`), src, dst
+            edges = np.hstack([np.vstack([np.full(len(src), code), src, dst]).astype(np.int32)
+                               for code, (src, dst) in enumerate(getattr(analysis, name) for name in _EDGE_KINDS)])
+            frames = {"norm": df_norm} if df_raw is None else {"norm": df_norm, "raw": df_raw}
+            meta = {"sheet": str(sheet), "raw": df_raw is not None, "ren_map": [list(kv) for kv in ren_map.items()]}
+            entry = self._entry("sheet", digest, sheet, fuzzy, *self._read_options(reader, prune))
+            return self._write(entry, meta, frames, {"edges": edges})
+
+    def _entries(self) -> list:
+        """[(τελευταία χρήση, bytes, φάκελος)] όλων των εγγραφών — μόνο φάκελοι με όνομα hash και `meta.json`."""
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if not _CACHE_ENTRY.fullmatch(name) or not os.path.isdir(entry):
+                continue
+            try:
+                used = os.stat(os.path.join(entry, "meta.json")).st_mtime
+                size = sum(f.stat().st_size for f in os.scandir(entry))
+            except OSError:
+                continue
+            entries.append((used, size, entry))
+        return entries
+
+    def evict(self):
+        """Σβήνει τις λιγότερο πρόσφατα χρησιμοποιημένες εγγραφές μέχρι το σύνολο να χωρά στο όριο."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def usage(self) -> tuple:
+        """(εγγραφές, bytes) στο δίσκο."""
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def clear(self):
+        """Σβήνει όλες τις εγγραφές (και ημιτελείς `.tmp-*`)· άλλα αρχεία στο `path` μένουν ανέγγιχτα."""
+        for _, _, entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+        for name in os.listdir(self.path):
+            if name.startswith(".tmp-") and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+# ---------------------------
+# Workbook data (ανά hash περιεχομένου)
+# ---------------------------
+
+@dataclass
+class WorkbookData:
+    """Όλα τα sheets ενός αρχείου, διαβασμένα μία φορά: raw + κανονικοποιημένα DataFrames.
+
+    Τα DataFrames μοιράζονται μεταξύ reruns — οι καταναλωτές δεν τα τροποποιούν (κάνουν `.copy()`).
+    Το `raw` έχει μόνο sheets διαβασμένα ολόκληρα· το `iter_raw` δίνει και τα υπόλοιπα από το `source`.
+    Μη κενό `pending` → μερικό στιγμιότυπο εργασίας παρασκηνίου (βλ. `WorkbookJob.snapshot`): τα sheets
+    αυτά δεν έχουν διαβαστεί ακόμη και λείπουν από το `sheet_names`.
+    """
+    digest: str
+    sheet_names: list
+    raw: dict
+    norm: dict
+    ren_maps: dict
+    analyses: dict = field(default_factory=dict)
+    source: bytes = field(default=None, repr=False)
+    profiler: Profiler = field(default=None, repr=False)
+    metrics: pd.DataFrame = field(default=None, repr=False)
+    fuzzy: int = FUZZY_MAX_DISTANCE
+    pending: list = field(default_factory=list)
+
+    def add_sheet(self, sheet, df_raw, df_norm, ren_map, analysis) -> None:
+        """Ένα αποτέλεσμα του `_process_sheet` (ή της `DiskCache`) στις αντίστοιχες δομές."""
+        if df_raw is not None:
+            self.raw[sheet] = df_raw
+        self.norm[sheet], self.ren_maps[sheet] = df_norm, ren_map
+        self.analyses[sheet] = analysis
+
+    def iter_raw(self):
+        """(sheet, DataFrame) για όλα τα sheets με όλες τις στήλες, όπως στο αρχείο (π.χ. για «Πλήρες αντίγραφο»).
+
+        Όσα διαβάστηκαν με περικομμένες στήλες ξαναδιαβάζονται εδώ ένα-ένα και δεν κρατιούνται — στη μνήμη
+        μένει ένα πλήρες sheet τη φορά.
+        """
+        xl = None
+        for sheet in self.sheet_names:
+            if sheet in self.raw:
+                yield sheet, self.raw[sheet]
+                continue
+            if xl is None:
+                xl = open_excel(self.source)
+            yield sheet, _parse(xl, self.source, sheet)
+
+    def fill_state(self) -> tuple:
+        """Πόσα lazy αποτελέσματα έχουν υπολογιστεί (αναλύσεις και πεδία τους, κοινά του roster, μετρικές) — αλλάζει
+        όταν το αντικείμενο μεγαλώνει μετά την ανάγνωση (βλ. `ResultStore.resize`)."""
+        filled = 0
+        for analysis in self.analyses.values():
+            filled += len(vars(analysis))
+            if analysis.roster is not None:
+                filled += len(vars(analysis.roster)) + len(analysis.relations._shared)
+        return len(self.analyses), filled, self.metrics is not None
+
+    def analysis(self, sheet) -> SheetAnalysis:
+        """`SheetAnalysis` του sheet — υπολογίζεται μία φορά και κρατιέται μαζί με τα δεδομένα."""
+        if sheet not in self.analyses:
+            self.analyses[sheet] = analyze_sheet(self.norm[sheet], sheet, self.fuzzy)
+        return self.analyses[sheet]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@_profiled("read_workbook", sheet_of=lambda *a, **k: None)
+def read_workbook(data: bytes, workers: int = 1, mode: str = "process", digest: str = None,
+                  engine: str = "python", cache: DiskCache = None, fuzzy: int = FUZZY_MAX_DISTANCE,
+                  job: "WorkbookJob" = None, reader: str = DEFAULT_EXCEL_READER,
+                  prune: bool = PRUNE_COLUMNS) -> WorkbookData:
+    """Parse κάθε sheet + `auto_rename_columns` + ανάλυση (βλ. `iter_process_sheets`) από τα bytes ενός αρχείου.
+
+    `engine="sparse"` → οι αναλύσεις όλων των sheets αξιολογούνται μαζί από το `evaluate_sparse`.
+    Με `cache` (βλ. `DiskCache`) τα sheets που υπάρχουν ήδη στο δίσκο δεν ξαναδιαβάζονται και τα υπόλοιπα
+    γράφονται εκεί. `fuzzy`: ανοχή ορθογραφικών λαθών στην αντιστοίχιση ονομάτων (βλ. `NameIndex`).
+    Με `job` κάθε sheet παραδίδεται εκεί μόλις τελειώσει και η ανάγνωση σταματά αν ακυρωθεί (`JobCancelled`).
+    `reader`/`prune`: βλ. `open_excel` / `read_sheet` (και στο κλειδί της cache).
+    """
+    digest = digest or content_hash(data)
+    try:
+        sheet_names = None if cache is None else cache.sheet_names(digest)
+        if sheet_names is None:
+            sheet_names = list(_worker_excel(data, reader).sheet_names)
+            if cache is not None:
+                cache.put_sheet_names(digest, sheet_names)
+        if job is not None:
+            job._start(sheet_names)
+        results = {}
+        if cache is not None:
+            for sheet in sheet_names:
+                hit = cache.get(digest, sheet, fuzzy, reader, prune)
+                if hit is not None:
+                    hit[3].compute(engine)
+                    results[sheet] = hit
+                    if job is not None:
+                        job._add(sheet, hit)
+        misses = [sheet for sheet in sheet_names if sheet not in results]
+        if misses:
+            with closing(iter_process_sheets(data, misses, workers, mode, engine, fuzzy, reader, prune)) as processed:
+                for sheet, result in processed:
+                    results[sheet] = result
+                    if cache is not None:
+                        cache.put(digest, sheet, *result, fuzzy=fuzzy, reader=reader, prune=prune)
+                    if job is not None:
+                        job._add(sheet, result)
+    finally:
+        _worker_state.__dict__.clear()  # το ExcelFile του thread δεν μένει πίσω, ούτε μετά από σφάλμα/ακύρωση
+    wb_data = WorkbookData(digest, list(sheet_names), {}, {}, {}, source=data, fuzzy=fuzzy)
+    for sheet in sheet_names:
+        wb_data.add_sheet(sheet, *results[sheet])
+    if engine == "sparse":
+        evaluate_sparse(wb_data.analyses.values())
+    return wb_data
+
+# ---------------------------
+# Κοινή cache αποτελεσμάτων (όλες οι συνεδρίες, με όριο μνήμης)
+# ---------------------------
+
+STORE_MAX_MB = float(os.environ.get("SIMPLE100_STORE_MB", "512") or 512)
+
+
+def sizeof(obj, _seen: set = None) -> int:
+    """Εκτίμηση μνήμης (bytes) ενός αποτελέσματος: buffers, numpy, pandas (deep) και ό,τι περιέχουν containers
+    και αντικείμενα. Κάθε αντικείμενο μετριέται μία φορά (π.χ. ένα `NameIndex` κοινό σε πολλά sheets)."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + (sum(sizeof(x, seen) for x in obj.ravel().tolist()) if obj.dtype == object else 0)
+    if isinstance(obj, pd.DataFrame):
+        return sizeof(obj.index, seen) + sum(sizeof(obj.iloc[:, i], seen) for i in range(obj.shape[1]))
+    if isinstance(obj, (pd.Series, pd.Index)):
+        if obj.dtype != object:
+            return int(obj.memory_usage(deep=True))
+        return int(obj.memory_usage(deep=False)) + sum(sizeof(x, seen) for x in obj.tolist())
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(sizeof(k, seen) + sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(sizeof(x, seen) for x in obj)
+    if hasattr(obj, "__dict__") and not callable(obj):
+        return size + sizeof(vars(obj), seen)
+    return size
+
+
+class StoreScope:
+    """Χώρος μιας συνεδρίας στο `ResultStore`: οι εγγραφές του σβήνονται όταν χαθεί το αντικείμενο (λήξη συνεδρίας)."""
+
+    def __init__(self, store: "ResultStore"):
+        self.id = secrets.token_hex(8)
+        weakref.finalize(self, store.drop_scope, self.id)
+
+
+class ResultStore:
+    """Μία cache για όλο το process (όλες οι συνεδρίες) με όριο μνήμης: LRU ανά εγγραφή με μέγεθος από `sizeof`.
+
+    Οι εγγραφές χωρίς `scope` είναι κοινές και πρέπει να έχουν κλειδί που προϋποθέτει τα ίδια δεδομένα
+    (π.χ. hash περιεχομένου αρχείου)· όλα τα άλλα μπαίνουν στο `StoreScope` της συνεδρίας και δεν φαίνονται
+    από άλλες. Εγγραφή μεγαλύτερη από το όριο δεν κρατιέται. Μετρητές: hits/misses/evictions (βλ. `stats`).
+    """
+
+    def __init__(self, max_mb: float = STORE_MAX_MB):
+        self.max_bytes = int(max_mb * 2**20)
+        self._entries = OrderedDict()  # (scope id, key) → (value, nbytes)
+        self._lock = threading.Lock()
+        self.bytes = self.hits = self.misses = self.evictions = self.rejected = 0
+
+    def scope(self) -> StoreScope:
+        return StoreScope(self)
+
+    @staticmethod
+    def _key(key, scope):
+        return None if scope is None else scope.id, key
+
+    def get(self, key, scope: StoreScope = None, default=None):
+        with self._lock:
+            entry = self._entries.get(self._key(key, scope))
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(self._key(key, scope))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, scope: StoreScope = None, nbytes: int = None) -> bool:
+        """Κρατά το `value` (αντικαθιστά ό,τι υπήρχε) και εκτοπίζει τα λιγότερο πρόσφατα μέχρι να χωρέσει.
+        False αν δεν χωρά καθόλου στο όριο."""
+        nbytes = sizeof(value) if nbytes is None else int(nbytes)
+        with self._lock:
+            self._discard(self._key(key, scope))
+            if nbytes > self.max_bytes:
+                self.rejected += 1
+                return False
+            while self._entries and self.bytes + nbytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+            self._entries[self._key(key, scope)] = (value, nbytes)
+            self.bytes += nbytes
+            return True
+
+    def resize(self, key, scope: StoreScope = None, nbytes: int = None) -> bool:
+        """Ξαναμετρά εγγραφή που άλλαξε μέγεθος μετά το `put` (π.χ. lazy πεδία που γέμισαν) και εκτοπίζει τις
+        λιγότερο πρόσφατες άλλες μέχρι να χωρέσει — η ίδια μένει, είναι σε χρήση. False αν δεν υπάρχει."""
+        full_key = self._key(key, scope)
+        with self._lock:
+            entry = self._entries.get(full_key)
+        if entry is None:
+            return False
+        nbytes = sizeof(entry[0]) if nbytes is None else int(nbytes)  # εκτός lock: το sizeof είναι αργό
+        with self._lock:
+            current = self._entries.get(full_key)
+            if current is None or current[0] is not entry[0]:
+                return False
+            self._entries[full_key] = (entry[0], nbytes)
+            self.bytes += nbytes - current[1]
+            for other in [k for k in self._entries if k != full_key]:
+                if self.bytes <= self.max_bytes:
+                    break
+                self._discard(other)
+                self.evictions += 1
+            return True
+
+    def _discard(self, full_key) -> None:
+        entry = self._entries.pop(full_key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def drop_scope(self, scope) -> None:
+        """Σβήνει όλες τις εγγραφές μιας συνεδρίας (`StoreScope` ή το id του)."""
+        scope_id = getattr(scope, "id", scope)
+        with self._lock:
+            for full_key in [k for k in self._entries if k[0] == scope_id]:
+                self._discard(full_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "rejected": self.rejected}
+
+
+RESULT_STORE = ResultStore()
+
+# ---------------------------
+# Εργασίες παρασκηνίου (ανά συνεδρία)
+# ---------------------------
+
+JOB_WORKERS = max(1, int(os.environ.get("SIMPLE100_JOB_WORKERS", "2") or 1))
+
+
+class JobCancelled(Exception):
+    """Η εργασία ακυρώθηκε (νέο αρχείο ή επανεκκίνηση) πριν τελειώσει."""
+
+
+class JobRunner:
+    """Executor μιας συνεδρίας: εργασίες στο παρασκήνιο με κλειδί, ώστε κάθε rerun να βρίσκει την ίδια εργασία.
+
+    Κάθε εργασία τρέχει στο context του καλούντος (ίδιος profiler). Το `version` αυξάνεται σε κάθε πρόοδο
+    (βλ. `touch`) — ο καλών το συγκρίνει για να ξέρει πότε υπάρχουν νέα αποτελέσματα. `cancel_all` σε νέο
+    αρχείο ή επανεκκίνηση. Τα threads κλείνουν μαζί με τον runner (π.χ. όταν λήξει η συνεδρία).
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self._jobs = {}  # key → (Future, cancel)
+        self.version = 0
+        weakref.finalize(self, self._pool.shutdown, wait=False, cancel_futures=True)
+
+    def touch(self) -> None:
+        self.version += 1
+
+    def submit(self, key, fn, cancel=None) -> Future:
+        """Ξεκινά το `fn()` ως εργασία `key` — αν τρέχει ήδη (ή περιμένει), επιστρέφεται η υπάρχουσα. `cancel`:
+        διακοπή εργασίας που έχει ήδη ξεκινήσει (όσες περιμένουν ακυρώνονται έτσι κι αλλιώς)."""
+        if key not in self._jobs or self._jobs[key][0].done():
+            future = self._pool.submit(contextvars.copy_context().run, fn)
+            future.add_done_callback(lambda _: self.touch())
+            self._jobs[key] = (future, cancel)
+        return self._jobs[key][0]
+
+    def get(self, key) -> Future:
+        entry = self._jobs.get(key)
+        return None if entry is None else entry[0]
+
+    def pop(self, key) -> Future:
+        """Αφαιρεί την εργασία (π.χ. όταν το αποτέλεσμά της φυλάχτηκε αλλού) χωρίς να την ακυρώσει."""
+        entry = self._jobs.pop(key, None)
+        return None if entry is None else entry[0]
+
+    @property
+    def busy(self) -> bool:
+        return any(not future.done() for future, _ in self._jobs.values())
+
+    def cancel_all(self) -> None:
+        for future, cancel in self._jobs.values():
+            if not future.cancel() and cancel is not None:
+                cancel()
+        self._jobs.clear()
+        self.touch()
+
+
+class WorkbookJob:
+    """`read_workbook` ως εργασία παρασκηνίου (βλ. `JobRunner`): κάθε sheet γίνεται διαθέσιμο μόλις τελειώσει.
+
+    `snapshot()` δίνει `WorkbookData` με τα sheets που έχουν τελειώσει (τα υπόλοιπα στο `pending`) και στο
+    τέλος το πλήρες αποτέλεσμα, με το μέγεθός του στο `nbytes` (για το `ResultStore`). `cancel()` σταματά την
+    ανάγνωση στο επόμενο sheet. Με `profile` η ανάγνωση γίνεται σειριακά με δικό της `Profiler`.
+    """
+
+    def __init__(self, data: bytes, workers: int = 1, mode: str = "process", digest: str = None,
+                 engine: str = "python", cache: DiskCache = None, fuzzy: int = FUZZY_MAX_DISTANCE,
+                 profile: bool = False, on_progress=None):
+        self.data, self.digest, self.fuzzy, self.profile = data, digest or content_hash(data), fuzzy, profile
+        self._options = dict(workers=1 if profile else workers, mode=mode, engine=engine, cache=cache, fuzzy=fuzzy)
+        self.on_progress = on_progress
+        self.sheet_names = None  # γνωστά μόλις ανοίξει το αρχείο
+        self.results = {}
+        self.result = self.error = self.nbytes = None
+        self._cancelled = threading.Event()
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def run(self) -> WorkbookData:
+        try:
+            with profiling(Profiler()) if self.profile else nullcontext() as profiler:
+                wb_data = read_workbook(self.data, digest=self.digest, job=self, **self._options)
+            wb_data.profiler = profiler
+            self.nbytes = sizeof(wb_data)
+            self.result = wb_data
+            return wb_data
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            self._notify()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.result is not None or self.error is not None
+
+    def progress(self) -> tuple:
+        """(sheets που τελείωσαν, σύνολο sheets) — σύνολο None όσο δεν έχει ανοίξει το αρχείο."""
+        return len(self.results), None if self.sheet_names is None else len(self.sheet_names)
+
+    def snapshot(self) -> WorkbookData:
+        """Το αποτέλεσμα ως τώρα (None πριν ανοίξει το αρχείο) — ίδιο αντικείμενο όσο δεν τελειώνει νέο sheet."""
+        if self.result is not None:
+            return self.result
+        if self.sheet_names is None:
+            return None
+        with self._lock:
+            done = [sheet for sheet in self.sheet_names if sheet in self.results]
+            if self._snapshot is None or self._snapshot.sheet_names != done:
+                snap = WorkbookData(self.digest, done, {}, {}, {}, source=self.data, fuzzy=self.fuzzy,
+                                    pending=[sheet for sheet in self.sheet_names if sheet not in self.results])
+                for sheet in done:
+                    snap.add_sheet(sheet, *self.results[sheet])
+                self._snapshot = snap
+            return self._snapshot
+
+    # --- από το `read_workbook` ---
+
+    def _notify(self) -> None:
+        if self.on_progress is not None:
+            self.on_progress()
+
+    def _start(self, sheet_names) -> None:
+        self.sheet_names = list(sheet_names)
+        self._notify()
+
+    def _add(self, sheet, result) -> None:
+        if self.cancelled:
+            raise JobCancelled(sheet)
+        self.results[sheet] = result
+        self._notify()
+
+
+# ---------------------------
+# Reports (όλα τα sheets)
+# ---------------------------
+
+# Build full report: copy originals + *_BROKEN + Σύνοψη
+@_profiled("report:broken", sheet_of=lambda *a, **k: None)
+def build_broken_report(wb_data: WorkbookData, out=None):
+    """Πλήρες αντίγραφο κάθε sheet + *_BROKEN + Σύνοψη, σε ένα πέρασμα ανά sheet: τα worksheets δημιουργούνται
+    πρώτα (για τη σειρά στο αρχείο) και κάθε σενάριο γράφει το αντίγραφο και το *_BROKEN του μαζί."""
+    rows = []
+    with ReportWriter(out) as rw:
+        copies = [rw.sheet(sheet) for sheet in wb_data.sheet_names]
+        broken_sheets = [rw.sheet(f"{sheet}_BROKEN") for sheet in wb_data.sheet_names]
+        summary_ws = rw.sheet("Σύνοψη")
+        for (sheet, df_raw), ws_copy, ws_broken in zip(wb_data.iter_raw(), copies, broken_sheets):
+            rw.write_frame(ws_copy, df_raw)
+            del df_raw
+            broken_df = list_broken_mutual_pairs(wb_data.norm[sheet], wb_data.analysis(sheet))
+            rows.append({"Σενάριο (sheet)": sheet, "Σπασμένες Δυάδες": int(len(broken_df))})
+            if broken_df.empty:
+                rw.write_frame(ws_broken, pd.DataFrame({"info": ["— καμία σπασμένη —"]}))
+            else:
+                rw.write_frame(ws_broken, broken_df)
+        rw.write_frame(summary_ws, pd.DataFrame(rows).sort_values("Σενάριο (sheet)"))
+        return rw.close()
+
+
+@_profiled("report:conflicts", sheet_of=lambda *a, **k: None)
+def build_conflict_in_same_class_report(wb_data: WorkbookData, out=None):
+    summary_rows = []
+    with ReportWriter(out) as rw:
+        for idx, sheet in enumerate(wb_data.sheet_names, start=1):
+            df_norm = wb_data.norm[sheet]
+
+            # Υπολογισμός «ΣΥΓΚΡΟΥΣΗ» (μετρητής) και «ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ» (λίστα ονομάτων)
+            analysis = wb_data.analysis(sheet)
+            conf_counts, _conf_names = compute_conflict_counts_and_names(df_norm, analysis)
+            df_conf = conflicts_in_same_class(df_norm, analysis)
+
+            sheet_name = f"S{idx}_CONFLICT_IN_SAME_CLASS"
+            if df_conf.empty:
+                rw.frame(sheet_name, pd.DataFrame([{"Μήνυμα": "— Καμία καταγραφή —"}]))
+            else:
+                rw.frame(sheet_name, df_conf)
+
+            summary_rows.append({
+                "Index": idx,
+                "Original sheet name": sheet,
+                "S-code": f"S{idx}",
+                "Students with ≥1 Conflict in Same Class": int((conf_counts.fillna(0) > 0).sum()),
+            })
+        # Συνοπτική καρτέλα
+        rw.frame("SUMMARY", pd.DataFrame(summary_rows))
+        return rw.close()
+
+
+@_profiled("report:names", sheet_of=lambda *a, **k: None)
+def build_resolution_report(wb_data: WorkbookData, out=None):
+    """Δηλώσεις φίλων/συγκρούσεων που διορθώθηκαν, είναι ασαφείς ή δεν αντιστοιχίζονται, για όλα τα sheets
+    (ένα φύλλο ανά σενάριο + Σύνοψη με τα πλήθη ανά κατάσταση)."""
+    rows = []
+    with ReportWriter(out) as rw:
+        for sheet in wb_data.sheet_names:
+            report = wb_data.analysis(sheet).resolution_report()
+            counts = report["ΚΑΤΑΣΤΑΣΗ"].value_counts()
+            rows.append({"Σενάριο (sheet)": sheet, **{label: int(counts.get(label, 0)) for label in RESOLUTION_LABELS.values()}})
+            if report.empty:
+                rw.frame(f"{sheet}_ΟΝΟΜΑΤΑ", pd.DataFrame({"info": ["— όλες οι δηλώσεις αντιστοιχίστηκαν —"]}))
+            else:
+                rw.frame(f"{sheet}_ΟΝΟΜΑΤΑ", report)
+        rw.frame("Σύνοψη", pd.DataFrame(rows))
+        return rw.close()
+
+
+@_profiled("report:stats", sheet_of=lambda *a, **k: None)
+def build_stats_report(wb_data: WorkbookData, out=None):
+    """Στατιστικά ανά τμήμα για κάθε sheet (ένα φύλλο ανά σενάριο, ίδια μορφοποίηση με `export_stats_to_excel`)."""
+    with ReportWriter(out) as rw:
+        for sheet in wb_data.sheet_names:
+            rw.stats(sheet, generate_stats(wb_data.norm[sheet], wb_data.analysis(sheet)))
+        return rw.close()
+
+# ---------------------------
+# Σύγκριση & κατάταξη σεναρίων (όλα τα sheets)
+# ---------------------------
+
+SPREAD_COLUMNS = [c for c in STATS_COLUMNS if c not in ("ΣΥΓΚΡΟΥΣΗ", "ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ")]
+SCENARIO_METRICS = ["Σπασμένες Δυάδες", "Μαθητές με Σύγκρουση", "Συγκρούσεις", *(f"Δ {c}" for c in SPREAD_COLUMNS)]
+# Βάρη του σύνθετου σκορ (μικρότερο = καλύτερο)· μετρικές που λείπουν έχουν βάρος 0.
+DEFAULT_SCORE_WEIGHTS = {
+    "Σπασμένες Δυάδες": 3.0,
+    "Μαθητές με Σύγκρουση": 5.0,
+    **{f"Δ {c}": 1.0 for c in SPREAD_COLUMNS},
+    "Δ ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ": 2.0,
+}
+SCENARIO_TOP_K = 5
+
+
+@_profiled("scenario_metrics", sheet_of=lambda *a, **k: None)
+def scenario_metrics(wb_data: WorkbookData) -> pd.DataFrame:
+    """Πίνακας μετρικών ανά σενάριο (γραμμή = sheet, στήλες = `SCENARIO_METRICS`), σε ένα πέρασμα.
+
+    Σπασμένες δυάδες και μαθητές με ≥1 σύγκρουση στην ίδια τάξη όπως στα tabs· «Δ <στήλη>» = διαφορά
+    max − min ανά τμήμα των στατιστικών (φύλο, σημαίες, μέγεθος τμήματος). Κρατιέται στο `wb_data.metrics`.
+    """
+    if wb_data.metrics is None:
+        rows = {}
+        for sheet in wb_data.sheet_names:
+            df_norm, analysis = wb_data.norm[sheet], wb_data.analysis(sheet)
+            stats = generate_stats(df_norm, analysis)
+            conf_counts, _ = compute_conflict_counts_and_names(df_norm, analysis)
+            spread = stats[SPREAD_COLUMNS].max() - stats[SPREAD_COLUMNS].min() if len(stats) else pd.Series(0, SPREAD_COLUMNS)
+            rows[sheet] = [
+                len(list_broken_mutual_pairs(df_norm, analysis)),
+                int((conf_counts.fillna(0) > 0).sum()),
+                int(stats["ΣΥΓΚΡΟΥΣΗ"].sum()),
+                *spread.astype(int).tolist(),
+            ]
+        wb_data.metrics = pd.DataFrame.from_dict(rows, orient="index", columns=SCENARIO_METRICS).rename_axis("Σενάριο (sheet)")
+    return wb_data.metrics
+
+
+def rank_scenarios(metrics: pd.DataFrame, weights: dict = None, top_k: int = None) -> pd.DataFrame:
+    """Κατάταξη σεναρίων με σύνθετο σκορ Σ βάρος × μετρική (μικρότερο = καλύτερο).
+
+    Ισοβαθμίες παίρνουν την ίδια θέση και ταξινομούνται κατά όνομα sheet· `top_k` → μόνο οι πρώτοι k.
+    """
+    weights = DEFAULT_SCORE_WEIGHTS if weights is None else weights
+    unknown = [m for m in weights if m not in metrics.columns]
+    if unknown:
+        raise ValueError("Άγνωστες μετρικές: " + ", ".join(map(str, unknown)))
+    score = sum((metrics[m] * float(w) for m, w in weights.items() if w), pd.Series(0.0, index=metrics.index))
+    ranked = metrics.assign(ΣΚΟΡ=score.round(3))
+    ranked.insert(0, "ΘΕΣΗ", ranked["ΣΚΟΡ"].rank(method="min").astype(int))
+    ranked = ranked.sort_index(kind="stable").sort_values("ΘΕΣΗ", kind="stable")
+    return ranked if top_k is None else ranked.head(top_k)
+
+
+@_profiled("report:ranking", sheet_of=lambda *a, **k: None)
+def build_comparison_report(wb_data: WorkbookData, out=None, weights: dict = None, top_k: int = SCENARIO_TOP_K):
+    """Κατάταξη όλων των σεναρίων (+ βάρη σκορ) και στατιστικά ανά τμήμα για τα `top_k` καλύτερα."""
+    ranked = rank_scenarios(scenario_metrics(wb_data), weights)
+    weights = DEFAULT_SCORE_WEIGHTS if weights is None else weights
+    with ReportWriter(out) as rw:
+        rw.frame("Κατάταξη", ranked, index=True, index_label=ranked.index.name)
+        rw.frame("Βάρη σκορ", pd.DataFrame({"Μετρική": list(weights), "Βάρος": list(weights.values())}))
+        for sheet, pos in ranked["ΘΕΣΗ"].head(top_k).items():
+            rw.stats(f"{pos}. {sheet}", generate_stats(wb_data.norm[sheet], wb_data.analysis(sheet)))
+        return rw.close()
+
+# ---------------------------
+# Εξαγωγές σε πίνακες (Parquet / CSV, χωρίς Excel)
+# ---------------------------
+
+TABLE_FORMATS = ("parquet", "csv") if _has_parquet() else ("csv",)
+EXPORT_FORMATS = ("xlsx", *TABLE_FORMATS)
+EXPORT_MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+    "zip": "application/zip",
+}
+SCENARIO_COLUMN = "ΣΕΝΑΡΙΟ"
+STUDENT_TABLE_COLUMNS = ["ΟΝΟΜΑ", "ΤΜΗΜΑ", "ΣΥΓΚΡΟΥΣΗ", "ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ", "ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ", "ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ_ΟΝΟΜΑ"]
+
+
+def _columnar(df: pd.DataFrame, index_label=None) -> pd.DataFrame:
+    """Πίνακας έτοιμος για parquet/csv: index ως στήλη (αν δοθεί `index_label`), μοναδικά ονόματα στηλών (str)
+    και στήλες object με ανάμεικτους τύπους (π.χ. αριθμοί + κείμενο) ως κείμενο — τα κενά μένουν null."""
+    if index_label is not None:
+        df = df.rename_axis(index_label).reset_index()
+    names, seen = [], Counter()
+    for name in map(str, df.columns):
+        seen[name] += 1
+        names.append(name if seen[name] == 1 else f"{name}~{seen[name]}")
+    df = df.set_axis(names, axis=1)
+    mixed = [c for c in df.columns[df.dtypes == object] if pd.api.types.infer_dtype(df[c]).startswith("mixed")]
+    if mixed:
+        df = df.assign(**{c: df[c].astype(str).where(df[c].notna()) for c in mixed})
+    return df
+
+
+def _write_table(df: pd.DataFrame, fmt: str, out):
+    if fmt == "parquet":
+        df.to_parquet(out, index=False)
+    elif fmt == "csv":
+        df.to_csv(out, index=False, encoding="utf-8")
+    else:
+        raise ValueError(f"Άγνωστη μορφή πίνακα: {fmt} (διαθέσιμες: {', '.join(TABLE_FORMATS)})")
+
+
+@_profiled("report:table", sheet_of=lambda *a, **k: None)
+def export_table(df: pd.DataFrame, fmt: str = "parquet", out=None, index_label=None):
+    """Ένας πίνακας ως Parquet ή CSV (UTF-8, χωρίς index) κατευθείαν από το DataFrame· επιστρέφει το αρχείο
+    (στην αρχή) ή το `out` που δόθηκε, όπως ο `ReportWriter`."""
+    out = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES) if out is None else out
+    _write_table(_columnar(df, index_label), fmt, out)
+    if hasattr(out, "seek"):
+        out.seek(0)
+    return out
+
+
+def _scenario_table(frames: dict) -> pd.DataFrame:
+    """{sheet: DataFrame} → ένας πίνακας με πρώτη στήλη το ΣΕΝΑΡΙΟ (με τη σειρά των sheets)."""
+    if not frames:
+        return pd.DataFrame(columns=[SCENARIO_COLUMN])
+    return (pd.concat(frames, names=[SCENARIO_COLUMN, None])
+            .reset_index(level=0).reset_index(drop=True))
+
+
+def stats_table(wb_data: WorkbookData) -> pd.DataFrame:
+    """Στατιστικά ανά τμήμα για όλα τα σενάρια (ΣΕΝΑΡΙΟ, ΤΜΗΜΑ, `STATS_COLUMNS`)."""
+    return _scenario_table({
+        sheet: generate_stats(wb_data.norm[sheet], wb_data.analysis(sheet)).rename_axis("ΤΜΗΜΑ").reset_index()
+        for sheet in wb_data.sheet_names
+    })
+
+
+def broken_pairs_table(wb_data: WorkbookData) -> pd.DataFrame:
+    return _scenario_table({sheet: list_broken_mutual_pairs(wb_data.norm[sheet], wb_data.analysis(sheet))
+                            for sheet in wb_data.sheet_names})
+
+
+def conflicts_table(wb_data: WorkbookData) -> pd.DataFrame:
+    return _scenario_table({sheet: conflicts_in_same_class(wb_data.norm[sheet], wb_data.analysis(sheet))
+                            for sheet in wb_data.sheet_names})
+
+
+def students_table(wb_data: WorkbookData) -> pd.DataFrame:
+    """Όλοι οι μαθητές κάθε σεναρίου με τις στήλες σύγκρουσης/σπασμένης φιλίας (`STUDENT_TABLE_COLUMNS`)."""
+    frames = {}
+    for sheet in wb_data.sheet_names:
+        df_with = students_with_conflicts(wb_data.norm[sheet], wb_data.analysis(sheet))
+        frames[sheet] = df_with[[c for c in STUDENT_TABLE_COLUMNS if c in df_with.columns]]
+    return _scenario_table(frames)
+
+
+def resolution_table(wb_data: WorkbookData) -> pd.DataFrame:
+    return _scenario_table({sheet: wb_data.analysis(sheet).resolution_report() for sheet in wb_data.sheet_names})
+
+
+def summary_table(wb_data: WorkbookData, weights: dict = None) -> pd.DataFrame:
+    """Μετρικές, σκορ και θέση κάθε σεναρίου (όπως η «Κατάταξη» του `build_comparison_report`)."""
+    return rank_scenarios(scenario_metrics(wb_data), weights).rename_axis(SCENARIO_COLUMN).reset_index()
+
+
+# Πίνακες του πακέτου: όνομα αρχείου μέσα στο zip → πίνακας όλων των σεναρίων.
+BUNDLE_TABLES = {
+    "stats": stats_table,
+    "broken_pairs": broken_pairs_table,
+    "students": students_table,
+    "summary": summary_table,
+}
+
+
+@_profiled("report:bundle", sheet_of=lambda *a, **k: None)
+def build_table_bundle(wb_data: WorkbookData, out=None, fmt: str = TABLE_FORMATS[0], tables: dict = None):
+    """Zip με έναν πίνακα ανά αρχείο (`stats.parquet`, `broken_pairs.parquet`, …) για όλα τα σενάρια, από τα
+    DataFrames στη μνήμη — χωρίς Excel. Το parquet είναι ήδη συμπιεσμένο, οπότε μπαίνει χωρίς deflate."""
+    tables = BUNDLE_TABLES if tables is None else tables
+    out = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES) if out is None else out
+    compression = zipfile.ZIP_STORED if fmt == "parquet" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(out, "w", compression) as zf:
+        for name, table in tables.items():
+            buf = BytesIO()
+            _write_table(_columnar(table(wb_data)), fmt, buf)
+            zf.writestr(f"{name}.{fmt}", buf.getvalue())
+    if hasattr(out, "seek"):
+        out.seek(0)
+    return out
+
+# ---------------------------
+# Βελτιστοποίηση κατανομής (τοπική αναζήτηση πάνω στο WhatIf)
+# ---------------------------
+
+OPTIMIZE_TIME_BUDGET = 2.0  # δευτερόλεπτα
+# Μέγιστη διαφορά max − min ανά τμήμα· αν το αρχικό σενάριο την ξεπερνά ήδη, απλώς δεν χειροτερεύει.
+DEFAULT_BALANCE_TOLERANCE = {
+    "ΑΓΟΡΙΑ": 2, "ΚΟΡΙΤΣΙΑ": 2, "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": 1, "ΖΩΗΡΟΙ": 1,
+    "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": 1, "ΓΝΩΣΗ ΕΛΛΗΝΙΚΩΝ": 2, "ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ": 1,
+}
+_SPREAD_IDX = [STATS_COLUMNS.index(c) for c in SPREAD_COLUMNS]
+
+
+@dataclass
+class OptimizeResult:
+    """Αποτέλεσμα του `optimize_classes`: `whatif` με μόνο τις καθαρές μετακινήσεις (αρχικό → τελικό τμήμα)·
+    `accepted` = αποδεκτές μετακινήσεις μαθητών κατά την αναζήτηση."""
+    whatif: WhatIf
+    before: dict
+    after: dict
+    iterations: int
+    accepted: int
+    elapsed: float
+
+    def summary(self) -> pd.DataFrame:
+        """Μετρικές πριν/μετά (σπασμένες δυάδες, συγκρούσεις, διαφορές ανά τμήμα)."""
+        return pd.DataFrame({"Πριν": self.before, "Μετά": self.after}).rename_axis("Μετρική")
+
+
+class _LocalSearch:
+    """Κατάσταση της αναζήτησης: ένα `WhatIf` (δέλτα ανά κίνηση, ανάλογα του βαθμού του μαθητή) + μέλη ανά τμήμα."""
+
+    def __init__(self, analysis: SheetAnalysis, broken_weight: float, conflict_weight: float, tolerance: dict):
+        self.wi = wi = WhatIf(analysis)
+        # μόνο τμήματα/μαθητές με ΤΜΗΜΑ στο αρχείο: κανείς δεν μπαίνει ή βγαίνει από κενό τμήμα
+        self.classes = wi.class_options()
+        self.members = {c: [] for c in self.classes}
+        for name, cls in wi.class_by_name.items():
+            if cls in self.members and all(wi.row_classes[i] in self.members for i in wi.rows_of[name]):
+                self.members[cls].append(name)
+        self.movable = {name for members in self.members.values() for name in members}
+        self.buckets = [wi._bucket(c) for c in self.classes]  # οι πίνακες του WhatIf ενημερώνονται in-place
+        self.weights = (float(broken_weight), float(conflict_weight))
+        spread = self.spread()
+        tol = np.array([tolerance.get(c, np.inf) for c in SPREAD_COLUMNS], dtype=float)
+        self.limit = np.maximum(tol, spread)
+
+    def spread(self) -> np.ndarray:
+        if not self.buckets:
+            return np.zeros(len(_SPREAD_IDX))
+        totals = np.stack(self.buckets)[:, _SPREAD_IDX]
+        return totals.max(axis=0) - totals.min(axis=0)
+
+    def conflicts(self) -> int:
+        return int(sum(row[_CONFLICT_IDX] for row in self.wi.totals.values()))
+
+    def cost(self) -> float:
+        return self.weights[0] * len(self.wi.broken) + self.weights[1] * self.conflicts()
+
+    def feasible(self) -> bool:
+        return bool((self.spread() <= self.limit).all())
+
+    def metrics(self) -> dict:
+        return {"Σπασμένες Δυάδες": len(self.wi.broken), "Συγκρούσεις": self.conflicts(),
+                **{f"Δ {c}": int(v) for c, v in zip(SPREAD_COLUMNS, self.spread())}}
+
+    def troubled(self) -> list:
+        """Μαθητές σε σπασμένη δυάδα ή με σύγκρουση στην ίδια τάξη (οι πιο πιθανοί υποψήφιοι)."""
+        wi = self.wi
+        names = {nm for pair in wi.broken for nm in pair} | {me for me, hits in wi.conflicts.items() if hits}
+        return sorted(nm for nm in names if nm in self.movable)
+
+    def relocate(self, name: str, old: str, new: str):
+        self.members[old].remove(name)
+        self.members[new].append(name)
+
+
+@_profiled("optimize", sheet_of=lambda analysis, **k: analysis.sheet)
+def optimize_classes(analysis: SheetAnalysis, time_budget: float = OPTIMIZE_TIME_BUDGET, seed: int = 0,
+                     broken_weight: float = 1.0, conflict_weight: float = 1.0, tolerance: dict = None,
+                     max_iter: int = None, swap_rate: float = 0.8, focus: float = 0.8) -> OptimizeResult:
+    """Τοπική αναζήτηση από την τρέχουσα κατανομή: ανταλλαγές (ή μετακινήσεις) μαθητών μεταξύ τμημάτων που
+    μειώνουν `broken_weight` × σπασμένες δυάδες + `conflict_weight` × συγκρούσεις στην ίδια τάξη.
+
+    Κάθε υποψήφια κίνηση εφαρμόζεται στο `WhatIf` (incremental) και αναιρείται αν αυξάνει το κόστος ή ξεπερνά
+    τα όρια ισορροπίας (`tolerance`: στήλη στατιστικών → μέγιστη διαφορά max − min· default
+    `DEFAULT_BALANCE_TOLERANCE`). Ίσο κόστος γίνεται δεκτό (μετακίνηση σε «πλατό»). Σταματά στο `time_budget`,
+    στο `max_iter` ή σε μηδενικό κόστος· ίδιο `seed` και ίδιος αριθμός επαναλήψεων → ίδιο αποτέλεσμα.
+    """
+    tolerance = DEFAULT_BALANCE_TOLERANCE if tolerance is None else tolerance
+    search = _LocalSearch(analysis, broken_weight, conflict_weight, tolerance)
+    wi, rng = search.wi, random.Random(seed)
+    before, cost = search.metrics(), search.cost()
+    students = sorted(nm for members in search.members.values() for nm in members)
+    troubled = search.troubled()
+    log, best_len, best_cost = [], 0, cost  # αποδεκτές κινήσεις (όνομα, τμήμα)· ως την τελευταία βελτίωση
+    iterations = 0
+    start = time.perf_counter()
+    while len(search.classes) > 1 and cost > 0 and (max_iter is None or iterations < max_iter):
+        if time.perf_counter() - start >= time_budget:
+            break
+        iterations += 1
+        a = rng.choice(troubled) if troubled and rng.random() < focus else rng.choice(students)
+        ca = wi.class_by_name[a]
+        # στόχος: το τμήμα ενός αμοιβαίου φίλου που είναι αλλού, αλλιώς τυχαίο άλλο τμήμα
+        near = [wi.class_by_name[p] for p in wi.partners.get(a, ()) if wi.class_by_name[p] != ca
+                and wi.class_by_name[p] in search.members]
+        cb = rng.choice(near) if near and rng.random() < focus else rng.choice([c for c in search.classes if c != ca])
+        b = rng.choice(search.members[cb]) if search.members[cb] and rng.random() < swap_rate else None
+
+        mark = len(wi.moves)
+        wi.move(a, cb)
+        if b is not None:
+            wi.move(b, ca)
+        new_cost = search.cost()
+        if new_cost <= cost and search.feasible():
+            cost = new_cost
+            search.relocate(a, ca, cb)
+            log.append((a, cb))
+            if b is not None:
+                search.relocate(b, cb, ca)
+                log.append((b, ca))
+            if cost < best_cost:
+                best_len, best_cost = len(log), cost
+            troubled = search.troubled()
+        else:
+            while len(wi.moves) > mark:
+                wi.undo()
+    elapsed = time.perf_counter() - start
+
+    # Καθαρές μετακινήσεις ως την τελευταία βελτίωση: κάθε μαθητής μία φορά (τελικό τμήμα), σε νέο WhatIf.
+    final = dict(log[:best_len])
+    result = _LocalSearch(analysis, broken_weight, conflict_weight, tolerance)
+    for name in sorted(final):
+        result.wi.move(name, final[name])
+    return OptimizeResult(result.wi, before, result.metrics(), iterations, len(log), elapsed)
+
+
+def _suffixed_sheet_name(sheet, suffix: str) -> str:
+    """`<sheet><suffix>` στα 31 του Excel: κόβεται το όνομα του sheet, όχι η κατάληξη (μένουν διακριτά)."""
+    name = sanitize_sheet_name(sheet)
+    return name[:31 - len(suffix)] + suffix
+
+
+def _original_column(df_raw: pd.DataFrame, ren_map: dict, target: str):
+    """Ο τίτλος του raw sheet που έγινε `target` στο `auto_rename_columns` (mapping ή fallback του ΤΜΗΜΑ)."""
+    col = next((c for c, t in ren_map.items() if t == target and c in df_raw.columns), None)
+    if col is None and target in df_raw.columns:
+        col = target
+    if col is None and target == "ΤΜΗΜΑ":
+        col = _class_column_fallback(df_raw)
+    return col
+
+
+def optimized_raw_sheet(df_raw: pd.DataFrame, ren_map: dict, whatif: "WhatIf") -> pd.DataFrame:
+    """Το πλήρες sheet όπως στο αρχείο (όλες οι στήλες, αρχικοί τίτλοι) με αλλαγμένα μόνο τα κελιά ΤΜΗΜΑ των
+    μαθητών που μετακινήθηκαν."""
+    col = _original_column(df_raw, ren_map, "ΤΜΗΜΑ")
+    if col is None or len(df_raw) != len(whatif.analysis.df):
+        raise ValueError("Δεν βρέθηκε η στήλη ΤΜΗΜΑ στο αρχικό sheet")
+    out = df_raw.copy()
+    rows = sorted({i for nm, _, _, _ in whatif.moves for i in whatif.rows_of[nm]})
+    if rows:
+        j = out.columns.get_loc(col)
+        out.isetitem(j, out.iloc[:, j].astype(object))
+        out.iloc[rows, j] = [whatif.row_classes[i] for i in rows]
+    return out
+
+
+@_profiled("report:optimized", sheet_of=lambda wb_data, sheet, *a, **k: sheet)
+def build_optimized_report(wb_data: WorkbookData, sheet, result: OptimizeResult, out=None):
+    """Πλήρες αντίγραφο κάθε sheet + το βελτιωμένο σενάριο ως νέο sheet `<sheet>_OPT` (το αρχικό sheet με όλες
+    τις στήλες, μόνο με τα νέα τμήματα) + αλλαγές, στατιστικά, πριν/μετά — το αρχείο μπορεί να ξαναφορτωθεί
+    και να συγκριθεί με τα υπόλοιπα σενάρια."""
+    with ReportWriter(out) as rw:
+        sheets = {name: rw.sheet(name) for name in wb_data.sheet_names}
+        opt_ws = rw.sheet(_suffixed_sheet_name(sheet, "_OPT"))
+        for name, df_raw in wb_data.iter_raw():
+            rw.write_frame(sheets[name], df_raw)
+            if name == sheet:  # το πλήρες sheet διαβάζεται μία φορά και για τα δύο
+                rw.write_frame(opt_ws, optimized_raw_sheet(df_raw, wb_data.ren_maps[sheet], result.whatif))
+            del df_raw
+        rw.frame(_suffixed_sheet_name(sheet, "_OPT_ΑΛΛΑΓΕΣ"), result.whatif.moves_table())
+        rw.stats(_suffixed_sheet_name(sheet, "_OPT_ΣΤΑΤΙΣΤΙΚΑ"), result.whatif.stats())
+        rw.frame(_suffixed_sheet_name(sheet, "_OPT_ΠΡΙΝ_ΜΕΤΑ"), result.summary(), index=True, index_label="Μετρική")
+        return rw.close()
@@ -1,17 +1,36 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 from datetime import datetime
-import re, ast, unicodedata
+from functools import partial
+import os
+
+from analysis import (
+    REQUIRED_COLS, PARALLEL_MODES, DEFAULT_WORKERS, DEFAULT_PARALLEL_MODE, ENGINES, DEFAULT_ENGINE, WorkbookData,
+    clear_caches, content_hash, list_broken_mutual_pairs, compute_conflict_counts_and_names,
+    generate_stats, students_with_conflicts, conflicts_in_same_class, export_stats_to_excel, export_frames_to_excel,
+    WhatIf, export_whatif_tables, sanitize_sheet_name, build_broken_report, build_conflict_in_same_class_report,
+    DEFAULT_PROFILE, Profiler, TracingOwner, use_profiler, JobRunner, WorkbookJob, RESULT_STORE,
+    SCENARIO_METRICS, DEFAULT_SCORE_WEIGHTS, SCENARIO_TOP_K, scenario_metrics, rank_scenarios, build_comparison_report,
+    OPTIMIZE_TIME_BUDGET, DEFAULT_BALANCE_TOLERANCE, optimize_classes, build_optimized_report,
+    DEFAULT_DISK_CACHE, DEFAULT_DISK_CACHE_DIR, DISK_CACHE_MAX_MB, DiskCache, DISK_CACHE_AVAILABLE,
+    FUZZY_MAX_DISTANCE, build_resolution_report,
+    EXPORT_FORMATS, TABLE_FORMATS, EXPORT_MIME, export_table, broken_pairs_table, conflicts_table, build_table_bundle,
+)
 
 # ---------------------------
 # 🔄 Restart helpers
 # ---------------------------
 def _restart_app():
-    """Clear caches & widget states (including file_uploader) and rerun."""
+    """Cancel background jobs, drop this session's stored results, clear caches & widget states
+    (including file_uploader) and rerun."""
+    if "jobs::runner" in st.session_state:
+        st.session_state["jobs::runner"].cancel_all()
+    if "store::scope" in st.session_state:
+        RESULT_STORE.drop_scope(st.session_state["store::scope"])
     st.session_state["uploader_key"] = st.session_state.get("uploader_key", 0) + 1
     for k in list(st.session_state.keys()):
-        if str(k).startswith("uploader_"):
+        if str(k).startswith(("uploader_", "report_ready::", "whatif::", "profiler::", "compare::", "optimize::",
+                              "jobs::", "stats::", "store::", "details::")):
             del st.session_state[k]
     try:
         st.cache_data.clear()
@@ -21,6 +40,7 @@ def _restart_app():
         st.cache_resource.clear()
     except Exception:
         pass
+    clear_caches()
     st.rerun()
 
 st.set_page_config(page_title="📊 Στατιστικά & 🧩 Σπασμένες Φιλίες", page_icon="🧩", layout="wide")
@@ -30,6 +50,35 @@ st.title("📊 Στατιστικά")
 if "uploader_key" not in st.session_state:
     st.session_state["uploader_key"] = 0
 
+# ---------------------------
+# Εργασίες παρασκηνίου της συνεδρίας (ανάγνωση αρχείου, αναφορές, βελτιστοποίηση)
+# ---------------------------
+
+JOB_POLL_SECONDS = 0.5
+
+if "jobs::runner" not in st.session_state:
+    st.session_state["jobs::runner"] = JobRunner()
+jobs = st.session_state["jobs::runner"]
+jobs_seen = jobs.version  # ό,τι τελειώσει μετά από εδώ φαίνεται στο επόμενο rerun
+
+# Χώρος της συνεδρίας στην κοινή cache (βλ. `ResultStore`): αναφορές κ.λπ. δεν φαίνονται σε άλλες συνεδρίες
+if "store::scope" not in st.session_state:
+    st.session_state["store::scope"] = RESULT_STORE.scope()
+store_scope = st.session_state["store::scope"]
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _poll_jobs(seen: int):
+    """Ελέγχει περιοδικά τις εργασίες· μόλις υπάρξει πρόοδος, ξαναφτιάχνεται όλη η σελίδα με τα νέα αποτελέσματα."""
+    if jobs.version != seen:
+        st.rerun()
+
+
+def watch_jobs():
+    """Polling μόνο όσο τρέχουν εργασίες (ή υπάρχει πρόοδος που δεν έχει εμφανιστεί)."""
+    if jobs.busy or jobs.version != jobs_seen:
+        _poll_jobs(jobs_seen)
+
 # ---------------------------
 # Sidebar: Legal / Terms + Restart
 # ---------------------------
@@ -54,7 +103,7 @@ with st.sidebar.expander("Κάτοχος/Δημιουργός & Άδεια", exp
 
 with st.sidebar.expander("🔒 Προστασία Δεδομένων (GDPR – Κύπρος)", expanded=False):
     st.markdown("""
-- Τα αρχεία Excel ανεβαίνουν από τον χρήστη και χρησιμοποιούνται **μόνο** για άμεσο υπολογισμό. Η εφαρμογή δεν αποθηκεύει μόνιμα δεδομένα.  
+- Τα αρχεία Excel ανεβαίνουν από τον χρήστη και χρησιμοποιούνται **μόνο** για άμεσο υπολογισμό. Η εφαρμογή δεν αποθηκεύει μόνιμα δεδομένα — εκτός αν ενεργοποιηθεί ρητά η **μόνιμη cache στο δίσκο** (Ρυθμίσεις επεξεργασίας), που κρατά τα αποτελέσματα στον server μέχρι να αδειάσει.  
 - Ο χρήστης/σχολείο ευθύνεται για συμμόρφωση με **GDPR**.  
 - **Συστάσεις:** ψευδώνυμα/κωδικοί, ελαχιστοποίηση δεδομένων, περίοδος διατήρησης, ενημέρωση DPO, έλεγχος παρόχου cloud.
 """)
@@ -73,405 +122,162 @@ with st.expander("📜 Πλήρεις Όροι Χρήσης & Αποποίηση
 """)
 
 # ---------------------------
-# Canonicalization / Renaming
+# Lazy downloads (χτίζονται μόνο όταν ζητηθούν)
 # ---------------------------
-def _canon(s: str) -> str:
-    return "".join((s or "").replace("_"," ").split()).upper()
-
-CANON_TARGETS = {
-    "ΟΝΟΜΑ": {"ΟΝΟΜΑ"},
-    "ΦΥΛΟ": {"ΦΥΛΟ"},
-    "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": {"ΠΑΙΔΙΕΚΠΑΙΔΕΥΤΙΚΟΥ", "ΠΑΙΔΙ-ΕΚΠΑΙΔΕΥΤΙΚΟΥ"},
-    "ΖΩΗΡΟΣ": {"ΖΩΗΡΟΣ"},
-    "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": {"ΙΔΙΑΙΤΕΡΟΤΗΤΑ"},
-    "ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ": {"ΚΑΛΗΓΝΩΣΗΕΛΛΗΝΙΚΩΝ", "ΓΝΩΣΗΕΛΛΗΝΙΚΩΝ"},
-    "ΦΙΛΟΙ": {"ΦΙΛΟΙ", "ΦΙΛΙΑ", "ΦΙΛΟΣ"},
-    "ΣΥΓΚΡΟΥΣΗ": {"ΣΥΓΚΡΟΥΣΗ", "ΣΥΓΚΡΟΥΣΕΙΣ"},
-    "ΤΜΗΜΑ": {"ΤΜΗΜΑ"},
-}
-REQUIRED_COLS = ["ΟΝΟΜΑ","ΦΥΛΟ","ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ","ΖΩΗΡΟΣ","ΙΔΙΑΙΤΕΡΟΤΗΤΑ","ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ","ΦΙΛΟΙ","ΣΥΓΚΡΟΥΣΗ","ΤΜΗΜΑ"]
-
-def auto_rename_columns(df: pd.DataFrame):
-    """Map κοινές ελληνικές στήλες σε κανονική μορφή. Αν δεν βρεθούν, δημιουργούνται/συνενώνονται όπου χρειάζεται."""
-    mapping, seen = {}, set()
-    for col in df.columns:
-        c = _canon(col)
-        for target, keys in CANON_TARGETS.items():
-            if c in keys and target not in seen:
-                mapping[col] = target
-                seen.add(target)
-                break
-    renamed = df.rename(columns=mapping)
-
-    # ΦΙΛΟΙ fallback
-    friends_cols = [c for c in renamed.columns if c in ("ΦΙΛΟΙ","ΦΙΛΙΑ","ΦΙΛΟΣ")]
-    if not friends_cols:
-        candidates = []
-        for col in df.columns:
-            c = _canon(col)
-            if "ΦΙΛ" in c or "FRIEND" in c:
-                candidates.append(col)
-        if candidates:
-            combined = []
-            for _, row in df[candidates].astype(str).iterrows():
-                vals = [str(v).strip() for v in row.tolist() if str(v).strip() and str(v).strip().upper() not in ("-","NA","NAN")]
-                combined.append(", ".join(vals))
-            renamed["ΦΙΛΟΙ"] = combined
-
-    # ΤΜΗΜΑ fallback
-    if "ΤΜΗΜΑ" not in renamed.columns:
-        best = None
-        for col in df.columns[::-1]:
-            s = df[col].dropna().astype(str).str.strip()
-            if not len(s):
-                continue
-            if s.str.len().median() <= 4 and s.nunique() <= 10:
-                best = col
-                break
-        if best:
-            renamed = renamed.rename(columns={best:"ΤΜΗΜΑ"})
-
-    # ΣΥΓΚΡΟΥΣΗ fallback
-    if "ΣΥΓΚΡΟΥΣΗ" not in renamed.columns:
-        if "ΣΥΓΚΡΟΥΣΕΙΣ" in renamed.columns:
-            renamed = renamed.rename(columns={"ΣΥΓΚΡΟΥΣΕΙΣ": "ΣΥΓΚΡΟΥΣΗ"})
-        else:
-            renamed["ΣΥΓΚΡΟΥΣΗ"] = ""
-    return renamed, mapping
 
-# ---------------------------
-# Name canonicalization helpers
-# ---------------------------
+XLSX_MIME = EXPORT_MIME["xlsx"]
+FORMAT_LABELS = {"xlsx": "Excel", "parquet": "Parquet", "csv": "CSV"}
 
-def _strip_diacritics(s: str) -> str:
-    nfkd = unicodedata.normalize("NFD", s)
-    return "".join(ch for ch in nfkd if not unicodedata.combining(ch))
 
-def _canon_name(s: str) -> str:
-    s = (str(s) if s is not None else "").strip()
-    s = s.strip("[]'\" ")
-    s = re.sub(r"\s+", " ", s)
-    s = _strip_diacritics(s).upper()
-    return s
+def _built_bytes(build) -> bytes:
+    """Το `build` επιστρέφει αρχείο (προσωρινό ή BytesIO)· διαβάζεται μία φορά και κλείνει."""
+    with build() as f:
+        return f.read()
 
-_SPLIT_RE = re.compile(r"\s*(?:,|;|/|\||\band\b|\bκαι\b|\+|\n)\s*", flags=re.IGNORECASE)
 
-# ---------------------------
-# Friends parsing & broken pairs
-# ---------------------------
+def lazy_download_button(label: str, build, cache_key: tuple, file_name: str, mime: str = XLSX_MIME,
+                         ready: bool = True, **kwargs):
+    """Κουμπί «Προετοιμασία» → η αναφορά χτίζεται στο παρασκήνιο μόνο μετά από αίτημα· ύστερα εμφανίζεται το
+    download_button με τα ήδη έτοιμα bytes (κρατιούνται στο `RESULT_STORE`, στον χώρο της συνεδρίας· αν
+    εκτοπιστούν, ξαναχτίζονται στο παρασκήνιο).
 
-def _parse_friends(cell):
-    raw = str(cell) if cell is not None else ""
-    raw = raw.strip()
-    if not raw:
-        return []
-    if raw.startswith("[") and raw.endswith("]"):
-        try:
-            val = ast.literal_eval(raw)
-            if isinstance(val, (list, tuple)):
-                return [_canon_name(x) for x in val if str(x).strip()]
-        except Exception:
-            pass
-        raw2 = raw.strip("[]")
-        parts = re.split(r"[;,]", raw2)
-        return [_canon_name(p) for p in parts if _canon_name(p)]
-    parts = [p for p in _SPLIT_RE.split(raw) if p]
-    return [_canon_name(p) for p in parts if _canon_name(p)]
-
-
-def list_broken_mutual_pairs(df: pd.DataFrame) -> pd.DataFrame:
-    """Επιστρέφει DataFrame με κάθε **σπασμένη πλήρως αμοιβαία δυάδα** (A/B + τμήματα)."""
-    fcol = None
-    for candidate in ["ΦΙΛΟΙ","ΦΙΛΙΑ","ΦΙΛΟΣ"]:
-        if candidate in df.columns:
-            fcol = candidate
-            break
-    if fcol is None or "ΟΝΟΜΑ" not in df.columns or "ΤΜΗΜΑ" not in df.columns:
-        return pd.DataFrame(columns=["A","A_ΤΜΗΜΑ","B","B_ΤΜΗΜΑ"])
-
-    df = df.copy()
-    df["__CAN_NAME__"] = df["ΟΝΟΜΑ"].map(_canon_name)
-    name_to_original = dict(zip(df["__CAN_NAME__"], df["ΟΝΟΜΑ"].astype(str)))
-    class_by_name = dict(zip(df["__CAN_NAME__"], df["ΤΜΗΜΑ"].astype(str).str.strip()))
-
-    token_index = {}
-    for full in df["__CAN_NAME__"]:
-        tokens = [t for t in re.split(r"\s+", full) if t]
-        for t in tokens:
-            token_index.setdefault(t, set()).add(full)
-
-    def resolve_friend(s: str):
-        s = _canon_name(s)
-        if not s:
-            return None
-        if s in name_to_original:
-            return s
-        toks = [t for t in re.split(r"\s+", s) if t]
-        if not toks:
-            return None
-        if len(toks) >= 2:
-            sets = [token_index.get(t, set()) for t in toks]
-            inter = set.intersection(*sets) if sets else set()
-            if len(inter) == 1:
-                return next(iter(inter))
-            union = set().union(*sets)
-            if len(union) == 1:
-                return next(iter(union))
-            return None
-        else:
-            group = token_index.get(toks[0], set())
-            return next(iter(group)) if len(group) == 1 else None
-
-    friends_by_name = {}
-    for _, row in df.iterrows():
-        me = row["__CAN_NAME__"]
-        flist_raw = _parse_friends(row[fcol])
-        resolved = set()
-        for fr in flist_raw:
-            r = resolve_friend(fr)
-            if r and r != me:
-                resolved.add(r)
-        friends_by_name[me] = resolved
-
-    mutual_pairs = set()
-    for a, flist in friends_by_name.items():
-        for b in flist:
-            if b in friends_by_name and a in friends_by_name[b]:
-                mutual_pairs.add(tuple(sorted([a,b])))
-
-    rows = []
-    for a, b in sorted(mutual_pairs):
-        ta = class_by_name.get(a, "")
-        tb = class_by_name.get(b, "")
-        if ta and tb and ta != tb:
-            rows.append({
-                "A": name_to_original.get(a, a), "A_ΤΜΗΜΑ": ta,
-                "B": name_to_original.get(b, b), "B_ΤΜΗΜΑ": tb,
-            })
-    return pd.DataFrame(rows)
+    `ready=False` (π.χ. όσο διαβάζονται ακόμη sheets) → το κουμπί μένει ανενεργό. Το `build` τρέχει σε άλλο
+    thread μετά το τέλος του rerun: ό,τι χρησιμοποιεί από μεταβλητές βρόχου δένεται ως default όρισμα.
+    """
+    ready_key = "report_ready::" + "::".join(map(str, cache_key))
+    if st.session_state.get(ready_key):
+        data = RESULT_STORE.get(ready_key, store_scope)
+        if data is not None:
+            st.download_button(label, data=data, file_name=file_name, mime=mime, **kwargs)
+            return
+        if jobs.get(ready_key) is None:  # εκτοπίστηκε → ξαναχτίζεται
+            jobs.submit(ready_key, partial(_built_bytes, build))
+    future = jobs.get(ready_key)
+    if future is None:
+        st.button(f"⚙️ Προετοιμασία — {label}", key=f"prep::{ready_key}", disabled=not ready,
+                  help=None if ready else "Διαθέσιμο μόλις διαβαστούν όλα τα sheets",
+                  on_click=jobs.submit, args=(ready_key, partial(_built_bytes, build)))
+        return
+    if not future.done():
+        st.button(f"⏳ Δημιουργία — {label}", key=f"prep::{ready_key}", disabled=True)
+        return
+    jobs.pop(ready_key)
+    try:
+        data = future.result()
+    except Exception as e:
+        st.error(f"❌ Σφάλμα δημιουργίας αναφοράς: {e}")
+        return
+    RESULT_STORE.put(ready_key, data, store_scope)
+    st.session_state[ready_key] = True
+    st.download_button(label, data=data, file_name=file_name, mime=mime, **kwargs)
 
 # ---------------------------
-# Broken friendships per student (counts + names)
+# Αναλυτικοί πίνακες: μόνο το sheet που επιλέγεται, μία σελίδα τη φορά
 # ---------------------------
 
-def compute_broken_friend_names_per_student(df: pd.DataFrame):
-    """Return (counts_series, names_series) per student for σπασμένες πλήρως αμοιβαίες δυάδες."""
-    if not {"ΟΝΟΜΑ", "ΤΜΗΜΑ"}.issubset(df.columns):
-        return pd.Series([0]*len(df), index=df.index), pd.Series([""]*len(df), index=df.index)
+DETAIL_PAGE_ROWS = max(10, int(os.environ.get("SIMPLE100_PAGE_ROWS", "100") or 100))
 
-    df_local = df.copy()
-    df_local["__CAN_NAME__"] = df_local["ΟΝΟΜΑ"].map(_canon_name)
-    canon_to_display = dict(zip(df_local["__CAN_NAME__"], df_local["ΟΝΟΜΑ"].astype(str)))
 
-    broken_df = list_broken_mutual_pairs(df_local)
-    broken_map = {cn: [] for cn in df_local["__CAN_NAME__"]}
+def paged_dataframe(df: pd.DataFrame, key: str, page_rows: int = DETAIL_PAGE_ROWS, **kwargs):
+    """`st.dataframe` για μία σελίδα του `df`: στον browser στέλνονται `page_rows` γραμμές, όχι ολόκληρος ο πίνακας."""
+    pages = max(1, -(-len(df) // page_rows))
+    if pages == 1:
+        st.dataframe(df, use_container_width=True, **kwargs)
+        return
+    page = st.number_input(f"Σελίδα (από {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    start = (int(page) - 1) * page_rows
+    st.caption(f"Γραμμές {start + 1}–{min(start + page_rows, len(df))} από {len(df)}")
+    st.dataframe(df.iloc[start:start + page_rows], use_container_width=True, **kwargs)
 
-    for _, row in broken_df.iterrows():
-        a = _canon_name(row.get("A", "")) if "A" in row else ""
-        b = _canon_name(row.get("B", "")) if "B" in row else ""
-        if a and b:
-            broken_map.setdefault(a, []).append(canon_to_display.get(b, row.get("B", "")))
-            broken_map.setdefault(b, []).append(canon_to_display.get(a, row.get("A", "")))
 
-    counts, names = [], []
-    for cn in df_local["__CAN_NAME__"]:
-        lst = broken_map.get(cn, []) or []
-        counts.append(len(lst))
-        names.append(", ".join(lst))
-    return pd.Series(counts, index=df.index), pd.Series(names, index=df.index)
+def detail_sheet(key: str):
+    """Επιλογή ενός sheet για αναλυτική προβολή (κανένα στην αρχή → δεν υπολογίζεται/στέλνεται τίποτα)."""
+    return st.selectbox("Sheet", options=wb.sheet_names, index=None, placeholder="— Διάλεξε sheet —", key=key)
 
 # ---------------------------
-# Conflicts per student (NO pairs)
+# Workbook cache (ανά hash περιεχομένου)
 # ---------------------------
 
-def _parse_conflict_targets(cell):
-    raw = str(cell) if cell is not None else ""
-    raw = raw.strip()
-    if not raw:
-        return []
-    if raw.startswith("[") and raw.endswith("]"):
-        try:
-            val = ast.literal_eval(raw)
-            if isinstance(val, (list, tuple)):
-                return [_canon_name(x) for x in val if str(x).strip()]
-        except Exception:
-            pass
-        raw2 = raw.strip("[]")
-        parts = re.split(r"[;,]", raw2)
-        return [_canon_name(p) for p in parts if _canon_name(p)]
-    parts = [p for p in _SPLIT_RE.split(raw) if p]
-    return [_canon_name(p) for p in parts if _canon_name(p)]
-
-
-def _build_name_resolution(df: pd.DataFrame):
-    df = df.copy()
-    df["__CAN_NAME__"] = df["ΟΝΟΜΑ"].map(_canon_name)
-    name_to_original = dict(zip(df["__CAN_NAME__"], df["ΟΝΟΜΑ"].astype(str)))
-    class_by_name = dict(zip(df["__CAN_NAME__"], df["ΤΜΗΜΑ"].astype(str).str.strip()))
-    token_index = {}
-    for full in df["__CAN_NAME__"]:
-        tokens = [t for t in re.split(r"\s+", full) if t]
-        for t in tokens:
-            token_index.setdefault(t, set()).add(full)
-    def resolve_name(s: str):
-        s = _canon_name(s)
-        if not s:
-            return None
-        if s in name_to_original:
-            return s
-        toks = [t for t in re.split(r"\s+", s) if t]
-        if not toks:
-            return None
-        if len(toks) >= 2:
-            sets = [token_index.get(t, set()) for t in toks]
-            inter = set.intersection(*sets) if sets else set()
-            if len(inter) == 1:
-                return next(iter(inter))
-            union = set().union(*sets)
-            if len(union) == 1:
-                return next(iter(union))
-            return None
-        else:
-            group = token_index.get(toks[0], set())
-            return next(iter(group)) if len(group) == 1 else None
-    return name_to_original, class_by_name, resolve_name
-
-
-def compute_conflict_counts_and_names(df: pd.DataFrame):
-    """
-    Return (counts_series, names_series) per student.
-    - counts_series: πόσοι από τους δηλωμένους βρίσκονται στην **ίδια τάξη** (μονόπλευρη δήλωση αρκεί).
-    - names_series: ονόματα αυτών των μαθητών (comma-separated).
-    """
-    required = {"ΟΝΟΜΑ", "ΤΜΗΜΑ", "ΣΥΓΚΡΟΥΣΗ"}
-    if not required.issubset(set(df.columns)):
-        return pd.Series([0]*len(df), index=df.index), pd.Series([""]*len(df), index=df.index)
-
-    name_to_original, class_by_name, resolve_name = _build_name_resolution(df)
-
-    canon_names = df["ΟΝΟΜΑ"].map(_canon_name)
-    counts = [0]*len(df)
-    names = [""]*len(df)
-
-    index_by_canon = {cn: i for i, cn in enumerate(canon_names)}
+def disk_cache():
+    """Η μόνιμη cache στο δίσκο (βλ. `DiskCache`) — ίδιος φάκελος για όλες τις συνεδρίες."""
+    return DiskCache(DEFAULT_DISK_CACHE_DIR, DISK_CACHE_MAX_MB)
 
-    for i, row in df.iterrows():
-        me = _canon_name(row["ΟΝΟΜΑ"])
-        my_class = class_by_name.get(me, "")
-        targets = _parse_conflict_targets(row["ΣΥΓΚΡΟΥΣΗ"])
-        same_class_names = []
-        for t in targets:
-            r = resolve_name(t)
-            if r and r != me:
-                if class_by_name.get(r, None) == my_class and my_class:
-                    same_class_names.append(name_to_original.get(r, r))
-        counts[index_by_canon.get(me, i)] = len(same_class_names)
-        names[index_by_canon.get(me, i)] = ", ".join(same_class_names)
 
-    return pd.Series(counts, index=df.index), pd.Series(names, index=df.index)
+def workbook_key(digest: str, profile: bool, fuzzy: int) -> tuple:
+    """Key του κοινού `WorkbookData` στο `RESULT_STORE` (βλ. `load_workbook`)."""
+    return "workbook", digest, profile, fuzzy
 
-# ---------------------------
-# Stats generator
-# ---------------------------
-
-def generate_stats(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    if "ΤΜΗΜΑ" in df:
-        df["ΤΜΗΜΑ"] = df["ΤΜΗΜΑ"].apply(lambda v: v.strip() if isinstance(v, str) else v)
-    if "ΦΥΛΟ" in df:
-        df["ΦΥΛΟ"] = df["ΦΥΛΟ"].fillna("").astype(str).str.strip().str.upper()
-    for col in ["ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ","ΖΩΗΡΟΣ","ΙΔΙΑΙΤΕΡΟΤΗΤΑ","ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ"]:
-        if col in df:
-            s = df[col]
-            if s.dtype == object:
-                s = s.fillna("").astype(str).str.strip().str.upper().replace({
-                    "ΝΑΙ":"Ν","NAI":"Ν","YES":"Ν","Y":"Ν",
-                    "ΟΧΙ":"Ο","OXI":"Ο","NO":"Ο","N":"Ο","": "Ο"
-                })
-                df[col] = s.where(s.isin(["Ν","Ο"]), other="Ο")
-
-    boys = df[df.get("ΦΥΛΟ", "").eq("Α")].groupby("ΤΜΗΜΑ").size() if "ΦΥΛΟ" in df else pd.Series(dtype=int)
-    girls = df[df.get("ΦΥΛΟ", "").eq("Κ")].groupby("ΤΜΗΜΑ").size() if "ΦΥΛΟ" in df else pd.Series(dtype=int)
-    educators = df[df.get("ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ", "").eq("Ν")].groupby("ΤΜΗΜΑ").size() if "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ" in df else pd.Series(dtype=int)
-    energetic = df[df.get("ΖΩΗΡΟΣ", "").eq("Ν")].groupby("ΤΜΗΜΑ").size() if "ΖΩΗΡΟΣ" in df else pd.Series(dtype=int)
-    special = df[df.get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "").eq("Ν")].groupby("ΤΜΗΜΑ").size() if "ΙΔΙΑΙΤΕΡΟΤΗΤΑ" in df else pd.Series(dtype=int)
-    greek = df[df.get("ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ", "").eq("Ν")].groupby("ΤΜΗΜΑ").size() if "ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ" in df else pd.Series(dtype=int)
-    total = df.groupby("ΤΜΗΜΑ").size() if "ΤΜΗΜΑ" in df else pd.Series(dtype=int)
-
-    # Broken friendships per class
-    try:
-        pairs = list_broken_mutual_pairs(df)
-        if pairs.empty:
-            broken = pd.Series({tmima: 0 for tmima in df["ΤΜΗΜΑ"].dropna().astype(str).str.strip().unique()})
-        else:
-            counts = {}
-            for _, row in pairs.iterrows():
-                a_c = str(row["A_ΤΜΗΜΑ"]).strip(); b_c = str(row["B_ΤΜΗΜΑ"]).strip()
-                counts[a_c] = counts.get(a_c, 0) + 1
-                counts[b_c] = counts.get(b_c, 0) + 1
-            broken = pd.Series(counts).astype(int)
-    except Exception:
-        broken = pd.Series(dtype=int)
-
-    # Conflicts per class = sum of per-student counts (no pairs)
-    try:
-        conf_counts, _conf_names = compute_conflict_counts_and_names(df)
-        if "ΤΜΗΜΑ" in df:
-            cls = df["ΤΜΗΜΑ"].astype(str).str.strip()
-            conflict_by_class = conf_counts.groupby(cls).sum().astype(int)
-        else:
-            conflict_by_class = pd.Series(dtype=int)
-    except Exception:
-        conflict_by_class = pd.Series(dtype=int)
-
-    stats = pd.DataFrame({
-        "ΑΓΟΡΙΑ": boys,
-        "ΚΟΡΙΤΣΙΑ": girls,
-        "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": educators,
-        "ΖΩΗΡΟΙ": energetic,
-        "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": special,
-        "ΓΝΩΣΗ ΕΛΛΗΝΙΚΩΝ": greek,
-        "ΣΥΓΚΡΟΥΣΗ": conflict_by_class,
-        "ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ": broken,
-        "ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ": total,
-    }).fillna(0).astype(int)
-
-    if hasattr(stats.index, "str"):
-        stats = stats.loc[stats.index.str.lower() != "nan"]
-    try:
-        stats = stats.sort_index(key=lambda x: x.str.extract(r"(\d+)")[0].astype(float))
-    except Exception:
-        stats = stats.sort_index()
-    return stats
 
-# ---------------------------
-# Export helpers
-# ---------------------------
+def load_workbook(digest: str, data: bytes, workers: int = 1, mode: str = "process", engine: str = "python",
+                  profile: bool = False, use_disk_cache: bool = False, fuzzy: int = FUZZY_MAX_DISTANCE) -> WorkbookData:
+    """Parse κάθε sheet + `auto_rename_columns` + ανάλυση μία φορά ανά περιεχόμενο.
 
-def export_stats_to_excel(stats_df: pd.DataFrame) -> BytesIO:
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        stats_df.to_excel(writer, index=True, sheet_name="Στατιστικά", index_label="ΤΜΗΜΑ")
-        wb = writer.book
-        ws = writer.sheets["Στατιστικά"]
-        header_fmt = wb.add_format({"bold": True, "valign":"vcenter", "text_wrap": True, "border":1})
-        for col_idx, value in enumerate(["ΤΜΗΜΑ"] + list(stats_df.columns)):
-            ws.write(0, col_idx, value, header_fmt)
-        for i in range(0, len(stats_df.columns)+1):
-            ws.set_column(i, i, 18)
-    output.seek(0)
-    return output
-
-
-def sanitize_sheet_name(s: str) -> str:
-    s = str(s or "")
-    s = re.sub(r'[:\\/?*\\[\\]]', ' ', s)
-    return s[:31] if s else "SHEET"
+    Το έτοιμο `WorkbookData` μένει στο `RESULT_STORE` ως κοινή εγγραφή (key: hash περιεχομένου — μόνο όποιος
+    ανέβασε το ίδιο αρχείο τη βρίσκει). Ο τρόπος εκτέλεσης, η μηχανή και η cache δίσκου δεν αλλάζουν το
+    αποτέλεσμα, γι' αυτό δεν είναι μέρος του key· το `fuzzy` αλλάζει τις αντιστοιχίσεις και το `profile` κρατά
+    χρόνους. Αλλιώς η ανάγνωση τρέχει ως `WorkbookJob` στο παρασκήνιο της συνεδρίας· ως τότε επιστρέφεται
+    μερικό στιγμιότυπο (`wb.pending` = sheets που δεν έχουν διαβαστεί) ή None αν δεν έχει ανοίξει ακόμη το
+    αρχείο. Τα sheets μοιράζονται σε `workers` workers (βλ. `iter_process_sheets`)· με `profile` η ανάγνωση
+    γίνεται σειριακά και οι χρόνοι μένουν στο `wb.profiler`. Με `use_disk_cache` τα αποτελέσματα
+    διαβάζονται/γράφονται και στη μόνιμη cache (επιβιώνει επανεκκινήσεις).
+    """
+    key = workbook_key(digest, profile, fuzzy)
+    wb_data = RESULT_STORE.get(key)
+    if wb_data is not None:
+        return wb_data
+    if st.session_state.get("jobs::workbook", (None,))[0] != key:
+        job = WorkbookJob(data, workers, mode, digest, engine, disk_cache() if use_disk_cache else None, fuzzy,
+                          profile, on_progress=jobs.touch)
+        jobs.submit(key, job.run, cancel=job.cancel)
+        st.session_state["jobs::workbook"] = (key, job)
+    job = st.session_state["jobs::workbook"][1]
+    if job.error is not None:
+        raise job.error
+    if job.result is not None and RESULT_STORE.put(key, job.result, nbytes=job.nbytes):
+        # από εδώ και πέρα μέσω της κοινής cache (αν δεν χωρά, μένει στη συνεδρία)
+        del st.session_state["jobs::workbook"]
+        jobs.pop(key)
+    return job.snapshot()
 
 # ---------------------------
 # Upload (with resettable key)
 # ---------------------------
 
+with st.sidebar.expander("⚙️ Ρυθμίσεις επεξεργασίας", expanded=False):
+    _max_workers = max(1, os.cpu_count() or 1)
+    parallel_workers = st.number_input("Workers (1 = σειριακά)", min_value=1, max_value=max(_max_workers, DEFAULT_WORKERS),
+                                       value=DEFAULT_WORKERS, step=1)
+    parallel_mode = st.radio("Τρόπος", PARALLEL_MODES, horizontal=True,
+                             index=PARALLEL_MODES.index(DEFAULT_PARALLEL_MODE) if DEFAULT_PARALLEL_MODE in PARALLEL_MODES else 0)
+    analysis_engine = st.radio("Μηχανή ανάλυσης", ENGINES, horizontal=True,
+                               index=ENGINES.index(DEFAULT_ENGINE) if DEFAULT_ENGINE in ENGINES else 0,
+                               help="sparse: ακέραια ids + αραιοί πίνακες, όλα τα sheets μαζί (ίδια αποτελέσματα)")
+    profile_enabled = st.checkbox("⏱️ Profiling (χρόνος/μνήμη ανά στάδιο)", value=DEFAULT_PROFILE,
+                                  help="Σειριακή ανάγνωση + tracemalloc (κοινό για τη διεργασία, όσο κάποια συνεδρία "
+                                       "το έχει ενεργό)· πίνακας χρόνων στο κάτω μέρος της σελίδας")
+    fuzzy_distance = st.number_input("🔤 Ανοχή λαθών στα ονόματα (0 = μόνο ακριβή)", min_value=0, max_value=3,
+                                     value=FUZZY_MAX_DISTANCE, step=1,
+                                     help="Διορθώσεις ανά λέξη (1 ανά 4 γράμματα) για δηλώσεις φίλων/συγκρούσεων "
+                                          "που δεν ταιριάζουν ακριβώς· μόνο όταν ο πλησιέστερος είναι μοναδικός")
+    disk_cache_enabled = st.checkbox(
+        "💾 Μόνιμη cache στο δίσκο", value=DEFAULT_DISK_CACHE and DISK_CACHE_AVAILABLE, disabled=not DISK_CACHE_AVAILABLE,
+        help="Κρατά τα αποτελέσματα ανά sheet στον server (parquet), ώστε το ίδιο αρχείο να φορτώνει αμέσως και "
+             "μετά από επανεκκίνηση. Απενεργοποίησέ το όπου δεν επιτρέπεται αποθήκευση δεδομένων (GDPR)."
+             + ("" if DISK_CACHE_AVAILABLE else " Χρειάζεται το πακέτο pyarrow."))
+    export_format = st.radio("📄 Μορφή λήψεων", EXPORT_FORMATS, horizontal=True, format_func=FORMAT_LABELS.get,
+                             help="Parquet/CSV: ένας πίνακας χωρίς μορφοποίηση (για άλλα εργαλεία)· οι αναφορές "
+                                  "όλων των sheets γίνονται ένας πίνακας με στήλη ΣΕΝΑΡΙΟ")
+    _store = RESULT_STORE.stats()
+    st.caption(f"Cache μνήμης (όλες οι συνεδρίες): {_store['entries']} εγγραφές · "
+               f"{_store['bytes'] / 2**20:.1f}/{_store['max_bytes'] / 2**20:.0f} MB · hits {_store['hits']} · "
+               f"misses {_store['misses']} · evictions {_store['evictions']}")
+    if DISK_CACHE_AVAILABLE and os.path.isdir(DEFAULT_DISK_CACHE_DIR):
+        _entries, _bytes = disk_cache().usage()
+        st.caption(f"Cache δίσκου: {_entries} εγγραφές · {_bytes / 2**20:.1f}/{DISK_CACHE_MAX_MB:.0f} MB")
+        if _entries and st.button("🗑️ Άδειασμα cache δίσκου"):
+            disk_cache().clear()
+            st.rerun()
+
 st.markdown("### 📥 Εισαγωγή Αρχείου Excel")
 uploaded = st.file_uploader(
     "Επίλεξε **Excel** με ένα ή περισσότερα sheets (σενάρια)",
@@ -479,48 +285,76 @@ uploaded = st.file_uploader(
     key=f"uploader_{st.session_state['uploader_key']}"
 )
 
+# Νέο αρχείο (ή ρυθμίσεις που αλλάζουν το αποτέλεσμα) → οι εργασίες του προηγούμενου ακυρώνονται.
+file_key = None
+if uploaded:
+    file_bytes = uploaded.getvalue()
+    file_key = (content_hash(file_bytes), profile_enabled, int(fuzzy_distance))
+if st.session_state.get("jobs::file") != file_key:
+    jobs.cancel_all()
+    st.session_state.pop("jobs::workbook", None)
+    st.session_state["jobs::file"] = file_key
+
 if not uploaded:
     st.info("➕ Ανέβασε ένα Excel για να συνεχίσεις.")
     st.stop()
 
 try:
-    xl = pd.ExcelFile(uploaded)
-    st.success(f"✅ Επεξεργασία αρχείου: **{uploaded.name}** — Βρέθηκαν {len(xl.sheet_names)} sheet(s).")
+    wb = load_workbook(file_key[0], file_bytes, parallel_workers, parallel_mode, analysis_engine,
+                       profile_enabled, disk_cache_enabled, int(fuzzy_distance))
 except Exception as e:
     st.error(f"❌ Σφάλμα ανάγνωσης: {e}")
     st.stop()
 
+if wb is None or wb.pending:
+    n_done = 0 if wb is None else len(wb.sheet_names)
+    n_total = None if wb is None else n_done + len(wb.pending)
+    st.progress(n_done / n_total if n_total else 0.0,
+                text=f"⏳ Επεξεργασία αρχείου: **{uploaded.name}** — {n_done}/{n_total or '…'} sheet(s)")
+    if not n_done:
+        watch_jobs()
+        st.stop()
+    st.caption(" · ".join([f"✅ {s}" for s in wb.sheet_names] + [f"⏳ {s}" for s in wb.pending]))
+    st.info("Τα αποτελέσματα εμφανίζονται για όσα sheets έχουν ήδη διαβαστεί· οι αναφορές όλων των sheets "
+            "ενεργοποιούνται μόλις τελειώσει η ανάγνωση.")
+else:
+    st.success(f"✅ Επεξεργασία αρχείου: **{uploaded.name}** — Βρέθηκαν {len(wb.sheet_names)} sheet(s).")
+
+# Profiler της συνεδρίας: οι χρόνοι ανάγνωσης + ό,τι υπολογίζεται στα tabs (αναλύσεις, στατιστικά, αναφορές).
+session_profiler = None
+if profile_enabled:
+    session_profiler = st.session_state.get(f"profiler::{wb.digest}")
+    if session_profiler is None:
+        session_profiler = st.session_state[f"profiler::{wb.digest}"] = Profiler()
+    if wb.profiler is not None and not st.session_state.get(f"profiler::{wb.digest}::read"):
+        session_profiler.records.extend(wb.profiler.records)
+        st.session_state[f"profiler::{wb.digest}::read"] = True
+# Το tracemalloc είναι κοινό για όλες τις συνεδρίες: η συνεδρία το κρατά με δικό της κάτοχο (όχι το thread του rerun)
+use_profiler(session_profiler, owner=st.session_state.setdefault("profiler::owner", TracingOwner()))
+
 # ---------------------------
 # Tabs (NO conflict pairs tab)
 # ---------------------------
 
-tab_stats, tab_broken, tab_mass = st.tabs([
+tab_stats, tab_broken, tab_mass, tab_compare = st.tabs([
     "📊 Στατιστικά (1 sheet)",
     "🧩 Σπασμένες αμοιβαίες (όλα τα sheets) — Έξοδος: Πλήρες αντίγραφο + Σύνοψη",
     "🧾 Μαθητές με σύγκρουση στην ίδια τάξη",
+    "🏆 Σύγκριση σεναρίων",
 ])
 
 with tab_stats:
     st.subheader("📊 Υπολογισμός Στατιστικών για Επιλεγμένο Sheet")
-    sheet = st.selectbox("Διάλεξε sheet", options=xl.sheet_names, index=0)
-    df_raw = xl.parse(sheet_name=sheet)
-    df_norm, ren_map = auto_rename_columns(df_raw)
+    # Η επιλογή κρατιέται όσο προστίθενται sheets (νέες επιλογές → νέο widget)
+    prev_sheet = st.session_state.get("stats::sheet")
+    sheet = st.selectbox("Διάλεξε sheet", options=wb.sheet_names,
+                         index=wb.sheet_names.index(prev_sheet) if prev_sheet in wb.sheet_names else 0)
+    st.session_state["stats::sheet"] = sheet
+    df_norm, ren_map = wb.norm[sheet], wb.ren_maps[sheet]
+    analysis = wb.analysis(sheet)
 
-    # ✅ Μετρητής ΣΥΓΚΡΟΥΣΗ & ονόματα (χωρίς ζεύγη A–B)
-    try:
-        conflict_counts, conflict_names = compute_conflict_counts_and_names(df_norm)
-        df_with = df_norm.copy()
-        df_with["ΣΥΓΚΡΟΥΣΗ"] = conflict_counts.astype(int)
-        df_with["ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ"] = conflict_names
-        # 🧩 Σπασμένες αμοιβαίες ανά μαθητή (μετρητής + ονόματα)
-        try:
-            broken_counts_ps, broken_names_ps = compute_broken_friend_names_per_student(df_norm)
-            df_with["ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ"] = broken_counts_ps.astype(int)
-            df_with["ΣΠΑΣΜΕΝΗ_ΦΙΛΙΑ_ΟΝΟΜΑ"] = broken_names_ps
-        except Exception:
-            pass
-    except Exception:
-        df_with = df_norm
+    # ✅ Μετρητής ΣΥΓΚΡΟΥΣΗ & ονόματα (χωρίς ζεύγη A–B) + 🧩 σπασμένες αμοιβαίες ανά μαθητή
+    df_with = students_with_conflicts(df_norm, analysis)
 
     missing = [c for c in REQUIRED_COLS if c not in df_norm.columns]
     with st.expander("🔎 Διάγνωση/Μετονομασίες", expanded=False):
@@ -532,30 +366,22 @@ with tab_stats:
 
     if not missing:
         with st.expander("👁️ Πίνακας μαθητών (με ΣΥΓΚΡΟΥΣΗ & ονόματα)", expanded=False):
-            st.dataframe(df_with, use_container_width=True)
-            # Λήψη ως Excel
-            bio_conf = BytesIO()
-            with pd.ExcelWriter(bio_conf, engine="xlsxwriter") as writer:
-                df_with.to_excel(writer, index=False, sheet_name="Μαθητές_Σύγκρουση")
-            bio_conf.seek(0)
-            st.download_button(
-                "⬇️ Κατέβασε πίνακα μαθητών (με ΣΥΓΚΡΟΥΣΗ & ονόματα)",
-                data=bio_conf.getvalue(),
-                file_name=f"students_conflicts_{sanitize_sheet_name(sheet)}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            paged_dataframe(df_with, key=f"details::page::{wb.digest}::{sheet}::students")
+            lazy_download_button(
+                f"⬇️ Κατέβασε πίνακα μαθητών (με ΣΥΓΚΡΟΥΣΗ & ονόματα, {FORMAT_LABELS[export_format]})",
+                (lambda df_out=df_with: export_frames_to_excel({"Μαθητές_Σύγκρουση": df_out})) if export_format == "xlsx"
+                else (lambda df_out=df_with, fmt=export_format: export_table(df_out, fmt)),
+                cache_key=("students_conflicts", wb.digest, sheet, export_format),
+                file_name=f"students_conflicts_{sanitize_sheet_name(sheet)}.{export_format}",
+                mime=EXPORT_MIME[export_format],
             )
 
         # 🧮 Στατιστικά ανά τμήμα
-        stats_df = generate_stats(df_norm)
+        stats_df = generate_stats(df_norm, analysis)
         # Διασφάλιση ύπαρξης στήλης "ΣΥΓΚΡΟΥΣΗ" στα στατιστικά
         if "ΣΥΓΚΡΟΥΣΗ" not in stats_df.columns:
             try:
-                conf_counts, _conf_names = compute_conflict_counts_and_names(df_norm)
-                if "ΤΜΗΜΑ" in df_norm:
-                    cls = df_norm["ΤΜΗΜΑ"].astype(str).str.strip()
-                    conflict_by_class = conf_counts.groupby(cls).sum().astype(int)
-                else:
-                    conflict_by_class = pd.Series(dtype=int)
+                conflict_by_class = analysis.conflict_by_class()
                 stats_df["ΣΥΓΚΡΟΥΣΗ"] = [int(conflict_by_class.get(str(idx).strip(), 0)) for idx in stats_df.index]
                 cols = list(stats_df.columns)
                 if "ΣΠΑΣΜΕΝΗ ΦΙΛΙΑ" in cols:
@@ -565,68 +391,147 @@ with tab_stats:
                 pass
 
         st.dataframe(stats_df, use_container_width=True)
-        st.download_button(
-            "💾 Λήψη Πίνακα Στατιστικών (Excel)",
-            data=export_stats_to_excel(stats_df).getvalue(),
-            file_name=f"statistika_{sanitize_sheet_name(sheet)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        lazy_download_button(
+            f"💾 Λήψη Πίνακα Στατιστικών ({FORMAT_LABELS[export_format]})",
+            (lambda df_out=stats_df: export_stats_to_excel(df_out)) if export_format == "xlsx"
+            else (lambda df_out=stats_df, fmt=export_format: export_table(df_out, fmt, index_label="ΤΜΗΜΑ")),
+            cache_key=("stats", wb.digest, sheet, export_format),
+            file_name=f"statistika_{sanitize_sheet_name(sheet)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+            mime=EXPORT_MIME[export_format],
             type="primary"
         )
+
+        # 🔀 What-if: μετακίνηση μαθητή (incremental — χωρίς νέα ανάλυση)
+        with st.expander("🔀 Τι θα γίνει αν… (μετακίνηση μαθητή)", expanded=False):
+            wi_key = f"whatif::{wb.digest}::{sheet}"
+            if wi_key not in st.session_state:
+                st.session_state[wi_key] = WhatIf(analysis)
+            wi = st.session_state[wi_key]
+
+            c1, c2 = st.columns(2)
+            student = c1.selectbox(
+                "Μαθητής", options=sorted(wi.rows_of, key=lambda cn: analysis.name_to_original.get(cn, cn)),
+                format_func=lambda cn: f"{analysis.name_to_original.get(cn, cn)} ({wi.class_by_name.get(cn, '')})",
+                key=f"{wi_key}::student",
+            )
+            target = c2.selectbox("Νέο ΤΜΗΜΑ", options=wi.class_options(), key=f"{wi_key}::target")
+            b1, b2, b3 = st.columns(3)
+            b1.button("➡️ Μετακίνηση", key=f"{wi_key}::move", on_click=wi.move, args=(student, target),
+                      disabled=student is None or not target)
+            b2.button("↩️ Αναίρεση", key=f"{wi_key}::undo", on_click=wi.undo, disabled=not wi.moves)
+            b3.button("🧹 Επαναφορά", key=f"{wi_key}::reset", on_click=st.session_state.pop, args=(wi_key, None),
+                      disabled=not wi.moves)
+
+            wi_stats = wi.stats()
+            m1, m2 = st.columns(2)
+            m1.metric("Σπασμένες Δυάδες", len(wi.broken), delta=len(wi.broken) - len(list_broken_mutual_pairs(df_norm, analysis)),
+                      delta_color="inverse")
+            m2.metric("Συγκρούσεις στην ίδια τάξη", int(wi_stats["ΣΥΓΚΡΟΥΣΗ"].sum()),
+                      delta=int(wi_stats["ΣΥΓΚΡΟΥΣΗ"].sum() - stats_df["ΣΥΓΚΡΟΥΣΗ"].sum()), delta_color="inverse")
+            st.dataframe(wi_stats, use_container_width=True)
+            if wi.moves:
+                st.markdown("**Μετακινήσεις**")
+                st.dataframe(wi.moves_table(), use_container_width=True, hide_index=True)
+                # Στιγμιότυπο τώρα: οι μετακινήσεις/αναιρέσεις αλλάζουν το `wi` ενώ το αρχείο χτίζεται στο παρασκήνιο
+                lazy_download_button(
+                    "⬇️ Κατέβασε μετακινήσεις & νέα στατιστικά (Excel)",
+                    lambda tables=(wi.moves_table(), wi_stats, wi.moved_df()): export_whatif_tables(*tables),
+                    cache_key=("whatif", wb.digest, sheet, tuple(m[:3] for m in wi.moves)),
+                    file_name=f"whatif_{sanitize_sheet_name(sheet)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                )
+
+        # 🤖 Αυτόματη βελτίωση: τοπική αναζήτηση ανταλλαγών/μετακινήσεων (incremental πάνω στο What-if)
+        with st.expander("🤖 Αυτόματη βελτίωση κατανομής (ανταλλαγές μαθητών)", expanded=False):
+            opt_key = f"optimize::{wb.digest}::{sheet}"
+            o1, o2, o3, o4 = st.columns(4)
+            opt_budget = o1.number_input("Χρόνος (s)", min_value=0.5, max_value=60.0, value=float(OPTIMIZE_TIME_BUDGET),
+                                         step=0.5, key=f"{opt_key}::budget")
+            opt_seed = o2.number_input("Seed", min_value=0, value=0, step=1, key=f"{opt_key}::seed")
+            w_broken = o3.number_input("Βάρος σπασμένων", min_value=0.0, value=1.0, step=0.5, key=f"{opt_key}::wb")
+            w_conflict = o4.number_input("Βάρος συγκρούσεων", min_value=0.0, value=1.0, step=0.5, key=f"{opt_key}::wc")
+            with st.popover("⚖️ Όρια ισορροπίας (max − min ανά τμήμα)"):
+                tolerance = {c: st.number_input(c, min_value=0, value=int(t), step=1, key=f"{opt_key}::tol::{c}")
+                             for c, t in DEFAULT_BALANCE_TOLERANCE.items()}
+            if st.button("🚀 Βελτιστοποίηση", key=f"{opt_key}::run", disabled=jobs.get(opt_key) is not None):
+                st.session_state.pop(opt_key, None)
+                jobs.submit(opt_key, partial(
+                    optimize_classes, analysis, time_budget=float(opt_budget), seed=int(opt_seed),
+                    broken_weight=w_broken, conflict_weight=w_conflict, tolerance=tolerance))
+            opt_future = jobs.get(opt_key)
+            if opt_future is not None and not opt_future.done():
+                st.info(f"⏳ Βελτιστοποίηση σε εξέλιξη (έως {float(opt_budget):.1f}s)…")
+            elif opt_future is not None:
+                jobs.pop(opt_key)
+                try:
+                    st.session_state[opt_key] = opt_future.result()
+                except Exception as e:
+                    st.error(f"❌ Σφάλμα βελτιστοποίησης: {e}")
+            result = st.session_state.get(opt_key)
+            if result is not None:
+                st.caption(f"{result.iterations} δοκιμές σε {result.elapsed:.1f}s · {result.accepted} αποδεκτές · "
+                           f"{len(result.whatif.moves)} μαθητές άλλαξαν τμήμα")
+                st.dataframe(result.summary(), use_container_width=True)
+                if result.whatif.moves:
+                    st.dataframe(result.whatif.moves_table(), use_container_width=True, hide_index=True)
+                    lazy_download_button(
+                        "⬇️ Κατέβασε αρχείο με το βελτιωμένο σενάριο ως νέο sheet",
+                        lambda sheet=sheet, result=result: build_optimized_report(wb, sheet, result),
+                        cache_key=("optimized", wb.digest, sheet, tuple(m[:3] for m in result.whatif.moves)),
+                        file_name=f"optimized_{sanitize_sheet_name(sheet)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                        type="primary"
+                    )
     else:
         st.info("Συμπλήρωσε/διόρθωσε τις στήλες που λείπουν στο Excel και ξαναφόρτωσέ το.")
 
 with tab_broken:
     st.subheader("🧩 Αναφορά Σπασμένων Πλήρως Αμοιβαίων Δυάδων (όλα τα sheets)")
     summary_rows = []
-    for sheet in xl.sheet_names:
-        df_raw = xl.parse(sheet_name=sheet)
-        df_norm, _ = auto_rename_columns(df_raw)
-        broken_df = list_broken_mutual_pairs(df_norm)
+    for sheet in wb.sheet_names:
+        broken_df = list_broken_mutual_pairs(wb.norm[sheet], wb.analysis(sheet))
         summary_rows.append({"Σενάριο (sheet)": sheet, "Σπασμένες Δυάδες": int(len(broken_df))})
     summary = pd.DataFrame(summary_rows).sort_values("Σενάριο (sheet)")
     st.dataframe(summary, use_container_width=True)
 
-    # Build full report: copy originals + *_BROKEN + Σύνοψη
-    def build_broken_report(xl_file: pd.ExcelFile) -> BytesIO:
-        bio = BytesIO()
-        rows = []
-        with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
-            for sheet in xl_file.sheet_names:
-                df_raw = xl_file.parse(sheet_name=sheet)
-                df_raw.to_excel(writer, index=False, sheet_name=sanitize_sheet_name(sheet))
-            for sheet in xl_file.sheet_names:
-                df_raw = xl_file.parse(sheet_name=sheet)
-                df_norm, _ = auto_rename_columns(df_raw)
-                broken_df = list_broken_mutual_pairs(df_norm)
-                rows.append({"Σενάριο (sheet)": sheet, "Σπασμένες Δυάδες": int(len(broken_df))})
-                out_name = sanitize_sheet_name(f"{sheet}_BROKEN")
-                if broken_df.empty:
-                    pd.DataFrame({"info": ["— καμία σπασμένη —"]}).to_excel(writer, index=False, sheet_name=out_name)
-                else:
-                    broken_df.to_excel(writer, index=False, sheet_name=out_name)
-            pd.DataFrame(rows).sort_values("Σενάριο (sheet)").to_excel(writer, index=False, sheet_name="Σύνοψη")
-        bio.seek(0)
-        return bio
-
-    st.download_button(
-        "⬇️ Κατέβασε αναφορά (Πλήρες αντίγραφο + σπασμένες + σύνοψη)",
-        data=build_broken_report(xl).getvalue(),
-        file_name=f"broken_friends_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # Full report: copy originals + *_BROKEN + Σύνοψη (Parquet/CSV: μόνο τα ζεύγη όλων των sheets, με ΣΕΝΑΡΙΟ)
+    if export_format == "xlsx":
+        lazy_download_button(
+            "⬇️ Κατέβασε αναφορά (Πλήρες αντίγραφο + σπασμένες + σύνοψη)",
+            lambda: build_broken_report(wb),
+            cache_key=("broken_report", wb.digest),
+            file_name=f"broken_friends_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+            ready=not wb.pending,
+        )
+    else:
+        lazy_download_button(
+            f"⬇️ Κατέβασε σπασμένες δυάδες όλων των sheets ({FORMAT_LABELS[export_format]})",
+            lambda fmt=export_format: export_table(broken_pairs_table(wb), fmt),
+            cache_key=("broken_report", wb.digest, export_format),
+            file_name=f"broken_friends_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+            mime=EXPORT_MIME[export_format],
+            ready=not wb.pending,
+        )
 
     with st.expander("🔍 Προβολή αναλυτικών ζευγών & διάγνωση ανά sheet"):
-        for sheet in xl.sheet_names:
-            df_raw = xl.parse(sheet_name=sheet)
-            df_norm, _ = auto_rename_columns(df_raw)
-            broken_df = list_broken_mutual_pairs(df_norm)
-            # Διάγνωση αντιστοίχισης ονομάτων
-            # (προαιρετικά μπορεί να προστεθεί λεπτομερής διάγνωση όπως στο app3)
-            st.markdown(f"**{sheet}**")
+        detail = detail_sheet("details::broken")
+        if detail is not None:
+            broken_df = list_broken_mutual_pairs(wb.norm[detail], wb.analysis(detail))
             if broken_df.empty:
                 st.info("— Καμία σπασμένη πλήρως αμοιβαία δυάδα —")
             else:
-                st.dataframe(broken_df, use_container_width=True)
+                paged_dataframe(broken_df, key=f"details::page::{wb.digest}::{detail}::broken")
+            # Διάγνωση αντιστοίχισης ονομάτων: διορθώσεις, ασαφή και χωρίς αντιστοίχιση
+            names_df = wb.analysis(detail).resolution_report()
+            if not names_df.empty:
+                st.caption("Δηλώσεις ονομάτων που δεν ταίριαξαν ακριβώς")
+                paged_dataframe(names_df, key=f"details::page::{wb.digest}::{detail}::names", hide_index=True)
+
+    lazy_download_button(
+        "⬇️ Κατέβασε διάγνωση ονομάτων (διορθώσεις / ασαφή / χωρίς αντιστοίχιση)",
+        lambda: build_resolution_report(wb),
+        cache_key=("names_report", wb.digest, wb.fuzzy),
+        file_name=f"name_resolution_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        ready=not wb.pending,
+    )
 
 # ===========================
 # 📦 Mass report (all sheets): broken friendships + conflicts (per-student only)
@@ -636,73 +541,100 @@ with tab_mass:
 
     st.subheader("🧾 Μαθητές με σύγκρουση στην ίδια τάξη")
 
-    def build_conflict_in_same_class_report(xl_file: pd.ExcelFile) -> BytesIO:
-        bio = BytesIO()
-        summary_rows = []
-        with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
-            for idx, sheet in enumerate(xl_file.sheet_names, start=1):
-                df_raw = xl_file.parse(sheet_name=sheet)
-                df_norm, _ = auto_rename_columns(df_raw)
-
-                # Υπολογισμός «ΣΥΓΚΡΟΥΣΗ» (μετρητής) και «ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ» (λίστα ονομάτων)
-                conf_counts, conf_names = compute_conflict_counts_and_names(df_norm)
-
-                df_conf = pd.DataFrame({
-                    "ΟΝΟΜΑ": df_norm.get("ΟΝΟΜΑ", pd.Series(dtype=str)),
-                    "ΤΜΗΜΑ": df_norm.get("ΤΜΗΜΑ", pd.Series(dtype=str)),
-                    "ΣΥΓΚΡΟΥΣΗ": conf_counts.astype(int),
-                    "ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ": conf_names,
-                })
-                df_conf = df_conf[df_conf["ΣΥΓΚΡΟΥΣΗ"] > 0].sort_values(["ΤΜΗΜΑ","ΟΝΟΜΑ"])
-
-                sheet_name = f"S{idx}_CONFLICT_IN_SAME_CLASS"
-                if df_conf.empty:
-                    pd.DataFrame([{"Μήνυμα": "— Καμία καταγραφή —"}]).to_excel(writer, index=False, sheet_name=sheet_name)
-                else:
-                    df_conf.to_excel(writer, index=False, sheet_name=sheet_name)
-
-                summary_rows.append({
-                    "Index": idx,
-                    "Original sheet name": sheet,
-                    "S-code": f"S{idx}",
-                    "Students with ≥1 Conflict in Same Class": int((conf_counts.fillna(0) > 0).sum()),
-                })
-            # Συνοπτική καρτέλα
-            pd.DataFrame(summary_rows).to_excel(writer, index=False, sheet_name="SUMMARY")
-        bio.seek(0)
-        return bio
-
     # Ζωντανή σύνοψη & προβολή ανά sheet
     live_rows = []
-    for sheet in xl.sheet_names:
-        df_raw = xl.parse(sheet_name=sheet)
-        df_norm, _ = auto_rename_columns(df_raw)
-        conf_counts, conf_names = compute_conflict_counts_and_names(df_norm)
+    for sheet in wb.sheet_names:
+        conf_counts, conf_names = compute_conflict_counts_and_names(wb.norm[sheet], wb.analysis(sheet))
         n_conf = int((conf_counts.fillna(0) > 0).sum())
         live_rows.append({"Σενάριο (sheet)": sheet, "Μαθητές με Σύγκρουση στην ίδια τάξη (>=1)": n_conf})
 
     st.dataframe(pd.DataFrame(live_rows).sort_values("Σενάριο (sheet)"), use_container_width=True)
 
     with st.expander("🔎 Αναλυτική προβολή ανά sheet", expanded=False):
-        for sheet in xl.sheet_names:
-            st.markdown(f"**• {sheet}**")
-            df_raw = xl.parse(sheet_name=sheet)
-            df_norm, _ = auto_rename_columns(df_raw)
-            conf_counts, conf_names = compute_conflict_counts_and_names(df_norm)
-            df_conf = pd.DataFrame({
-                "ΟΝΟΜΑ": df_norm.get("ΟΝΟΜΑ", pd.Series(dtype=str)),
-                "ΤΜΗΜΑ": df_norm.get("ΤΜΗΜΑ", pd.Series(dtype=str)),
-                "ΣΥΓΚΡΟΥΣΗ": conf_counts.astype(int),
-                "ΣΥΓΚΡΟΥΣΗ_ΟΝΟΜΑ": conf_names,
-            })
-            df_conf = df_conf[df_conf["ΣΥΓΚΡΟΥΣΗ"] > 0].sort_values(["ΤΜΗΜΑ","ΟΝΟΜΑ"])
-            st.dataframe(df_conf, use_container_width=True)
-
-    st.download_button(
-        "⬇️ Κατέβασε αναφορά «Μαθητές με σύγκρουση στην ίδια τάξη» (όλα τα sheets)",
-        data=build_conflict_in_same_class_report(xl).getvalue(),
-        file_name=f"conflict_in_same_class_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        detail = detail_sheet("details::conflicts")
+        if detail is not None:
+            df_conf = conflicts_in_same_class(wb.norm[detail], wb.analysis(detail))
+            paged_dataframe(df_conf, key=f"details::page::{wb.digest}::{detail}::conflicts")
+
+    lazy_download_button(
+        f"⬇️ Κατέβασε αναφορά «Μαθητές με σύγκρουση στην ίδια τάξη» (όλα τα sheets, {FORMAT_LABELS[export_format]})",
+        (lambda: build_conflict_in_same_class_report(wb)) if export_format == "xlsx"
+        else (lambda fmt=export_format: export_table(conflicts_table(wb), fmt)),
+        cache_key=("conflict_report", wb.digest, export_format),
+        file_name=f"conflict_in_same_class_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+        mime=EXPORT_MIME[export_format],
+        ready=not wb.pending,
         type="primary"
     )
 
+# ===========================
+# 🏆 Σύγκριση & κατάταξη σεναρίων (όλα τα sheets)
+# ===========================
+
+with tab_compare:
+    st.subheader("🏆 Σύγκριση & κατάταξη σεναρίων")
+    st.caption("Σκορ = Σ βάρος × μετρική (μικρότερο = καλύτερο). «Δ» = διαφορά μέγιστου − ελάχιστου ανά τμήμα.")
+
+    with st.expander("⚖️ Βάρη σκορ", expanded=False):
+        weight_cols = st.columns(3)
+        weights = {
+            m: weight_cols[i % 3].number_input(m, min_value=0.0, value=float(DEFAULT_SCORE_WEIGHTS.get(m, 0.0)),
+                                               step=0.5, key=f"compare::w::{m}")
+            for i, m in enumerate(SCENARIO_METRICS)
+        }
+    top_k = st.number_input("Top-K σενάρια", min_value=1, max_value=len(wb.sheet_names),
+                            value=min(SCENARIO_TOP_K, len(wb.sheet_names)), step=1, key="compare::top_k")
+
+    ranked = rank_scenarios(scenario_metrics(wb), weights)
+    st.dataframe(ranked.head(int(top_k)), use_container_width=True)
+    with st.expander("📋 Όλα τα σενάρια", expanded=False):
+        st.dataframe(ranked, use_container_width=True)
+
+    lazy_download_button(
+        "⬇️ Κατέβασε κατάταξη σεναρίων (+ στατιστικά των Top-K)",
+        lambda: build_comparison_report(wb, weights=weights, top_k=int(top_k)),
+        cache_key=("comparison", wb.digest, int(top_k), tuple(weights.values())),
+        file_name=f"scenario_ranking_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        ready=not wb.pending,
+        type="primary"
+    )
+
+    # 📦 Πακέτο πινάκων για άλλα εργαλεία: στατιστικά, σπασμένα ζεύγη, μαθητές, σύνοψη (ένα αρχείο ο καθένας)
+    bundle_format = TABLE_FORMATS[0]
+    lazy_download_button(
+        f"📦 Κατέβασε πακέτο πινάκων (zip με {FORMAT_LABELS[bundle_format]}: στατιστικά, σπασμένα ζεύγη, μαθητές, σύνοψη)",
+        lambda: build_table_bundle(wb, fmt=bundle_format),
+        cache_key=("bundle", wb.digest, bundle_format),
+        file_name=f"tables_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+        mime=EXPORT_MIME["zip"],
+        ready=not wb.pending,
+    )
+
+# ===========================
+# ⏱️ Profiling (μόνο όταν είναι ενεργό)
+# ===========================
+
+if session_profiler is not None:
+    with st.expander("⏱️ Profiling — χρόνος/μνήμη ανά στάδιο", expanded=False):
+        if not session_profiler.records:
+            st.info("— Δεν έχουν καταγραφεί στάδια ακόμη —")
+        else:
+            st.markdown("**Ανά στάδιο** (ίδιος χρόνος = χωρίς τα εμφωλευμένα στάδια)")
+            st.dataframe(session_profiler.summary(), use_container_width=True)
+            st.markdown("**Ανά sheet** (ίδιος χρόνος σε δευτερόλεπτα)")
+            st.dataframe(session_profiler.by_sheet(), use_container_width=True)
+            st.download_button(
+                "⬇️ Κατέβασε τους χρόνους (JSON)",
+                data=session_profiler.to_json(),
+                file_name=f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json",
+            )
+
+# Το κοινό `WorkbookData` γεμίζει lazily (αναλύσεις, σενάρια, αναφορές στο παρασκήνιο): το μέγεθός του στο
+# `RESULT_STORE` ξαναμετριέται όταν μεγαλώσει, ώστε το όριο μνήμης να ισχύει για ό,τι κρατιέται πραγματικά.
+_fill_state = wb.fill_state()
+if not wb.pending and st.session_state.get("store::workbook_fill") != (wb.digest, _fill_state):
+    RESULT_STORE.resize(workbook_key(wb.digest, profile_enabled, int(fuzzy_distance)))
+    st.session_state["store::workbook_fill"] = (wb.digest, _fill_state)
+
+watch_jobs()
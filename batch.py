@@ -0,0 +1,170 @@
+"""Headless batch: οι αναφορές των tabs για πολλά αρχεία Excel, χωρίς Streamlit.
+
+    python batch.py scenarios/ -o reports/
+    python batch.py "schools/**/*.xlsx" -o reports/ --jobs 4
+
+Για κάθε αρχείο γράφονται (στο `--out`):
+  <όνομα>_statistika.xlsx              — στατιστικά ανά τμήμα, ένα φύλλο ανά sheet/σενάριο
+  <όνομα>_broken_friends_report.xlsx   — πλήρες αντίγραφο + *_BROKEN + Σύνοψη
+  <όνομα>_conflict_in_same_class.xlsx  — μαθητές με σύγκρουση στην ίδια τάξη + SUMMARY
+  <όνομα>_scenario_ranking.xlsx        — κατάταξη σεναρίων (σύνθετο σκορ) + στατιστικά των Top-K
+  <όνομα>_name_resolution.xlsx         — δηλώσεις ονομάτων που διορθώθηκαν / είναι ασαφείς / δεν βρέθηκαν
+
+Με `--format parquet|csv` κάθε αναφορά γράφεται ως ένας πίνακας (όλα τα sheets, στήλη ΣΕΝΑΡΙΟ) αντί για
+Excel· με `--bundle` γράφεται και <όνομα>_tables.zip (stats, broken_pairs, students, summary σε parquet),
+για εργαλεία που διαβάζουν πολλά αρχεία χωρίς να ανοίγουν xlsx.
+
+Με `--profile` γράφεται και <όνομα>_profile.json (χρόνος/μνήμη ανά στάδιο και sheet). Με `--disk-cache` τα
+αποτελέσματα ανά sheet κρατιούνται στο δίσκο (SIMPLE100_CACHE_DIR), ώστε μια νέα εκτέλεση να μην ξαναδιαβάζει
+τα ίδια αρχεία.
+
+Τα αρχεία επεξεργάζονται ένα-ένα (ή `--jobs` ταυτόχρονα, ένα ανά process): κάθε workbook
+απελευθερώνεται μόλις γραφτούν οι αναφορές του, οπότε η μνήμη δεν αυξάνεται με το πλήθος αρχείων.
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from contextlib import nullcontext
+
+from analysis import (
+    ENGINES, DEFAULT_ENGINE, DEFAULT_DISK_CACHE, DISK_CACHE_AVAILABLE, DiskCache, Profiler, profiling, read_workbook,
+    build_stats_report, build_broken_report, build_conflict_in_same_class_report, build_comparison_report,
+    build_resolution_report, FUZZY_MAX_DISTANCE, EXPORT_FORMATS, TABLE_FORMATS, export_table, stats_table,
+    broken_pairs_table, conflicts_table, summary_table, resolution_table, build_table_bundle,
+)
+
+REPORTS = {
+    "stats": ("statistika", build_stats_report),
+    "broken": ("broken_friends_report", build_broken_report),
+    "conflicts": ("conflict_in_same_class", build_conflict_in_same_class_report),
+    "ranking": ("scenario_ranking", build_comparison_report),
+    "names": ("name_resolution", build_resolution_report),
+}
+# Οι ίδιες αναφορές ως ένας πίνακας (--format parquet/csv)
+REPORT_TABLES = {
+    "stats": stats_table,
+    "broken": broken_pairs_table,
+    "conflicts": conflicts_table,
+    "ranking": summary_table,
+    "names": resolution_table,
+}
+EXCEL_EXTS = (".xlsx", ".xls")
+
+
+def iter_workbooks(inputs):
+    """Αρχεία Excel από φακέλους, globs ή μονοπάτια — με σειρά, χωρίς διπλότυπα και χωρίς lock files (~$)."""
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = sorted(p for p in (os.path.join(item, f) for f in os.listdir(item)) if os.path.isfile(p))
+        else:
+            paths = sorted(glob.glob(item, recursive=True)) or [item]
+        for path in paths:
+            name = os.path.basename(path)
+            if path in seen or name.startswith("~$") or not name.lower().endswith(EXCEL_EXTS):
+                continue
+            seen.add(path)
+            yield path
+
+
+def process_workbook(path: str, out_dir: str, reports=tuple(REPORTS), sheet_workers: int = 1,
+                     engine: str = DEFAULT_ENGINE, profile: bool = False, disk_cache: bool = False,
+                     fuzzy: int = FUZZY_MAX_DISTANCE, fmt: str = "xlsx", bundle: bool = False) -> dict:
+    """Διαβάζει ένα αρχείο, γράφει τις ζητούμενες αναφορές και επιστρέφει σύνοψη (όχι τα δεδομένα)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    outputs = []
+    with profiling(Profiler()) if profile else nullcontext() as profiler:
+        with open(path, "rb") as f:
+            wb_data = read_workbook(f.read(), 1 if profile else sheet_workers, engine=engine,
+                                    cache=DiskCache() if disk_cache else None, fuzzy=fuzzy)
+        for key in reports:
+            suffix, build = REPORTS[key]
+            out_path = os.path.join(out_dir, f"{stem}_{suffix}.{fmt}")
+            if fmt == "xlsx":
+                build(wb_data, out_path)
+            else:
+                export_table(REPORT_TABLES[key](wb_data), fmt, out_path)
+            outputs.append(out_path)
+        if bundle:
+            out_path = os.path.join(out_dir, f"{stem}_tables.zip")
+            build_table_bundle(wb_data, out_path, fmt if fmt in TABLE_FORMATS else TABLE_FORMATS[0])
+            outputs.append(out_path)
+    if profiler is not None:
+        out_path = os.path.join(out_dir, f"{stem}_profile.json")
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(profiler.to_json())
+        outputs.append(out_path)
+    return {"file": path, "sheets": len(wb_data.sheet_names), "outputs": outputs}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Στατιστικά / σπασμένες φιλίες / συγκρούσεις / κατάταξη σεναρίων για πολλά αρχεία Excel.")
+    parser.add_argument("inputs", nargs="+", help="φάκελοι, αρχεία ή glob patterns (π.χ. 'schools/**/*.xlsx')")
+    parser.add_argument("-o", "--out", required=True, help="φάκελος εξόδου")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="αρχεία ταυτόχρονα (processes), default 1")
+    parser.add_argument("--sheet-workers", type=int, default=1, help="workers ανά αρχείο για τα sheets (μόνο με --jobs 1)")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE, help="μηχανή ανάλυσης (ίδια αποτελέσματα)")
+    parser.add_argument("--reports", default=",".join(REPORTS),
+                        help=f"ποιες αναφορές, comma-separated από: {', '.join(REPORTS)}")
+    parser.add_argument("--profile", action="store_true",
+                        help="γράφει και <όνομα>_profile.json με χρόνο/μνήμη ανά στάδιο (τα sheets σειριακά)")
+    parser.add_argument("--disk-cache", action=argparse.BooleanOptionalAction, default=DEFAULT_DISK_CACHE,
+                        help="μόνιμη cache αποτελεσμάτων στο δίσκο (SIMPLE100_CACHE_DIR)")
+    parser.add_argument("--fuzzy", type=int, default=FUZZY_MAX_DISTANCE,
+                        help="ανοχή ορθογραφικών λαθών στα ονόματα (διορθώσεις ανά λέξη, 0 = μόνο ακριβή)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="xlsx",
+                        help="μορφή αναφορών: xlsx ή ένας πίνακας ανά αναφορά (parquet/csv, στήλη ΣΕΝΑΡΙΟ)")
+    parser.add_argument("--bundle", action="store_true",
+                        help="γράφει και <όνομα>_tables.zip με τους πίνακες stats/broken_pairs/students/summary")
+    args = parser.parse_args(argv)
+
+    reports = tuple(r.strip() for r in args.reports.split(",") if r.strip())
+    unknown = [r for r in reports if r not in REPORTS]
+    if unknown:
+        parser.error(f"άγνωστες αναφορές: {', '.join(unknown)}")
+    if args.disk_cache and not DISK_CACHE_AVAILABLE:
+        parser.error("η --disk-cache χρειάζεται το πακέτο pyarrow")
+    os.makedirs(args.out, exist_ok=True)
+
+    failures = 0
+    def report(result):
+        print(f"✅ {result['file']} — {result['sheets']} sheet(s) → {len(result['outputs'])} αναφορές")
+
+    if args.jobs <= 1:
+        for path in iter_workbooks(args.inputs):
+            try:
+                report(process_workbook(path, args.out, reports, args.sheet_workers, args.engine, args.profile,
+                                        args.disk_cache, args.fuzzy, args.format, args.bundle))
+            except Exception as e:
+                failures += 1
+                print(f"❌ {path}: {e}", file=sys.stderr)
+    else:
+        # Μέχρι 2×jobs αρχεία σε αναμονή κάθε στιγμή — η λίστα αρχείων διαβάζεται σταδιακά.
+        with ProcessPoolExecutor(args.jobs) as pool:
+            pending = {}
+            paths = iter_workbooks(args.inputs)
+            for path in paths:
+                pending[pool.submit(process_workbook, path, args.out, reports, 1, args.engine, args.profile,
+                                      args.disk_cache, args.fuzzy, args.format, args.bundle)] = path
+                if len(pending) >= 2 * args.jobs:
+                    done = next(as_completed(pending))
+                    failures += _collect(done, pending.pop(done), report)
+            for done in as_completed(pending):
+                failures += _collect(done, pending[done], report)
+    return 1 if failures else 0
+
+
+def _collect(future, path, report) -> int:
+    try:
+        report(future.result())
+        return 0
+    except Exception as e:
+        print(f"❌ {path}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
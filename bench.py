@@ -0,0 +1,356 @@
+"""Benchmarks: χρόνος και μέγιστη μνήμη κάθε σταδίου της ανάλυσης πάνω σε συνθετικά (seeded) αρχεία Excel.
+
+    python bench.py                      # presets small + medium, σύγκριση με το bench_baseline.json
+    python bench.py --preset large
+    python bench.py --students 500 --sheets 12 --density 4 --seed 3
+    python bench.py --save               # νέο baseline (π.χ. μετά από σκόπιμη αλλαγή ή σε άλλο μηχάνημα)
+
+Ο generator φτιάχνει ρεαλιστικά ελληνικά rosters: ονόματα με/χωρίς τόνους, μερικά ονόματα (μόνο επώνυμο,
+αντίστροφη σειρά), λίστες φίλων ως `[...]` ή με `,` `;` `και` `/`, άγνωστα ονόματα και δηλωμένες συγκρούσεις.
+Κάθε sheet είναι το ίδιο roster με άλλη κατανομή σε τμήματα (όπως τα σενάρια).
+
+Για κάθε στάδιο: καλύτερος χρόνος από `--repeat` εκτελέσεις (cold caches), μέγιστη μνήμη (tracemalloc, ξεχωριστή
+εκτέλεση) και αποτύπωμα αποτελέσματος. Exit code 1 αν κάποιο στάδιο είναι πιο αργό/βαρύ από το baseline πέρα
+από την ανοχή ή αν άλλαξε το αποτέλεσμά του. Οι χρόνοι του baseline ισχύουν για το μηχάνημα που τους έγραψε.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+import analysis
+from analysis import (
+    WhatIf, auto_rename_columns, parse_name_column, list_broken_mutual_pairs, compute_conflict_counts_and_names,
+    generate_stats, open_excel, read_sheet, read_workbook, build_stats_report, build_broken_report,
+    build_conflict_in_same_class_report, clear_caches, optimize_classes, DiskCache, DISK_CACHE_AVAILABLE,
+    JobRunner, WorkbookJob, build_table_bundle,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+PRESETS = {
+    "small": dict(students=120, sheets=3, density=3.0),
+    "medium": dict(students=350, sheets=10, density=3.0),
+    "large": dict(students=1000, sheets=20, density=4.0),
+}
+DEFAULT_PRESETS = ("small", "medium")
+
+# Κάτω από αυτά τα όρια οι διαφορές θεωρούνται θόρυβος.
+MIN_SECONDS_DELTA = 0.005
+MIN_MB_DELTA = 0.5
+
+# ---------------------------
+# Synthetic rosters
+# ---------------------------
+
+FIRST_M = ["Γιώργος", "Νίκος", "Δημήτρης", "Κωνσταντίνος", "Ιωάννης", "Παναγιώτης", "Χρήστος", "Ανδρέας",
+           "Μιχάλης", "Σάββας", "Λάμπρος", "Στέλιος", "Ευάγγελος", "Θεόδωρος", "Αλέξανδρος", "Μάριος"]
+FIRST_F = ["Μαρία", "Ελένη", "Αικατερίνη", "Σοφία", "Άννα", "Χριστίνα", "Ευαγγελία", "Δέσποινα",
+           "Γεωργία", "Παναγιώτα", "Ραφαέλα", "Στέλλα", "Ιωάννα", "Θεοδώρα", "Κυριακή", "Μυρτώ"]
+SURNAMES = ["Παπαδόπουλος", "Γεωργίου", "Ιωάννου", "Κωνσταντίνου", "Χαραλάμπους", "Νικολάου", "Δημητρίου",
+            "Αντωνίου", "Χριστοδούλου", "Σάββα", "Μιχαήλ", "Παναγιώτου", "Λοΐζου", "Θεοδώρου", "Ευαγγέλου",
+            "Κυριάκου", "Αθανασίου", "Στυλιανού", "Ανδρέου", "Πέτρου", "Σολομώντος", "Φιλίππου"]
+# Τίτλοι όπως στα αρχεία των σχολείων (με κενά αντί για _ και «ΣΥΓΚΡΟΥΣΕΙΣ»).
+HEADERS = {
+    "ΟΝΟΜΑ": "ΟΝΟΜΑ", "ΦΥΛΟ": "ΦΥΛΟ", "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ": "ΠΑΙΔΙ ΕΚΠΑΙΔΕΥΤΙΚΟΥ", "ΖΩΗΡΟΣ": "ΖΩΗΡΟΣ",
+    "ΙΔΙΑΙΤΕΡΟΤΗΤΑ": "ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ": "ΚΑΛΗ ΓΝΩΣΗ ΕΛΛΗΝΙΚΩΝ", "ΦΙΛΟΙ": "ΦΙΛΟΙ",
+    "ΣΥΓΚΡΟΥΣΗ": "ΣΥΓΚΡΟΥΣΕΙΣ", "ΤΜΗΜΑ": "ΤΜΗΜΑ",
+}
+_YES = ["Ν", "Ν", "ΝΑΙ", "Ναι", "Y"]
+_NO = ["Ο", "Ο", "ΟΧΙ", ""]
+
+
+def make_names(rng: random.Random, n: int) -> list:
+    """(όνομα, φύλο) για n μοναδικούς μαθητές· όταν τελειώσουν οι συνδυασμοί μπαίνει δεύτερο επώνυμο."""
+    names, seen = [], set()
+    while len(names) < n:
+        gender = rng.choice("ΑΚ")
+        first = rng.choice(FIRST_M if gender == "Α" else FIRST_F)
+        full = f"{first} {rng.choice(SURNAMES)}"
+        if full in seen:
+            full = f"{full}-{rng.choice(SURNAMES)}"
+        if full not in seen:
+            seen.add(full)
+            names.append((full, gender))
+    return names
+
+
+def _mention(rng: random.Random, full: str) -> str:
+    """Πώς γράφει ο εκπαιδευτικός ένα όνομα: ακριβώς, χωρίς τόνους, κεφαλαία, μόνο επώνυμο, ανάποδα…"""
+    first, _, last = full.partition(" ")
+    variant = rng.random()
+    if variant < 0.45:
+        return full
+    if variant < 0.60:
+        return analysis._strip_diacritics(full)
+    if variant < 0.70:
+        return full.upper()
+    if variant < 0.80:
+        return last
+    if variant < 0.90:
+        return f"{last} {first}"
+    return f"  {full.lower()} "
+
+
+def _name_list(rng: random.Random, names: list) -> str:
+    if not names:
+        return rng.choice(["", "", "-"])
+    fmt = rng.random()
+    if fmt < 0.15:
+        return repr(names)
+    if fmt < 0.25:
+        return "[" + "; ".join(names) + "]"
+    sep = rng.choice([", ", ", ", "; ", " και ", " / "])
+    return sep.join(names)
+
+
+def make_roster(seed: int = 0, students: int = 350, density: float = 3.0, conflict_rate: float = 0.08,
+                mutual_rate: float = 0.6, unknown_rate: float = 0.03, helper_cols: int = 2) -> pd.DataFrame:
+    """Ένα roster (χωρίς τμήματα) με τους τίτλους στηλών όπως στα πραγματικά αρχεία (πριν το `auto_rename_columns`)."""
+    rng = random.Random(seed)
+    roster = make_names(rng, students)
+    full = [nm for nm, _ in roster]
+    friends = [set() for _ in range(students)]
+    for i in range(students):
+        k = min(students - 1, max(0, round(rng.gauss(density, 1.0))))
+        for j in rng.sample(range(students), k):
+            if j != i:
+                friends[i].add(j)
+                if rng.random() < mutual_rate:
+                    friends[j].add(i)
+    rows = []
+    for i, (name, gender) in enumerate(roster):
+        mentions = [_mention(rng, full[j]) for j in sorted(friends[i])]
+        if rng.random() < unknown_rate:
+            mentions.append(f"{rng.choice(FIRST_M + FIRST_F)} Άγνωστος")
+        conflicts = []
+        if rng.random() < conflict_rate:
+            conflicts = [_mention(rng, full[j]) for j in rng.sample(range(students), rng.choice([1, 1, 2])) if j != i]
+        row = {
+            HEADERS["ΟΝΟΜΑ"]: name,
+            HEADERS["ΦΥΛΟ"]: gender if rng.random() > 0.05 else gender.lower(),
+            HEADERS["ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ"]: rng.choice(_YES) if rng.random() < 0.05 else rng.choice(_NO),
+            HEADERS["ΖΩΗΡΟΣ"]: rng.choice(_YES) if rng.random() < 0.15 else rng.choice(_NO),
+            HEADERS["ΙΔΙΑΙΤΕΡΟΤΗΤΑ"]: rng.choice(_YES) if rng.random() < 0.08 else rng.choice(_NO),
+            HEADERS["ΚΑΛΗ_ΓΝΩΣΗ_ΕΛΛΗΝΙΚΩΝ"]: rng.choice(_YES) if rng.random() < 0.85 else rng.choice(_NO),
+            HEADERS["ΦΙΛΟΙ"]: _name_list(rng, mentions),
+            HEADERS["ΣΥΓΚΡΟΥΣΗ"]: _name_list(rng, conflicts) if conflicts else "",
+        }
+        for h in range(helper_cols):
+            row[f"ΒΟΗΘΗΤΙΚΟ_{h + 1}"] = rng.randint(0, 99)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def make_workbook(seed: int = 0, students: int = 350, sheets: int = 10, class_size: int = 25, **roster_kwargs) -> bytes:
+    """Αρχείο Excel (bytes) με `sheets` σενάρια του ίδιου roster — κάθε σενάριο με άλλη τυχαία κατανομή σε τμήματα."""
+    rng = random.Random(seed + 1)
+    roster = make_roster(seed, students, **roster_kwargs)
+    n_classes = max(2, -(-students // class_size))
+    classes = [f"Α{(i % n_classes) + 1}" for i in range(students)]
+    bio = BytesIO()
+    with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
+        for s in range(sheets):
+            rng.shuffle(classes)
+            df = roster.copy()
+            df.insert(len(HEADERS) - 1, HEADERS["ΤΜΗΜΑ"], classes)
+            df.to_excel(writer, index=False, sheet_name=f"ΣΕΝΑΡΙΟ_{s + 1}")
+    return bio.getvalue()
+
+# ---------------------------
+# Stages
+# ---------------------------
+
+def _fingerprint(value) -> str:
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()[:12]
+
+
+def _frames_summary(frames) -> tuple:
+    return tuple((len(df), tuple(map(str, df.columns)), int(df.select_dtypes("number").to_numpy().sum())) for df in frames)
+
+
+def build_stages(data: bytes, seed: int = 0, cache_dir: str = None) -> list:
+    """[(όνομα σταδίου, fn)] — κάθε fn εκτελεί το στάδιο για όλα τα sheets και επιστρέφει κάτι για αποτύπωμα.
+
+    Με `cache_dir` (και pyarrow) μετριέται και η ανάγνωση από ζεστή `DiskCache` σε αυτόν τον φάκελο.
+    """
+    xl = open_excel(data)
+    sheet_names = xl.sheet_names
+    raws = [read_sheet(xl, s, data)[0] for s in sheet_names]
+    norms = [auto_rename_columns(df)[0] for df in raws]
+    # παλιά πρότυπα: φίλοι σε αριθμημένη στήλη, τμήμα χωρίς τίτλο ΤΜΗΜΑ → fallbacks του `auto_rename_columns`
+    legacy = [df.rename(columns={"ΦΙΛΟΙ": "ΦΙΛΟΙ 1", "ΤΜΗΜΑ": "Τάξη"}) for df in raws]
+    friend_cols = [df["ΦΙΛΟΙ"] for df in norms]
+    wb = read_workbook(data)
+    for s in sheet_names:
+        wb.analysis(s).compute()
+
+    def reports(build):
+        def run():
+            with build(wb) as f:
+                return len(f.read()) > 0
+        return run
+
+    def end_to_end(engine):
+        def run():
+            wb_ = read_workbook(data, engine=engine)
+            return [len(wb_.analysis(s).broken_pairs) for s in sheet_names]
+        return run
+
+    def whatif_moves():
+        rng = random.Random(seed)
+        wi = WhatIf(analysis.analyze_sheet(norms[0]))
+        names, classes = sorted(wi.rows_of), sorted(set(wi.class_by_name.values()))
+        for _ in range(1000):
+            wi.move(rng.choice(names), rng.choice(classes))
+        return len(wi.broken), int(wi.stats().to_numpy().sum())
+
+    def disk_cache_warm():
+        wb_ = read_workbook(data, cache=DiskCache(cache_dir))
+        return [len(wb_.analysis(s).broken_pairs) for s in sheet_names]
+
+    def first_sheet():
+        # ό,τι περιμένει ο χρήστης μέχρι να δει το πρώτο sheet (η εργασία ακυρώνεται μετά)
+        runner = JobRunner(1)
+        job = WorkbookJob(data)
+        future = runner.submit("workbook", job.run, cancel=job.cancel)
+        while not job.results and not job.finished:
+            time.sleep(0.001)
+        runner.cancel_all()
+        future.exception()
+        return job.snapshot().sheet_names[:1]
+
+    def optimize():
+        result = optimize_classes(analysis.analyze_sheet(norms[0]), time_budget=float("inf"), seed=seed, max_iter=2000)
+        return result.after, len(result.whatif.moves)
+
+    stages = [
+        ("excel_read", lambda: _frames_summary(read_sheet(open_excel(data), s, data)[0] for s in sheet_names)),
+        ("auto_rename_columns", lambda: [tuple(auto_rename_columns(df)[0].columns) for df in raws]),
+        ("auto_rename_columns[legacy]", lambda: [tuple(auto_rename_columns(df)[0].columns) for df in legacy]),
+        ("parse_name_column", lambda: sum(len(parse_name_column(col)) for col in friend_cols)),
+        ("list_broken_mutual_pairs", lambda: [len(list_broken_mutual_pairs(df)) for df in norms]),
+        ("compute_conflict_counts_and_names", lambda: [int(compute_conflict_counts_and_names(df)[0].sum()) for df in norms]),
+        ("generate_stats", lambda: _frames_summary(generate_stats(df) for df in norms)),
+        ("read_workbook[python]", end_to_end("python")),
+        ("read_workbook[sparse]", end_to_end("sparse")),
+        ("workbook_job[first_sheet]", first_sheet),
+        ("build_stats_report", reports(build_stats_report)),
+        ("build_broken_report", reports(build_broken_report)),
+        ("build_conflict_in_same_class_report", reports(build_conflict_in_same_class_report)),
+        ("build_table_bundle", reports(build_table_bundle)),
+        ("whatif_1000_moves", whatif_moves),
+        ("optimize_2000_iters", optimize),
+    ]
+    if cache_dir and DISK_CACHE_AVAILABLE:
+        read_workbook(data, cache=DiskCache(cache_dir))  # γεμίζει μία φορά πριν από τις μετρήσεις
+        stages.append(("read_workbook[disk_cache_warm]", disk_cache_warm))
+    return stages
+
+
+def measure(fn, repeat: int = 3) -> dict:
+    """Καλύτερος χρόνος από `repeat` εκτελέσεις και μέγιστη μνήμη (tracemalloc) μιας επιπλέον — όλες με cold caches."""
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        clear_caches()
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    clear_caches()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(best, 4), "peak_mb": round(peak / 2**20, 2), "fingerprint": _fingerprint(result)}
+
+
+def compare(current: dict, base: dict, tolerance: float, mem_tolerance: float) -> list:
+    """Λόγοι αποτυχίας του σταδίου σε σχέση με το baseline (κενή λίστα → ΟΚ)."""
+    problems = []
+    if current["fingerprint"] != base["fingerprint"]:
+        problems.append("άλλαξε το αποτέλεσμα")
+    if current["seconds"] > base["seconds"] * (1 + tolerance) and current["seconds"] - base["seconds"] > MIN_SECONDS_DELTA:
+        problems.append(f"χρόνος {current['seconds']:.3f}s > {base['seconds']:.3f}s")
+    if current["peak_mb"] > base["peak_mb"] * (1 + mem_tolerance) and current["peak_mb"] - base["peak_mb"] > MIN_MB_DELTA:
+        problems.append(f"μνήμη {current['peak_mb']:.1f}MB > {base['peak_mb']:.1f}MB")
+    return problems
+
+
+def run_preset(name: str, params: dict, repeat: int, stages=None) -> dict:
+    t0 = time.perf_counter()
+    data = make_workbook(**params)
+    print(f"\n▶ {name}: {params} — αρχείο {len(data) / 2**10:.0f} KB σε {time.perf_counter() - t0:.1f}s")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="simple100-bench-") as cache_dir:
+        for stage, fn in build_stages(data, params.get("seed", 0), cache_dir):
+            if stages and stage not in stages:
+                continue
+            results[stage] = measure(fn, repeat)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks ανάλυσης πάνω σε συνθετικά αρχεία Excel.")
+    parser.add_argument("--preset", action="append", choices=sorted(PRESETS),
+                        help=f"μέγεθος (επαναλαμβάνεται), default: {', '.join(DEFAULT_PRESETS)}")
+    parser.add_argument("--students", type=int, help="μαθητές ανά sheet (αντί για preset)")
+    parser.add_argument("--sheets", type=int, help="sheets (σενάρια) ανά αρχείο")
+    parser.add_argument("--density", type=float, help="μέσος αριθμός δηλωμένων φίλων ανά μαθητή")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="εκτελέσεις ανά στάδιο (κρατιέται η καλύτερη)")
+    parser.add_argument("--stage", action="append", help="μόνο αυτά τα στάδια (επαναλαμβάνεται)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="γράψε τα αποτελέσματα ως νέο baseline")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="ανοχή χρόνου (0.30 = +30%%)")
+    parser.add_argument("--mem-tolerance", type=float, default=0.20, help="ανοχή μνήμης (0.20 = +20%%)")
+    args = parser.parse_args(argv)
+
+    custom = {k: v for k, v in (("students", args.students), ("sheets", args.sheets), ("density", args.density)) if v is not None}
+    if custom:
+        presets = {"custom": {**PRESETS["medium"], **custom}}
+    else:
+        presets = {name: PRESETS[name] for name in (args.preset or DEFAULT_PRESETS)}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("presets", {})
+
+    failures, saved = 0, dict(baseline)
+    for name, params in presets.items():
+        params = {**params, "seed": args.seed}
+        results = run_preset(name, params, args.repeat, args.stage)
+        base = baseline.get(name, {})
+        base_stages = base.get("stages", {}) if base.get("params") == params else {}
+        print(f"{'στάδιο':<38}{'χρόνος':>10}{'μνήμη':>10}{'baseline':>12}  αποτέλεσμα")
+        for stage, cur in results.items():
+            ref = base_stages.get(stage)
+            problems = compare(cur, ref, args.tolerance, args.mem_tolerance) if ref else []
+            status = "—" if ref is None else ("❌ " + "; ".join(problems) if problems else "✅")
+            ref_txt = f"{ref['seconds']:.3f}s" if ref else "—"
+            print(f"{stage:<38}{cur['seconds']:>9.3f}s{cur['peak_mb']:>8.1f}MB{ref_txt:>12}  {status}")
+            failures += bool(problems)
+        saved[name] = {"params": params, "stages": {**base_stages, **results} if args.stage else results}
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "presets": saved}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\n💾 baseline → {args.baseline}")
+        return 0
+    if failures:
+        print(f"\n❌ {failures} στάδιο(-α) με regression", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from analysis import WhatIf, analyze_sheet, generate_stats, optimize_classes, optimized_raw_sheet
+
+
+def _roster_with_missing_class():
+    return pd.DataFrame({
+        "ΟΝΟΜΑ": ["Α Α", "Β Β", "Γ Γ", "Δ Δ"],
+        "ΦΥΛΟ": ["Α", "Κ", "Κ", "Α"],
+        "ΤΜΗΜΑ": ["Α1", None, "Α2", "Α2"],
+        "ΦΙΛΟΙ": ["Β Β, Γ Γ", "Α Α, Δ Δ", "Α Α", "Β Β"],
+        "ΣΥΓΚΡΟΥΣΗ": ["", "", "Δ Δ", ""],
+    })
+
+
+def test_optimize_keeps_students_without_class_in_place():
+    df = _roster_with_missing_class()
+    for seed in range(5):
+        result = optimize_classes(analyze_sheet(df), time_budget=float("inf"), max_iter=500, seed=seed)
+        wi = result.whatif
+        assert wi.row_classes[1] is None
+        assert all(name != "Β Β" and new in {"Α1", "Α2"} for name, _, new, _ in wi.moves)
+        out = optimized_raw_sheet(df, {}, wi)
+        assert out["ΤΜΗΜΑ"].isna().tolist() == [False, True, False, False]
+        assert set(out["ΤΜΗΜΑ"].dropna()) <= {"Α1", "Α2"}
+
+
+def test_whatif_stats_match_generate_stats_with_missing_class():
+    df = _roster_with_missing_class()
+    analysis = analyze_sheet(df)
+    wi = WhatIf(analysis)
+    pd.testing.assert_frame_equal(wi.stats(), generate_stats(df, analysis), check_index_type=False)
+    assert wi.class_options() == ["Α1", "Α2"]
+
+    wi.move("Β Β", "Α1")
+    moved = wi.moved_df()
+    pd.testing.assert_frame_equal(wi.stats(), generate_stats(moved, analyze_sheet(moved)), check_index_type=False)
+    wi.undo()
+    assert wi.row_classes[1] is None
+    assert int(wi.stats()["ΣΥΝΟΛΟ ΜΑΘΗΤΩΝ"].sum()) == int(np.sum(df["ΤΜΗΜΑ"].notna()))